@@ -0,0 +1,7 @@
+"""
+Entry point of python -m src.bench: the end-to-end extraction benchmark,
+see src.bench.bench_end_to_end.
+"""
+from src.bench.bench_end_to_end import main
+
+main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the DONUT CPU inference profile (int8 decoder, tuned threads,
+optionally traced encoder) against the default fp32 path, on the images of
+a directory such as data/synthetic_forms.
+
+    python -m src.bench.bench_donut_cpu ./data/models/donut_trained/20231002_095949 data/synthetic_forms
+
+Field-level accuracy is measured against the ground truth of a
+metadata.jsonl file written by AnnotatorJsonDonut when there is one in the
+directory, and the agreement between both paths is always reported.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+import src.testing_donut as donut
+from src.bench.corpus import compute_field_accuracy, read_ground_truths
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+
+def run_profile(model_path: str, images: List[Image.Image], cpu_profile: bool, trace_encoder: bool, batch_size: int):
+    """Load the model with the given profile and return its latencies and predictions."""
+    t0 = time.perf_counter()
+    model, prompt = donut.load_model(model_path, cpu_profile=False)
+    if cpu_profile:
+        model = donut.apply_cpu_inference_profile(model, trace_encoder=trace_encoder)
+    load_time = time.perf_counter() - t0
+
+    latencies, predictions = [], []
+    for batch_start in range(0, len(images), batch_size):
+        batch_images = images[batch_start:batch_start + batch_size]
+        t0 = time.perf_counter()
+        predictions.extend(donut.run_model_on_images(model, prompt, batch_images))
+        latencies.extend([(time.perf_counter() - t0) / len(batch_images)] * len(batch_images))
+    return load_time, latencies, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DONUT CPU inference profile benchmark")
+    parser.add_argument("model_path")
+    parser.add_argument("images_dir_path", nargs="?", default="data/synthetic_forms")
+    parser.add_argument("--batch_size", default=1, type=int)
+    parser.add_argument("--trace_encoder", action="store_true")
+    parser.add_argument("--limit", default=None, type=int)
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        path for path in glob.glob(os.path.join(args.images_dir_path, "*"))
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+    )[:args.limit]
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+    ground_truths = read_ground_truths(args.images_dir_path)
+    references = [ground_truths.get(os.path.basename(path)) for path in image_paths]
+
+    results = {}
+    for profile_name, cpu_profile in [("fp32", False), ("cpu_profile", True)]:
+        load_time, latencies, predictions = run_profile(
+            args.model_path, images, cpu_profile, args.trace_encoder, args.batch_size
+        )
+        results[profile_name] = {
+            "load_time_in_seconds": load_time,
+            "latency_p50_in_seconds": float(np.percentile(latencies, 50)),
+            "latency_p95_in_seconds": float(np.percentile(latencies, 95)),
+            "field_accuracy": compute_field_accuracy(predictions, references),
+            "predictions": predictions,
+        }
+
+    results["cpu_profile"]["field_agreement_with_fp32"] = compute_field_accuracy(
+        results["cpu_profile"]["predictions"], results["fp32"]["predictions"]
+    )
+    for profile_results in results.values():
+        del profile_results["predictions"]
+    print(f"{len(images)} images, batch size {args.batch_size}, {donut.get_cpu_limit()} CPUs")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
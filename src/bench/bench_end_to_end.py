@@ -0,0 +1,238 @@
+"""
+End-to-end extraction benchmark: generates (once) a reproducible corpus of
+filled forms, then runs each pipeline on it at a given concurrency and
+reports throughput, latency percentiles, peak RSS and field accuracy
+against the ground truth, as JSON so that results can be compared over time.
+
+    python -m src.bench --pipelines paddleocr donut --concurrency 1 4 --output bench_results.json
+
+(python -m src.bench runs this module.)
+
+Each pipeline runs in its own process, so that its peak RSS is not
+inflated by the models of the others. Within that process, concurrency
+worker threads process the documents, each borrowing one of concurrency
+model instances. The persistent OCR cache is disabled unless --ocr_cache is
+given, so that the OCR models are actually measured.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.bench.corpus import compute_field_accuracy, generate_corpus
+import src.util.instrumentation as instrumentation
+
+PIPELINE_NAMES = ["paddleocr", "paddleocr_crops", "first_pipeline", "donut"]
+LATENCY_PERCENTILES = [50, 95, 99]
+
+
+def get_pipeline(pipeline_name: str, options: Dict) -> Tuple[Callable[[], object], Callable[[object, Dict], Dict]]:
+    """Return the model factory of a pipeline and its extraction function,
+    which reads the {field name: field value} pairs of a corpus document
+    with one model instance.
+
+    Args:
+        pipeline_name (str): One of PIPELINE_NAMES.
+        options (Dict): Parsed command line options.
+
+    Returns:
+        Tuple[Callable, Callable]: Model factory and extraction function.
+    """
+    if pipeline_name in ["paddleocr", "paddleocr_crops"]:
+        import paddleocr
+        import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+        import src.util.workspace as jobWorkspace
+
+        extraction_mode = ocrPipeline.EXTRACTION_MODE_FIELD_CROPS_STR if pipeline_name == "paddleocr_crops" \
+            else ocrPipeline.EXTRACTION_MODE_TEXT_BOXES_STR
+
+        def load_paddleocr_model():
+            return instrumentation.instrument_paddleocr_model(paddleocr.PaddleOCR(use_angle_cls=True, lang='fr'))
+
+        def extract_with_paddleocr(ocr_model, document: Dict) -> Dict:
+            with jobWorkspace.scoped_workspace(prefix_str="bench_"):
+                return ocrPipeline.extract_document(
+                    input_document_path=document["path"],
+                    configuration_files_dir_path=options["configuration_files_dir_path"],
+                    ocr_model=ocr_model,
+                    extraction_mode=extraction_mode,
+                )
+        return load_paddleocr_model, extract_with_paddleocr
+
+    if pipeline_name == "first_pipeline":
+        # first_pipeline imports its dependencies relatively to src
+        sys.path.append(str(Path(__file__).resolve().parent.parent))
+        from first_pipeline import extract_cerfa, load_doctr_model
+
+        def extract_with_first_pipeline(doctr_model, document: Dict) -> Dict:
+            return extract_cerfa(document["path"], doctr_model=doctr_model)[1]
+        return load_doctr_model, extract_with_first_pipeline
+
+    if pipeline_name == "donut":
+        import cv2
+        from PIL import Image
+        import src.testing_donut as donut
+        import src.util.utils as utils
+
+        def load_donut_model():
+            return donut.load_model(options["donut_model_path"])
+
+        def extract_with_donut(donut_model_and_prompt, document: Dict) -> Dict:
+            document_image = utils.get_image_array_from_document(document["path"])
+            image = Image.fromarray(cv2.cvtColor(document_image, cv2.COLOR_BGR2RGB))
+            return donut.run_model_on_image(*donut_model_and_prompt, image, form_number=document["form_number"])
+        return load_donut_model, extract_with_donut
+
+    raise ValueError(f"Unknown pipeline {pipeline_name}, available pipelines are {PIPELINE_NAMES}")
+
+
+def summarize_documents(latencies: List[float], predictions: List[Dict], errors: List[Optional[str]],
+                        references: List[Optional[Dict]]) -> Dict:
+    """Latency percentiles, error count and field accuracy of a set of documents."""
+    summary = {"documents_count": len(latencies), "errors_count": sum(error is not None for error in errors)}
+    for percentile in LATENCY_PERCENTILES:
+        summary[f"latency_p{percentile}_in_seconds"] = \
+            float(np.percentile(latencies, percentile)) if latencies else None
+    summary["field_accuracy"] = compute_field_accuracy(predictions, references)
+    return summary
+
+
+def run_pipeline(pipeline_name: str, documents: List[Dict], concurrency: int, options: Dict) -> Dict:
+    """Run a pipeline on the corpus documents with concurrency threads and
+    as many model instances, and return its measures. Meant to be run in a
+    process of its own.
+
+    Args:
+        pipeline_name (str): One of PIPELINE_NAMES.
+        documents (List[Dict]): Manifest entries, with the document path.
+        concurrency (int): Number of threads and of model instances.
+        options (Dict): Parsed command line options.
+
+    Returns:
+        Dict: Throughput, latency, peak RSS and field accuracy, overall
+            and per form, and the error of each failed document.
+    """
+    if not options["ocr_cache"]:
+        os.environ["FORMIABLE_OCR_CACHE_PATH"] = ""
+    from src.service.model_pool import ModelPool
+
+    model_factory, extract = get_pipeline(pipeline_name, options)
+    model_pool = ModelPool(pipeline_name, model_factory, concurrency)
+    rss_before_load = instrumentation.get_peak_rss_in_bytes()
+    t0 = time.perf_counter()
+    model_pool.warm_up()
+    load_time = time.perf_counter() - t0
+
+    def process_document(document: Dict) -> Tuple[float, Dict, Optional[str]]:
+        with model_pool.borrow() as model:
+            t0 = time.perf_counter()
+            try:
+                fields, error = extract(model, document), None
+            except Exception as exception:
+                fields, error = {}, repr(exception)
+            return time.perf_counter() - t0, fields, error
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(process_document, documents))
+    wall_time = time.perf_counter() - t0
+
+    latencies = [result[0] for result in results]
+    predictions = [result[1] for result in results]
+    errors = [result[2] for result in results]
+    references = [document["ground_truth"] for document in documents]
+    measures = {
+        "concurrency": concurrency,
+        "load_time_in_seconds": load_time,
+        "wall_time_in_seconds": wall_time,
+        "documents_per_second": len(documents) / wall_time if wall_time > 0 else None,
+        **summarize_documents(latencies, predictions, errors, references),
+        "peak_rss_before_load_in_bytes": rss_before_load,
+        "peak_rss_in_bytes": instrumentation.get_peak_rss_in_bytes(),
+        "by_form": {},
+        "errors": {document["file_name"]: error for document, error in zip(documents, errors) if error is not None},
+    }
+    for form_number in sorted({document["form_number"] for document in documents}):
+        indices = [index for index, document in enumerate(documents) if document["form_number"] == form_number]
+        measures["by_form"][form_number] = summarize_documents(
+            [latencies[index] for index in indices], [predictions[index] for index in indices],
+            [errors[index] for index in indices], [references[index] for index in indices]
+        )
+    return measures
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(arguments: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="End-to-end extraction benchmark")
+    parser.add_argument("--pipelines", nargs="+", default=["paddleocr"], choices=PIPELINE_NAMES)
+    parser.add_argument("--concurrency", nargs="+", default=[1], type=int,
+                        help="number of concurrent documents, each value being benchmarked")
+    parser.add_argument("--corpus_dir_path", default="data/bench_corpus")
+    parser.add_argument("--documents_per_form", default=5, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--editable_forms", nargs="*", default=None)
+    parser.add_argument("--non_editable_forms", nargs="*", default=None)
+    parser.add_argument("--limit", default=None, type=int, help="number of corpus documents to process")
+    parser.add_argument("--configuration_files_dir_path", default="./data/configs_extraction")
+    parser.add_argument("--donut_model_path", default="./data/models/donut_trained/20231002_095949")
+    parser.add_argument("--ocr_cache", action="store_true", help="keep the persistent OCR cache enabled")
+    parser.add_argument("--output", default=None, help="path of the JSON results file")
+    parsed_arguments = parser.parse_args(arguments)
+    options = vars(parsed_arguments)
+
+    manifest = generate_corpus(
+        parsed_arguments.corpus_dir_path,
+        documents_per_form_count=parsed_arguments.documents_per_form,
+        seed=parsed_arguments.seed,
+        editable_form_numbers=parsed_arguments.editable_forms,
+        non_editable_form_numbers=parsed_arguments.non_editable_forms,
+    )[:parsed_arguments.limit]
+    documents = [{**entry, "path": os.path.join(parsed_arguments.corpus_dir_path, entry["file_name"])}
+                 for entry in manifest]
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": get_git_commit(),
+        "python_version": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {
+            "corpus_dir_path": parsed_arguments.corpus_dir_path,
+            "documents_per_form": parsed_arguments.documents_per_form,
+            "seed": parsed_arguments.seed,
+            "documents_count": len(documents),
+        },
+        "ocr_cache": parsed_arguments.ocr_cache,
+        "pipelines": {},
+    }
+    for pipeline_name in parsed_arguments.pipelines:
+        for concurrency in parsed_arguments.concurrency:
+            # a fresh process per run, so that peak RSS and loaded models do not leak from one run to the next
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                measures = executor.submit(run_pipeline, pipeline_name, documents, concurrency, options).result()
+            results["pipelines"].setdefault(pipeline_name, []).append(measures)
+
+    results_json = json.dumps(results, indent=2)
+    print(results_json)
+    if parsed_arguments.output:
+        with open(parsed_arguments.output, "w") as output_file:
+            output_file.write(results_json)
+    return results
+
+
+if __name__ == "__main__":
+    main()
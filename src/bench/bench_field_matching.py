@@ -0,0 +1,148 @@
+"""
+Benchmark of first_pipeline.match_bounding_boxes_to_template, with and
+without a template index, against the former pure Python double loop over
+OCR boxes and template fields.
+
+    python -m src.bench.bench_field_matching --words 1500 --fields 300
+    python -m src.bench.bench_field_matching --words 3000 --fields 3000 --layout cases
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+# first_pipeline imports its dependencies relatively to src
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from first_pipeline import (  # noqa: E402
+    AREA_RATIO_THRESHOLD,
+    build_template_index,
+    compute_box_area,
+    compute_boxes_intersection,
+    match_bounding_boxes_to_template,
+)
+
+PAGE_WIDTH = 2480
+PAGE_HEIGHT = 3508
+
+
+def match_bounding_boxes_to_template_with_loops(
+    ocr_bounding_boxes: Dict, clean_cerfa_template: Dict, area_ratio_threshold: float
+) -> Tuple[Dict, Dict]:
+    """Former implementation of match_bounding_boxes_to_template, kept as reference."""
+    filled_template = {key: [] for key in clean_cerfa_template.keys()}
+    matched_boxes = {key: [] for key in clean_cerfa_template.keys()}
+    for ocr_box, word in ocr_bounding_boxes.items():
+        box_area = compute_box_area(ocr_box)
+        field_to_increment = None
+        max_intersection_area = 0
+        for field_name, template_box in clean_cerfa_template.items():
+            intersection = compute_boxes_intersection(ocr_box, template_box)
+            if intersection is not None:
+                intersection_area = compute_box_area(intersection)
+                if (intersection_area / box_area > area_ratio_threshold) and (
+                    intersection_area > max_intersection_area
+                ):
+                    max_intersection_area = intersection_area
+                    field_to_increment = field_name
+        if field_to_increment:
+            filled_template[field_to_increment].append(word)
+            matched_boxes[field_to_increment].append(ocr_box)
+
+    filled_str_template = {
+        key: " ".join(value) for key, value in filled_template.items()
+    }
+    return filled_str_template, matched_boxes
+
+
+def generate_template(n_fields: int, rng: np.random.Generator) -> Dict:
+    """Generate a template of n_fields boxes laid out in rows, as in a form."""
+    template = {}
+    n_columns = 4
+    field_width = PAGE_WIDTH / n_columns
+    field_height = PAGE_HEIGHT / (n_fields / n_columns + 1)
+    for i in range(n_fields):
+        x0 = (i % n_columns) * field_width + rng.uniform(0, 10)
+        y0 = (i // n_columns) * field_height + rng.uniform(0, 5)
+        template[f"field_{i}"] = (x0, y0, x0 + field_width * 0.9, y0 + field_height * 0.8)
+    return template
+
+
+def generate_cases_template(n_fields: int, rng: np.random.Generator) -> Dict:
+    """Generate a template of n_fields "cases" boxes (one box per character)."""
+    template = {}
+    case_size = 40
+    n_columns = int(PAGE_WIDTH // case_size)
+    for i in range(n_fields):
+        x0 = (i % n_columns) * case_size + rng.uniform(0, 2)
+        y0 = (i // n_columns) * case_size * 1.5 + rng.uniform(0, 2)
+        template[f"field_{i}"] = (x0, y0, x0 + case_size * 0.9, y0 + case_size)
+    return template
+
+
+def generate_ocr_boxes(n_words: int, rng: np.random.Generator) -> Dict:
+    """Generate n_words word boxes randomly spread over the page."""
+    ocr_boxes = {}
+    while len(ocr_boxes) < n_words:
+        x0 = float(rng.uniform(0, PAGE_WIDTH - 200))
+        y0 = float(rng.uniform(0, PAGE_HEIGHT - 40))
+        box = (x0, y0, x0 + float(rng.uniform(20, 200)), y0 + float(rng.uniform(10, 40)))
+        ocr_boxes[box] = f"word_{len(ocr_boxes)}"
+    return ocr_boxes
+
+
+def time_function(function, repeat: int, *args) -> Tuple[float, Tuple]:
+    """Return the best wall time over repeat runs and the last result."""
+    best_time = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        best_time = min(best_time, time.perf_counter() - t0)
+    return best_time, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Field matching benchmark")
+    parser.add_argument("--words", default=1500, type=int)
+    parser.add_argument("--fields", default=300, type=int)
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--layout", default="rows", choices=["rows", "cases"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.layout == "cases":
+        template = generate_cases_template(args.fields, rng)
+    else:
+        template = generate_template(args.fields, rng)
+    ocr_boxes = generate_ocr_boxes(args.words, rng)
+
+    loop_time, loop_result = time_function(
+        match_bounding_boxes_to_template_with_loops,
+        args.repeat, ocr_boxes, template, AREA_RATIO_THRESHOLD,
+    )
+    vectorised_time, vectorised_result = time_function(
+        match_bounding_boxes_to_template,
+        args.repeat, ocr_boxes, template, AREA_RATIO_THRESHOLD,
+    )
+    index_time, template_index = time_function(build_template_index, 1, template)
+    indexed_time, indexed_result = time_function(
+        match_bounding_boxes_to_template,
+        args.repeat, ocr_boxes, template, AREA_RATIO_THRESHOLD, template_index,
+    )
+    if loop_result != vectorised_result:
+        raise AssertionError("Vectorised matching differs from the reference loop.")
+    if loop_result != indexed_result:
+        raise AssertionError("Indexed matching differs from the reference loop.")
+
+    print(f"{args.words} words x {args.fields} fields (best of {args.repeat})")
+    print(f"loop:       {loop_time * 1000:9.2f} ms")
+    print(f"vectorised: {vectorised_time * 1000:9.2f} ms")
+    print(f"indexed:    {indexed_time * 1000:9.2f} ms (index built once in {index_time * 1000:.2f} ms)")
+    print(f"speed-up:   {loop_time / vectorised_time:9.1f}x vectorised, {loop_time / indexed_time:.1f}x indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Reproducible reference corpus for the end-to-end benchmark, generated with
+the writers of editable forms (src.util.dataGeneration) and with
+creation_faux_cerfa_non_editables (src.util.generate_cerfa).
+
+The corpus directory holds the generated documents and a manifest.jsonl
+file listing, for each document, its CERFA number and its ground truth
+{field name: field value}: the values of the filled widgets of editable
+forms, and the values drawn on the fake scans of non editable forms.
+"""
+import json
+import os
+import random
+from typing import Dict, List, Optional
+
+import numpy as np
+from faker import Faker
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+CORPUS_PARAMETERS_FILE_NAME = "corpus.json"
+# version of the manifest format, so that a corpus generated before the
+# ground truth of non editable forms was recorded is not reused
+CORPUS_VERSION = 2
+DEFAULT_EDITABLE_FORM_NUMBERS = ["13753_04", "13969_01", "14952_03"]
+# CERFA number, structure of the fields to fill and empty form image of the non editable forms
+DEFAULT_NON_EDITABLE_FORMS = {
+    "12485_03": ("data/elements_to_fill_forms/non-editable/cerfa_12485_03.json",
+                 "data/empty_forms/non-editable/cerfa_12485_03.png"),
+    "14011_03": ("data/elements_to_fill_forms/non-editable/cerfa_14011_03_id.json",
+                 "data/empty_forms/non-editable/cerfa_14011_03.png"),
+}
+
+
+def seed_generators(seed: int) -> None:
+    """Seed every random generator used by the writers and by creation_faux_cerfa_non_editables."""
+    random.seed(seed)
+    np.random.seed(seed)
+    Faker.seed(seed)
+
+
+def generate_editable_documents(corpus_dir_path: str, form_number: str, documents_count: int) -> List[Dict]:
+    """Fill documents_count copies of the editable form form_number and return their manifest entries."""
+    from src.util.dataGeneration import Writer
+    from src.util.dataGeneration.baseWriter import AnnotatorJsonDonut
+
+    writer_classes = [writer_class for writer_class in Writer.__subclasses__()
+                      if form_number in writer_class.__name__]
+    if len(writer_classes) != 1:
+        raise ValueError(f"No single writer found for cerfa {form_number}: {[w.__name__ for w in writer_classes]}")
+    entries = []
+    for document_index in range(documents_count):
+        annotator = AnnotatorJsonDonut()
+        writer = writer_classes[0](num_cerfa=form_number, annotator=annotator)
+        writer.fill_form()
+        file_name = f"cerfa_{form_number}_{document_index:04d}.pdf"
+        writer.doc.save(os.path.join(corpus_dir_path, file_name))
+        entries.append({
+            "file_name": file_name,
+            "form_number": form_number,
+            "ground_truth": {field_name: str(field_value) for field_name, field_value in annotator.dic.items()},
+        })
+    return entries
+
+
+def generate_non_editable_documents(
+    corpus_dir_path: str, form_number: str, documents_count: int, max_rotation_angle: int
+) -> List[Dict]:
+    """Draw documents_count fake scans of the non editable form form_number and return their manifest entries."""
+    # imported here as rstr is only needed to generate non editable forms
+    from src.util.generate_cerfa import creation_faux_cerfa_non_editables
+
+    structure_path, empty_form_path = DEFAULT_NON_EDITABLE_FORMS[form_number]
+    creation_faux_cerfa_non_editables(
+        nom_cerfa=f"cerfa_{form_number}",
+        path_structure_cerfa=structure_path,
+        path_cerfa=empty_form_path,
+        n_cerfa_to_generate=documents_count,
+        save_dir=corpus_dir_path,
+        path_folder_signatures="data/elements_to_fill_forms/signatures",
+        path_usable_fonts_list="data/elements_to_fill_forms/usable_fonts.json",
+        min_rotation_angle=-max_rotation_angle,
+        max_rotation_angle=max_rotation_angle,
+        enregistrer_valeurs=True,
+    )
+    ground_truths = read_ground_truths(corpus_dir_path)
+    file_names = [f"cerfa_{form_number}_fake{document_index}.jpg" for document_index in range(1, documents_count + 1)]
+    return [{"file_name": file_name, "form_number": form_number, "ground_truth": ground_truths[file_name]}
+            for file_name in file_names]
+
+
+def generate_corpus(
+    corpus_dir_path: str,
+    documents_per_form_count: int,
+    seed: int = 0,
+    editable_form_numbers: Optional[List[str]] = None,
+    non_editable_form_numbers: Optional[List[str]] = None,
+    max_rotation_angle: int = 5,
+) -> List[Dict]:
+    """Generate the benchmark corpus in corpus_dir_path, unless a corpus generated
+    with the same parameters is already there, and return its manifest.
+
+    Args:
+        corpus_dir_path (str): Directory of the corpus.
+        documents_per_form_count (int): Number of documents generated per form.
+        seed (int): Seed of the random generators, the same seed giving the
+            same corpus.
+        editable_form_numbers (Optional[List[str]]): Editable forms to fill,
+            DEFAULT_EDITABLE_FORM_NUMBERS by default.
+        non_editable_form_numbers (Optional[List[str]]): Non editable forms to
+            draw, the keys of DEFAULT_NON_EDITABLE_FORMS by default.
+        max_rotation_angle (int): Maximal rotation, in degrees, of the fake
+            scans of non editable forms.
+
+    Returns:
+        List[Dict]: Manifest entries, one per document.
+    """
+    corpus_parameters = {
+        "corpus_version": CORPUS_VERSION,
+        "documents_per_form_count": documents_per_form_count,
+        "seed": seed,
+        "editable_form_numbers":
+            DEFAULT_EDITABLE_FORM_NUMBERS if editable_form_numbers is None else editable_form_numbers,
+        "non_editable_form_numbers":
+            list(DEFAULT_NON_EDITABLE_FORMS) if non_editable_form_numbers is None else non_editable_form_numbers,
+        "max_rotation_angle": max_rotation_angle,
+    }
+    corpus_parameters_path = os.path.join(corpus_dir_path, CORPUS_PARAMETERS_FILE_NAME)
+    if os.path.exists(corpus_parameters_path):
+        with open(corpus_parameters_path, "r") as corpus_parameters_file:
+            if json.load(corpus_parameters_file) == corpus_parameters:
+                return read_manifest(corpus_dir_path)
+        raise ValueError(f"{corpus_dir_path} holds a corpus generated with other parameters, "
+                         f"see {corpus_parameters_path}")
+    os.makedirs(corpus_dir_path, exist_ok=True)
+
+    seed_generators(seed)
+    manifest = []
+    for form_number in corpus_parameters["editable_form_numbers"]:
+        manifest.extend(generate_editable_documents(corpus_dir_path, form_number, documents_per_form_count))
+    for form_number in corpus_parameters["non_editable_form_numbers"]:
+        manifest.extend(generate_non_editable_documents(
+            corpus_dir_path, form_number, documents_per_form_count, max_rotation_angle
+        ))
+    with open(os.path.join(corpus_dir_path, MANIFEST_FILE_NAME), "w") as manifest_file:
+        for entry in manifest:
+            manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    # written last, so that an interrupted generation is not mistaken for a complete corpus
+    with open(corpus_parameters_path, "w") as corpus_parameters_file:
+        json.dump(corpus_parameters, corpus_parameters_file, indent=2)
+    return manifest
+
+
+def read_manifest(corpus_dir_path: str) -> List[Dict]:
+    """Read the manifest entries of the corpus in corpus_dir_path."""
+    with open(os.path.join(corpus_dir_path, MANIFEST_FILE_NAME), "r") as manifest_file:
+        return [json.loads(line) for line in manifest_file if line.strip()]
+
+
+def read_ground_truths(images_dir_path: str) -> Dict[str, Dict]:
+    """Read the gt_parse of each image from the metadata.jsonl file written by AnnotatorJsonDonut, if any."""
+    metadata_path = os.path.join(images_dir_path, "metadata.jsonl")
+    ground_truths = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as metadata_file:
+            for line in metadata_file:
+                metadata = json.loads(line)
+                ground_truths[metadata["file_name"]] = json.loads(metadata["ground_truth"])["gt_parse"]
+    return ground_truths
+
+
+def compute_field_accuracy(predictions: List[Dict], references: List[Optional[Dict]]) -> Optional[float]:
+    """Fraction of the reference fields whose predicted value is identical."""
+    matching_fields_count, fields_count = 0, 0
+    for prediction, reference in zip(predictions, references):
+        if reference is None:
+            continue
+        for field_name, field_value in reference.items():
+            fields_count += 1
+            matching_fields_count += int(str(prediction.get(field_name, "")).strip() == str(field_value).strip())
+    return matching_fields_count / fields_count if fields_count else None
@@ -0,0 +1,166 @@
+"""
+Schema-constrained decoding for DONUT field extraction.
+
+Every CERFA has a fixed set of field keys, so the decoder is only allowed to
+open the keys of the form being read, each at most once, and generation stops
+as soon as all of them are closed instead of running up to max_length.
+"""
+import glob
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+import fitz
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+from transformers.utils import ModelOutput
+
+# directories of the empty editable forms and of the structures of the non editable forms
+EDITABLE_FORMS_DIR_PATH = "data/empty_forms/editable"
+NON_EDITABLE_FORMS_STRUCTURES_DIR_PATH = "data/elements_to_fill_forms/non-editable"
+# DONUT key tokens, e.g. <s_nom_assure> and </s_nom_assure>
+KEY_TOKEN_REGEXP = r"^<(/?)s_(.+)>$"
+
+# key schemas already read, by CERFA number
+_key_schemas: Dict[str, List[str]] = {}
+
+
+def get_form_key_schema(form_number: str) -> Optional[List[str]]:
+    """Get the field keys DONUT was trained to output for a CERFA.
+
+    For editable forms the keys are the names of the widgets filled by the
+    writers and annotated by AnnotatorJsonDonut; for non editable forms they
+    are the field names of the structure files used to generate the forms.
+
+    Args:
+        form_number (str): CERFA number, as returned by
+            get_form_number_in_text_elements (e.g. "12485_03").
+
+    Returns:
+        Optional[List[str]]: Field keys, None if the form is unknown.
+    """
+    if form_number in _key_schemas:
+        return _key_schemas[form_number]
+    keys = []
+    editable_form_path = os.path.join(EDITABLE_FORMS_DIR_PATH, f"cerfa_{form_number}.pdf")
+    if os.path.exists(editable_form_path):
+        with fitz.open(editable_form_path) as editable_form:
+            keys = [widget.field_name for page in editable_form for widget in page.widgets()]
+    else:
+        # a form may have several structures, e.g. cerfa_14011_03_id.json and cerfa_14011_03_passeport.json
+        for structure_path in sorted(glob.glob(os.path.join(NON_EDITABLE_FORMS_STRUCTURES_DIR_PATH,
+                                                            f"cerfa_{form_number}*.json"))):
+            with open(structure_path, "r") as structure_file:
+                for fields in json.load(structure_file).values():
+                    keys.extend(fields)
+    if not keys:
+        return None
+    _key_schemas[form_number] = list(dict.fromkeys(keys))
+    return _key_schemas[form_number]
+
+
+class KeyTokens:
+    """Ids of the opening and closing tokens of the keys of a schema, and of
+    all the other key tokens of the tokenizer."""
+
+    def __init__(self, tokenizer, key_schema: List[str], prompt: str):
+        vocabulary = tokenizer.get_added_vocab()
+        self.open_token_ids = []
+        self.close_token_ids = []
+        for key in key_schema:
+            open_token, close_token = f"<s_{key}>", f"</s_{key}>"
+            # keys absent from the training data have no token and cannot be generated anyway
+            if open_token in vocabulary and close_token in vocabulary:
+                self.open_token_ids.append(vocabulary[open_token])
+                self.close_token_ids.append(vocabulary[close_token])
+        schema_token_ids = set(self.open_token_ids) | set(self.close_token_ids)
+        self.other_key_token_ids = [
+            token_id for token, token_id in vocabulary.items()
+            if re.match(KEY_TOKEN_REGEXP, token) and token != prompt and token_id not in schema_token_ids
+        ]
+
+
+class SchemaKeysLogitsProcessor(LogitsProcessor):
+    """Forbid the key tokens that are not in the schema, and the reopening of
+    a key of the schema already opened."""
+
+    def __init__(self, key_tokens: KeyTokens):
+        self.open_token_ids = torch.tensor(key_tokens.open_token_ids, dtype=torch.long)
+        self.other_key_token_ids = torch.tensor(key_tokens.other_key_token_ids, dtype=torch.long)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if len(self.other_key_token_ids):
+            scores[:, self.other_key_token_ids.to(scores.device)] = -float("inf")
+        if len(self.open_token_ids):
+            open_token_ids = self.open_token_ids.to(input_ids.device)
+            # (batch, keys) mask of the keys already opened in each sequence
+            opened_keys = (input_ids[:, :, None] == open_token_ids[None, None, :]).any(dim=1)
+            open_scores = scores[:, open_token_ids]
+            open_scores[opened_keys] = -float("inf")
+            scores[:, open_token_ids] = open_scores
+        return scores
+
+
+class AllKeysClosedStoppingCriteria(StoppingCriteria):
+    """Stop generation once every sequence of the batch has closed all the
+    keys of the schema."""
+
+    def __init__(self, key_tokens: KeyTokens):
+        self.close_token_ids = torch.tensor(key_tokens.close_token_ids, dtype=torch.long)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> bool:
+        if not len(self.close_token_ids):
+            return False
+        close_token_ids = self.close_token_ids.to(input_ids.device)
+        closed_keys = (input_ids[:, :, None] == close_token_ids[None, None, :]).any(dim=1)
+        return bool(closed_keys.all())
+
+
+def run_constrained_inference(model, prompt: str, image_tensors: torch.Tensor, key_schema: List[str]) -> List[Dict]:
+    """Same as DonutModel.inference on a batch of images, with generation
+    constrained to the keys of key_schema and stopped once they are all closed.
+
+    Args:
+        model (DonutModel): Loaded model.
+        prompt (str): Task prompt of the model.
+        image_tensors (torch.Tensor): (B, C, H, W) preprocessed images.
+        key_schema (List[str]): Field keys of the form.
+
+    Returns:
+        List[Dict]: Predictions, in the order of the images.
+    """
+    tokenizer = model.decoder.tokenizer
+    if model.device.type == "cuda":
+        image_tensors = image_tensors.half().to(model.device)
+    prompt_tensors = tokenizer(prompt, add_special_tokens=False, return_tensors="pt")["input_ids"]
+    prompt_tensors = prompt_tensors.expand(len(image_tensors), -1).to(model.device)
+
+    last_hidden_state = model.encoder(image_tensors)
+    if model.device.type != "cuda":
+        last_hidden_state = last_hidden_state.to(torch.float32)
+    encoder_outputs = ModelOutput(last_hidden_state=last_hidden_state, attentions=None)
+
+    key_tokens = KeyTokens(tokenizer, key_schema, prompt)
+    decoder_output = model.decoder.model.generate(
+        decoder_input_ids=prompt_tensors,
+        encoder_outputs=encoder_outputs,
+        max_length=model.config.max_length,
+        early_stopping=True,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        use_cache=True,
+        num_beams=1,
+        bad_words_ids=[[tokenizer.unk_token_id]],
+        return_dict_in_generate=True,
+        logits_processor=LogitsProcessorList([SchemaKeysLogitsProcessor(key_tokens)]),
+        stopping_criteria=StoppingCriteriaList([AllKeysClosedStoppingCriteria(key_tokens)]),
+    )
+
+    predictions = []
+    for sequence in tokenizer.batch_decode(decoder_output.sequences):
+        sequence = sequence.replace(tokenizer.eos_token, "").replace(tokenizer.pad_token, "")
+        # remove the task start token
+        sequence = re.sub(r"<.*?>", "", sequence, count=1).strip()
+        predictions.append(model.token2json(sequence))
+    return predictions
@@ -3,14 +3,19 @@ First pipeline that takes an image as input and returns an
 extraction of the Cerfa form if the template exists in our
 database.
 """
+import functools
 import sys
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 import re
+import numpy as np
 from doctr.io import DocumentFile, Document
 from doctr.models import ocr_predictor
 from models.classify_form.doctr.identify_cerfa_doctr import get_list_words_in_page
 from util.dataGeneration.writer_13753_04 import Writer13753_04
 from util.dataGeneration.writer_13969_01 import Writer13969_01
+from util.box_matching import match_boxes_to_fields
+from util.spatial_index import UniformGridIndex
+from util.document_loader import PdfPageTextLayer, load_document_text_layer
 import fitz
 from PIL import Image
 
@@ -64,13 +69,28 @@ def load_cerfa(cerfa_path: str) -> Image:
     return image
 
 
-def ocrize(cerfa_path: str, ocr_engine="Doctr") -> Document:
+def load_doctr_model():
+    """Load the docTR OCR model, to be built once and reused across calls to ocrize.
+
+    Returns:
+        OCRPredictor: docTR OCR model.
+    """
+    return ocr_predictor(
+        det_arch="db_resnet50",
+        reco_arch="crnn_vgg16_bn",
+        pretrained=True,
+    )
+
+
+def ocrize(cerfa_path: str, ocr_engine="Doctr", doctr_model=None) -> Document:
     """Ocrize a Cerfa with a given OCR engine.
     # TODO: generalize to other engines.
 
     Args:
         cerfa_path (str): Cerfa path.
         ocr_engine (str, optional): OCR engine. Defaults to "Doctr".
+        doctr_model (OCRPredictor, optional): docTR model built by
+            load_doctr_model. Defaults to loading a new model.
 
     Returns:
         Document: OCR extraction.
@@ -78,11 +98,8 @@ def ocrize(cerfa_path: str, ocr_engine="Doctr") -> Document:
     doc_doctr = DocumentFile.from_pdf(cerfa_path)
 
     if ocr_engine == "Doctr":
-        doctr_model = ocr_predictor(
-            det_arch="db_resnet50",
-            reco_arch="crnn_vgg16_bn",
-            pretrained=True,
-        )
+        if doctr_model is None:
+            doctr_model = load_doctr_model()
         output = doctr_model(doc_doctr)
     else:
         raise ValueError(f"OCR engine {ocr_engine} not supported.")
@@ -105,15 +122,31 @@ def identify_cerfa(ocr_output: Document) -> str:
         for line in block.lines:
             content = " ".join([word.value for word in line.words])
             page_content += content + "\n"
+    return identify_cerfa_in_page_content(page_content)
+
 
+def identify_cerfa_in_page_content(page_content: str) -> str:
+    """Identify Cerfa from the text of a page.
+
+    The number is looked for after "N°", then, as the text layer of a
+    PDF may put "N°" after the number, as the only number of the page.
+
+    Args:
+        page_content (str): Text of the page.
+
+    Returns:
+        str: Cerfa number.
+    """
     pattern = r"N[°o] +(\d{5}\*\d{2})"
     match = re.search(pattern, page_content, re.IGNORECASE)
 
     if match:
         result = match.group(1)
         return result
-    else:
-        raise ValueError("No cerfa number found.")
+    numbers = set(re.findall(r"\b(\d{5}\*\d{2})\b", page_content))
+    if len(numbers) == 1:
+        return numbers.pop()
+    raise ValueError("No cerfa number found.")
 
 
 def process_doctr_output(doctr_output: Document, width: int, height: int) -> Dict:
@@ -143,6 +176,24 @@ def process_doctr_output(doctr_output: Document, width: int, height: int) -> Dic
     return processed_output
 
 
+def process_text_layer_output(text_layer: PdfPageTextLayer) -> Dict:
+    """Process the text layer of a digital PDF to return a dictionary
+    with bounding boxes under the same format as process_doctr_output.
+
+    Args:
+        text_layer (PdfPageTextLayer): Text layer, read at the
+            resolution of the image the boxes are compared in.
+
+    Returns:
+        Dict: Formatted text layer output.
+    """
+    processed_output = {}
+    for text_element, text_box in zip(text_layer.text_elements, text_layer.text_boxes):
+        (x0, y0), _, (x1, y1), _ = text_box
+        processed_output[(x0, y0, x1, y1)] = text_element
+    return processed_output
+
+
 def compute_box_area(box: Tuple) -> int:
     """Compute area of a bounding box identified by its
     x0, y0, x1, y1 coordinates.
@@ -211,38 +262,83 @@ def clean_cerfa_template(cerfa_template: Dict) -> Dict:
     return clean_template
 
 
+def build_template_index(clean_cerfa_template: Dict) -> UniformGridIndex:
+    """Build the spatial index of the boxes of a Cerfa template, once
+    per template (and per page for multi-page forms).
+
+    Args:
+        clean_cerfa_template (Dict): Cerfa template.
+
+    Returns:
+        UniformGridIndex: Spatial index of the template boxes, in the
+            order of the template keys.
+    """
+    return UniformGridIndex(
+        np.array(list(clean_cerfa_template.values()), dtype=np.float64).reshape(-1, 4)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_clean_cerfa_template_and_index(
+    cerfa_number: str,
+) -> Tuple[Dict, UniformGridIndex]:
+    """Get the clean template of a Cerfa and its spatial index, built
+    once per Cerfa number: the writer filling the form, the cleaning
+    and the index are only run for the first document of each Cerfa.
+    The returned template is shared and must not be modified.
+
+    Args:
+        cerfa_number (str): Cerfa number.
+
+    Returns:
+        Tuple[Dict, UniformGridIndex]: Clean Cerfa template and its
+            index built with build_template_index.
+    """
+    clean_template = clean_cerfa_template(get_cerfa_template(cerfa_number))
+    return clean_template, build_template_index(clean_template)
+
+
 def match_bounding_boxes_to_template(
-    ocr_bounding_boxes: Dict, clean_cerfa_template: Dict, area_ratio_threshold: float
+    ocr_bounding_boxes: Dict,
+    clean_cerfa_template: Dict,
+    area_ratio_threshold: float,
+    template_index: Optional[UniformGridIndex] = None,
 ) -> Tuple[Dict, Dict]:
     """Match OCR bounding boxes to a Cerfa template.
 
+    The intersection areas of all OCR boxes with all template boxes
+    are computed at once, each OCR box being assigned to the first
+    template box with the largest intersection covering more than
+    area_ratio_threshold of its area. With a template index, each OCR
+    box is only tested against the template boxes it can overlap.
+
     Args:
         ocr_bounding_boxes (Dict): Clean OCR output.
         clean_cerfa_template (Dict): Cerfa template.
         area_ratio_threshold (float): Ratio over which intersection
             of an OCR BB and of a template BB is considered.
+        template_index (Optional[UniformGridIndex]): Index built with
+            build_template_index on clean_cerfa_template.
 
     Returns:
         Tuple[Dict, Dict]: Filled Cerfa template and box matching.
     """
-    filled_template = {key: [] for key in clean_cerfa_template.keys()}
-    matched_boxes = {key: [] for key in clean_cerfa_template.keys()}
-    for ocr_box, word in ocr_bounding_boxes.items():
-        box_area = compute_box_area(ocr_box)
-        field_to_increment = None
-        max_intersection_area = 0
-        for field_name, template_box in clean_cerfa_template.items():
-            intersection = compute_boxes_intersection(ocr_box, template_box)
-            if intersection is not None:
-                intersection_area = compute_box_area(intersection)
-                if (intersection_area / box_area > area_ratio_threshold) and (
-                    intersection_area > max_intersection_area
-                ):
-                    max_intersection_area = intersection_area
-                    field_to_increment = field_name
-        if field_to_increment:
-            filled_template[field_to_increment].append(word)
-            matched_boxes[field_to_increment].append(ocr_box)
+    field_names = list(clean_cerfa_template.keys())
+    filled_template = {key: [] for key in field_names}
+    matched_boxes = {key: [] for key in field_names}
+
+    ocr_boxes = list(ocr_bounding_boxes.keys())
+    matches = match_boxes_to_fields(
+        np.array(ocr_boxes, dtype=np.float64).reshape(-1, 4),
+        np.array(list(clean_cerfa_template.values()), dtype=np.float64).reshape(-1, 4),
+        area_ratio_threshold,
+        field_boxes_index=template_index,
+    )
+    for ocr_box, field_index in zip(ocr_boxes, matches):
+        if field_index >= 0:
+            field_name = field_names[field_index]
+            filled_template[field_name].append(ocr_bounding_boxes[ocr_box])
+            matched_boxes[field_name].append(ocr_box)
 
     filled_str_template = {
         key: " ".join(value) for key, value in filled_template.items()
@@ -250,22 +346,42 @@ def match_bounding_boxes_to_template(
     return filled_str_template, matched_boxes
 
 
-def main(cerfa_path: str):
+def extract_cerfa(cerfa_path: str, doctr_model=None) -> Tuple[str, Dict]:
+    """Run the pipeline on a Cerfa: read its text, identify it and fill
+    its template.
+
+    Args:
+        cerfa_path (str): Cerfa path.
+        doctr_model (OCRPredictor, optional): docTR model built by
+            load_doctr_model, for scanned documents. Defaults to loading
+            a new model.
+
+    Returns:
+        Tuple[str, Dict]: Cerfa number and filled Cerfa template.
+    """
     # Load Cerfa image
     # For plots
     image = load_cerfa(cerfa_path)
     width, height = image.size
 
-    # OCR
-    raw_ocr_output = ocrize(cerfa_path)
-    ocr_output = process_doctr_output(raw_ocr_output, width, height)
+    # Digital PDFs: words and filled widgets are read from the PDF, at
+    # the resolution of load_cerfa, and only scanned pages are OCRized
+    text_layer = load_document_text_layer(cerfa_path, image_quality_in_dpi=72)
+    if text_layer is not None:
+        ocr_output = process_text_layer_output(text_layer)
+        cerfa_number = identify_cerfa_in_page_content(text_layer.get_page_content())
+    else:
+        # OCR
+        raw_ocr_output = ocrize(cerfa_path, doctr_model=doctr_model)
+        ocr_output = process_doctr_output(raw_ocr_output, width, height)
 
-    # Identify Cerfa using OCR output
-    cerfa_number = identify_cerfa(raw_ocr_output)
+        # Identify Cerfa using OCR output
+        cerfa_number = identify_cerfa(raw_ocr_output)
 
-    # Get template
-    cerfa_template = get_cerfa_template(cerfa_number)
-    clean_template = clean_cerfa_template(cerfa_template)
+    # Get template, cached per Cerfa number
+    clean_template, template_index = get_clean_cerfa_template_and_index(
+        cerfa_number
+    )
 
     # TODO: Clean up OCR output (untilting)
     # clean_ocr_output = clean_ocr_output(ocr_output)
@@ -273,8 +389,16 @@ def main(cerfa_path: str):
 
     # Matching
     filled_template, matched_boxes = match_bounding_boxes_to_template(
-        clean_ocr_output, clean_template, area_ratio_threshold=AREA_RATIO_THRESHOLD
+        clean_ocr_output,
+        clean_template,
+        area_ratio_threshold=AREA_RATIO_THRESHOLD,
+        template_index=template_index,
     )
+    return cerfa_number, filled_template
+
+
+def main(cerfa_path: str):
+    _, filled_template = extract_cerfa(cerfa_path)
     print(filled_template)
 
 
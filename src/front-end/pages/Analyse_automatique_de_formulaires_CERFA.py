@@ -8,10 +8,8 @@ import os
 import time
 # importe le module de gestion des images (Python Imaging Library)
 from PIL import Image
-# importe le module de boîtes à outils d'OCRisation basées sur PaddlePaddle (PArallel Distributed Deep LEarning),
-# la seule plateforme chinoise indépendante de deep learning pour la R&D, ouverte à la communauté open source
-# depuis 2016
-import paddleocr as ocr
+# importe le module des files synchronisées, dont l'exception queue.Full levée lorsque la file des tâches est pleine
+import queue
 # importe le module de création et du publication d'applications basées sur des données
 import streamlit as st
 
@@ -27,33 +25,39 @@ cwd = Path().resolve()
 sys.path.append(str(cwd))
 # importe le module de constantes et fonctions utiles
 import src.util.utils as utils
-# importe le module de PaddleOCR permettant l'extraction d'informations et la classification d'un fichier PDF selon
-# l'un des modèles connus
-import src.models.classify_form.PaddleOCR_TextMatch.classify as ocrExtractor
-# importe le module des étapes d'exécution de PaddleOCR
-import src.pipeline.pipeline_PaddleOCR as ocrPipeline
-# importe le module d'exécution du modèle DonUT
-import src.testing_donut as dot
+# importe le module de la file des tâches d'analyse, exécutées par les workers (voir src/service/worker.py)
+import src.service.job_queue as jobQueue
+
+
+# --- Constantes ---#
+# libellés des étapes d'une tâche d'analyse affichés pendant son exécution
+JOB_STAGE_LABELS: dict = {
+    "identification": "Extraction du numéro CERFA du document en cours...",
+    "alignment": "Prétraitement du document en cours...",
+    "donut": "Analyse du document en cours...",
+    "extraction": "Analyse des pages du document en cours..."
+}
+# intervalle, en secondes, entre deux lectures de l'état de la tâche d'analyse
+JOB_POLL_INTERVAL_IN_SECONDS: float = 0.5
+# durée maximale, en secondes depuis sa soumission, d'attente du résultat d'une tâche d'analyse, au-delà de laquelle la
+# page cesse d'attendre, par exemple si aucun worker n'est lancé
+JOB_TIMEOUT_IN_SECONDS: float = 600.
 
 
 @st.cache_resource
-def load_ocr_model():
-    r"""Charge le modèle PaddleOCR en mémoire lors du premier chargement de la page.
-    Le décorateur `@st.cache_resource` permet de mettre en cache le modèle sans avoir à le sérialiser comme avec le
-    décorateur `@st.cache_data`.
+def load_job_queue():
+    r"""Ouvre la file des tâches d'analyse lors du premier chargement de la page. Les modèles PaddleOCR et DonUT ne sont
+    plus chargés par la page mais par les workers, lancés séparément par `python -m src.service.worker`.
 
     Returns
     -------
-    paddleocr.paddleocr.PaddleOCR
-        le modèle d'OCR PaddleOCR après son téléchargement.
+    src.service.job_queue.JobQueue
+        la file des tâches d'analyse.
     """
-    return ocr.PaddleOCR(use_angle_cls=True, lang='fr')
+    return jobQueue.get_job_queue()
 
 
-data_load_state = st.text("Chargement des modèles...")
-# charge le modèle PaddleOCR en mémoire lors du premier chargement de la page
-paddleOcrModel = load_ocr_model()
-data_load_state.text("")
+analysisJobQueue = load_job_queue()
 
 st.title("Analyse automatique de formulaires CERFA")
 st.subheader("Téléversement d'un formulaire au format JPG, PNG ou PDF pour analyse")
@@ -61,95 +65,104 @@ st.write("Actuellement, seuls sont traités les CERFA 12485\*03, 13749\*05 et 14
 uploadedFile = st.file_uploader("Téléversez votre fichier au format JPG, PNG ou PDF", type=["jpg", "jpeg", "png", "pdf"])
 # si un fichier correspondant aux extensions acceptées a été téléversé,
 if uploadedFile is not None:
-    # chemin du fichier téléversé lorsque sauvegardé localement
-    uploadedFileRelativePathStr = f"{utils.TEMPORARY_FILE_DIRECTORY_STR}/{uploadedFile.name}"
-    # sauvegarde localement le contenu binaire (tableau d'octets) du fichier téléversé
-    with open(uploadedFileRelativePathStr, "wb") as savedUploadedFile:
-        savedUploadedFile.write(uploadedFile.read())
-    # extrait du nom dudit fichier :
-    # - son chemin et la racine de son nom, sans extension
-    # - son extension
-    #uploadedFileWithoutExtensionPathStr, uploadedFileExtensionStr = os.path.splitext(uploadedFile.name)
-    uploadedFileAsImage, uploadedFileAsImageRelativePathStr = utils.get_and_save_image_and_path_from_document(
-        input_document_path=uploadedFileRelativePathStr,
-        output_image_format="PNG",
-        output_image_quality_in_dpi=350
-    )
-#    st.write(f"Document {uploadedFile.name} téléversé avec succès en tant que {uploadedFileAsImageRelativePathStr}")
+    # identifiant du fichier téléversé, afin de ne soumettre qu'une seule tâche par téléversement malgré les
+    # réexécutions de la page, la tâche et son résultat étant conservés jusqu'au téléversement d'un autre fichier
+    uploadedFileKeyStr = getattr(uploadedFile, "file_id", f"{uploadedFile.name}-{uploadedFile.size}")
+    if st.session_state.get("uploaded_file_key") != uploadedFileKeyStr:
+        # supprime la tâche du fichier précédemment téléversé et son répertoire, dont le document et les images produites
+        if "job_id" in st.session_state:
+            analysisJobQueue.delete(st.session_state.pop("job_id"))
+            del st.session_state["uploaded_file_key"]
+        # dépose le document téléversé dans le répertoire propre à la tâche, puis soumet la tâche
+        lJobIdStr = analysisJobQueue.create_job_dir()
+        uploadedFileNameStr = f"document{os.path.splitext(uploadedFile.name)[1].lower()}"
+        with open(os.path.join(analysisJobQueue.get_job_dir_path(lJobIdStr), uploadedFileNameStr), "wb") as savedUploadedFile:
+            savedUploadedFile.write(uploadedFile.read())
+        try:
+            analysisJobQueue.submit(lJobIdStr, {"document_name": uploadedFile.name, "document_file_name": uploadedFileNameStr})
+        except queue.Full:
+            analysisJobQueue.delete(lJobIdStr)
+            st.error("Le service d'analyse est **occupé** : trop de documents sont en attente. "
+                     "Merci de réessayer dans quelques instants.")
+            st.stop()
+        st.session_state["uploaded_file_key"] = uploadedFileKeyStr
+        st.session_state["job_id"] = lJobIdStr
+    lJobIdStr = st.session_state["job_id"]
+    lJobDirPathStr = analysisJobQueue.get_job_dir_path(lJobIdStr)
     st.write(f"Document téléversé avec succès")
     st.subheader("Affichage du formulaire téléversé")
+    lJob = analysisJobQueue.get(lJobIdStr)
+    if lJob is None:
+        st.error(f"La tâche d'analyse du document {uploadedFile.name} n'existe plus. Merci de le téléverser à nouveau.")
+        st.stop()
     # affiche l'image dans l'application
-    st.image(np.array(uploadedFileAsImage))
-    # affiche un cercle de chargement durant le processus d'extraction du numéro CERFA
-    with st.spinner(text="Extraction du numéro CERFA du document en cours..."):
-        lBeforeProcessTime = time.time()
-        # liste des éléments de texte extraits et des coordonnées des points définissant les boîtes entourant lesdits éléments
-        # de texte extraits de l'OCRisation de l'image png_document_path_str par le modèle d'OCR PaddleOCR
-        lInputDocumentTextElements, lInputDocumentTextBoxes = \
-            ocrPipeline.get_form_image_text_elements_and_boxes(uploadedFileAsImageRelativePathStr, paddleOcrModel)
-        # extrait le numéro CERFA du formulaire afin de trouver le fichier de configuration dudit formulaire, définissant
-        # les champs, leurs positions, les éléments de texte de référence et la taille de l'image de référence associée
-        cerfaFormNumberStr: str = ocrExtractor.get_form_number_in_text_elements(
-            input_document_path=uploadedFile.name,
-            text_elements=lInputDocumentTextElements
-        )
-        st.subheader("Numéro CERFA du formulaire téléversé")
-        st.write(f"""Le **numéro CERFA** du document {uploadedFile.name} est le **{cerfaFormNumberStr}**.
-            Son extraction s'est déroulée en {round(time.time() - lBeforeProcessTime, 2)} secondes.""")
-    # affiche un cercle de chargement durant le processus de prétraitement du formulaire CERFA
-    with st.spinner(text="Prétraitement du document en cours..."):
-        lBeforeProcessTime = time.time()
-        try:
-            # - trouve les boîtes entourant les éléments de texte correspondant le mieux aux éléments de texte de
-            #   l'image de référence du formulaire
-            # - applique une rotation à l'image, en sauvegarde le résultat dans un fichier différent pour éviter
-            #   tout conflit de nommage et retourne l'image obtenue et la matrice de transformation de ladite image
-            lTransformedImageRelativePathStr, lTransformationMatrix = ocrPipeline.get_transformationMatrix_and_save_image_after_affineTransformation(
-                input_document_path_str=uploadedFile.name,
-                form_image_path_str=uploadedFileAsImageRelativePathStr,
-                form_number_str=cerfaFormNumberStr,
-                input_document_text_elements=lInputDocumentTextElements,
-                input_document_text_boxes=lInputDocumentTextBoxes,
-                configuration_files_dir_path_str="./data/configs_extraction",
-            )
-        except AssertionError as lAssertionError:
-            st.write(f"""Le prétraitement du document {uploadedFile.name} n'est pas possible :
-                **aucun fichier de configuration correspondant** n'existe pour ce formulaire.""")
-#            st.write(f"{lAssertionError}")
-            lTransformedImageRelativePathStr = uploadedFileAsImageRelativePathStr
+    st.image(utils.get_image_array_from_document(os.path.join(lJobDirPathStr, lJob["parameters"]["document_file_name"])),
+             channels="BGR")
+    # affiche l'avancement de la tâche, lu périodiquement dans la file, jusqu'à la fin de son exécution
+    lProgressBar = st.progress(0., text="Document en attente d'analyse...")
+    while lJob["status"] in [jobQueue.JOB_STATUS_QUEUED_STR, jobQueue.JOB_STATUS_RUNNING_STR]:
+        if time.time() - lJob["submission_time"] > JOB_TIMEOUT_IN_SECONDS:
+            lProgressBar.empty()
+            st.error(f"L'analyse du document {uploadedFile.name} n'a pas abouti en {round(JOB_TIMEOUT_IN_SECONDS)} "
+                     f"secondes : le service d'analyse est indisponible ou surchargé. Merci de réessayer plus tard.")
+            st.stop()
+        if lJob["status"] == jobQueue.JOB_STATUS_QUEUED_STR:
+            lProgressBar.progress(0., text=f"Document en attente d'analyse ({lJob['queue_position']} document(s) avant lui)...")
         else:
-            st.subheader("Affichage du formulaire téléversé après prétraitement")
-            lTransformedImage = Image.open(lTransformedImageRelativePathStr)
-            # affiche l'image dans l'application
-            st.image(np.array(lTransformedImage))
-            st.write(f"""Le prétraitement du document {uploadedFile.name} s'est déroulé en
-                {round(time.time() - lBeforeProcessTime, 2)} secondes.""")
-    # affiche un cercle de chargement durant le processus d'analyse du formulaire CERFA
-    with st.spinner(text="Analyse du document en cours..."):
-        lBeforeProcessTime = time.time()
-        # chemin relatif du modèle DonUT
-        modelPathStr = "./data/models/donut_trained/20231002_095949"
-#        with NamedTemporaryFile(dir=".", suffix=".jpg") as withPathTemporaryUploadedFile:
-#            # sauvegarde temporairement le fichier téléversé sur le conteneur exécutant ce code
-#            withPathTemporaryUploadedFile.write(uploadedFile.getbuffer())
-#            # chemin absolu du fichier téléversé, stocké temporairerement, de la forme /home/onyxia/work/formIAble/tmpXXXXX.jpg
-#            uploadedFileFullPathStr = withPathTemporaryUploadedFile.name
-#            fieldsNamesAndValuesStrs = dot.run_model_on_file(modelPathStr, uploadedFileFullPathStr)
-        # couples {nom du champ : valeur du champ} lus par le modèle d'OCR DonUT
-        fieldsNamesAndValuesStrs = dot.run_model_on_file(modelPathStr, lTransformedImageRelativePathStr)
+            lProgressBar.progress(lJob["progress"], text=JOB_STAGE_LABELS.get(lJob["stage"], "Analyse du document en cours..."))
+        time.sleep(JOB_POLL_INTERVAL_IN_SECONDS)
+        lJob = analysisJobQueue.get(lJobIdStr)
+    lProgressBar.empty()
+    if lJob["status"] == jobQueue.JOB_STATUS_FAILED_STR:
+        # numéro CERFA introuvable : l'analyse par DonUT, coûteuse, n'a pas été lancée
+        st.write(f"""L'analyse du document {uploadedFile.name} n'est pas possible :""")
+        st.write(f"{lJob['error']}")
+        st.stop()
+    lJobResult = lJob["result"]
+    lDurations = lJobResult["durations"]
+    if "pages" in lJobResult:
+        # document de plusieurs pages, dont les champs ont été extraits page par page par PaddleOCR
         st.subheader("Résultat de l'analyse du formulaire téléversé")
-        st.write(f"""L'analyse du document {uploadedFile.name} s'est déroulée en {round(time.time() - lBeforeProcessTime, 2)} secondes
-            et a pu extraire **{len(fieldsNamesAndValuesStrs)}** couples \"**nom du champ** : valeur du champ\" :""")
-        # affiche les couples clefs-valeurs reconnus par DonUT et triés alphabétiquement par clef
-        for fieldNameStr, fieldValueStr in sorted(fieldsNamesAndValuesStrs.items()):
-            st.write(f"* **{fieldNameStr}** : {fieldValueStr}")
-    # supprime l'image transformée obtenue après prétraitement de l'image créée à partir du document téléversé
-    if lTransformedImageRelativePathStr not in [uploadedFileRelativePathStr, uploadedFileAsImageRelativePathStr]:
-        os.remove(lTransformedImageRelativePathStr)
-    # supprime l'image créée à partir du document téléversé
-    os.remove(uploadedFileAsImageRelativePathStr)
-    # supprime le document téléversé si ce n'est pas l'image créée
-    if uploadedFileRelativePathStr not in [uploadedFileAsImageRelativePathStr, lTransformedImageRelativePathStr]:
-        os.remove(uploadedFileRelativePathStr)
+        st.write(f"""L'analyse des {len(lJobResult["pages"])} pages du document {uploadedFile.name} s'est déroulée en
+            {round(lDurations["extraction"], 2)} secondes.""")
+        for lPageRecord in lJobResult["pages"]:
+            if lPageRecord["error"] is not None:
+                st.write(f"* Page {lPageRecord['page_index'] + 1} : analyse impossible ({lPageRecord['error']})")
+            else:
+                st.write(f"* Page {lPageRecord['page_index'] + 1} : page {lPageRecord['page_number']} du formulaire "
+                         f"CERFA **{lPageRecord['form_number']}**")
+        for cerfaFormNumberStr, fieldsNamesAndValuesStrs in sorted(lJobResult["forms_fields"].items()):
+            st.write(f"""Le formulaire CERFA **{cerfaFormNumberStr}** compte **{len(fieldsNamesAndValuesStrs)}**
+                couples \"**nom du champ** : valeur du champ\" :""")
+            for fieldNameStr, fieldValueStr in sorted(fieldsNamesAndValuesStrs.items()):
+                st.write(f"* **{fieldNameStr}** : {fieldValueStr}")
+        st.stop()
+    cerfaFormNumberStr: str = lJobResult["form_number"]
+    st.subheader("Numéro CERFA du formulaire téléversé")
+    st.write(f"""Le **numéro CERFA** du document {uploadedFile.name} est le **{cerfaFormNumberStr}**.
+        Son extraction s'est déroulée en {round(lDurations["identification"], 2)} secondes.""")
+    if not lJobResult["is_form_config_found"]:
+        st.write(f"""Le prétraitement du document {uploadedFile.name} n'est pas possible :
+            **aucun fichier de configuration correspondant** n'existe pour ce formulaire.""")
+    elif lJobResult.get("alignment_error") is not None:
+        # alignement peu fiable : DonUT a lu l'image non alignée
+        st.write(f"""Le prétraitement du document {uploadedFile.name} n'est pas possible :""")
+        st.write(f"{lJobResult['alignment_error']}")
+    else:
+        st.subheader("Affichage du formulaire téléversé après prétraitement")
+        lTransformedImage = Image.open(os.path.join(lJobDirPathStr, lJobResult["transformed_image_file_name"]))
+        # affiche l'image dans l'application
+        st.image(np.array(lTransformedImage))
+        st.write(f"""Le prétraitement du document {uploadedFile.name} s'est déroulé en
+            {round(lDurations["alignment"], 2)} secondes.""")
+    # couples {nom du champ : valeur du champ} lus par le modèle d'OCR DonUT, dont le décodage est restreint aux
+    # champs du formulaire identifié
+    fieldsNamesAndValuesStrs = lJobResult["fields"]
+    st.subheader("Résultat de l'analyse du formulaire téléversé")
+    st.write(f"""L'analyse du document {uploadedFile.name} s'est déroulée en {round(lDurations["donut"], 2)} secondes
+        et a pu extraire **{len(fieldsNamesAndValuesStrs)}** couples \"**nom du champ** : valeur du champ\" :""")
+    # affiche les couples clefs-valeurs reconnus par DonUT et triés alphabétiquement par clef
+    for fieldNameStr, fieldValueStr in sorted(fieldsNamesAndValuesStrs.items()):
+        st.write(f"* **{fieldNameStr}** : {fieldValueStr}")
 #else:
 #    st.write("Merci de téléverser une image au format JPG uniquement !")
@@ -13,6 +13,7 @@ cwd = Path().resolve()
 # de modules présents dans les sous-répertoires dudit répertoire
 sys.path.append(str(cwd))
 import src.models.auto_rotation_translation.functions as ocrFunctions
+import src.util.ocr_cache as ocrCache
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -24,7 +25,7 @@ def auto_rotate_and_translate(input_image_path: str,
                               reference_image_texts: List[str],
                               cls: bool):
     # Get boxes and size from reference image, to later perform match with input image
-    reference_image_ocr_results = ocr_model.ocr(img=reference_image_path, det=True, rec=True, cls=False)
+    reference_image_ocr_results = ocrCache.paddleocr_ocr(ocr_model, img=reference_image_path, det=True, rec=True, cls=False)
     reference_image_allBoxes: List[List[Tuple[int, int]]] = \
         [reference_image_ocr_result[0] for reference_image_ocr_result in reference_image_ocr_results]
     reference_image_allTexts: List[str] = \
@@ -40,7 +41,7 @@ def auto_rotate_and_translate(input_image_path: str,
     reference_image = cv2.imread(reference_image_path)
     reference_image_shape: Tuple[int, int] = reference_image.shape
 
-    input_image_ocr_results = ocr_model.ocr(img=input_image_path, det=True, rec=True, cls=cls)
+    input_image_ocr_results = ocrCache.paddleocr_ocr(ocr_model, img=input_image_path, det=True, rec=True, cls=cls)
 
     input_image_boxes: List[List[Tuple[int, int]]] = \
         [input_image_ocr_result[0] for input_image_ocr_result in input_image_ocr_results]
@@ -1,11 +1,161 @@
 from typing import List, Tuple, Iterator
 import unicodedata
-import Levenshtein
+from rapidfuzz import process as fuzzProcess
+from rapidfuzz.distance import Levenshtein as fuzzLevenshtein
 import numpy as np
 import cv2
 import logging
 
 
+def get_affineTransformation_matrix_with_points(
+    input_image_points: np.ndarray,
+    reference_image_points: np.ndarray
+) -> np.ndarray:
+    """
+    Gets the affine transformation matrix that maps input_image_points onto reference_image_points.
+
+    :param input_image_points: float32 array of the 3 points (x, y) found in the image to transform.
+    :param reference_image_points: float32 array of the 3 matching points (x, y) of the reference image.
+
+    :returns: the transformation matrix.
+    """
+    # il doit y avoir 3 points ayant 2 coordonnées correspondant aux centres des 3 boîtes
+    assert input_image_points.shape == (3, 2)
+    assert reference_image_points.shape == (3, 2)
+    return cv2.getAffineTransform(input_image_points, reference_image_points)
+
+
+class AffineTransformationFit:
+    """
+    Affine transformation estimated over N >= 3 matched anchor points, with the quality of the fit.
+
+    :param affine_transformation_matrix: the 2x3 transformation matrix.
+    :param inliers_mask: boolean array of the anchors consistent with the transformation.
+    :param reprojection_errors: distance, in pixels, between each transformed input point and its reference point.
+    """
+
+    def __init__(self, affine_transformation_matrix: np.ndarray, inliers_mask: np.ndarray, reprojection_errors: np.ndarray):
+        self.affine_transformation_matrix = affine_transformation_matrix
+        self.inliers_mask = inliers_mask
+        self.reprojection_errors = reprojection_errors
+        self.inliers_count = int(inliers_mask.sum())
+        # mean reprojection error over the inliers, the outliers being ignored by the fit
+        self.reprojection_error = float(reprojection_errors[inliers_mask].mean()) if self.inliers_count else np.inf
+
+    def to_dict(self) -> dict:
+        """
+        :returns: the quality of the fit, as a JSON serialisable dictionary.
+        """
+        return {
+            "inliers_count": self.inliers_count,
+            "anchors_count": len(self.inliers_mask),
+            "reprojection_error": self.reprojection_error
+        }
+
+    def __repr__(self):
+        return f"AffineTransformationFit(inliers_count={self.inliers_count}/{len(self.inliers_mask)}, " \
+               f"reprojection_error={self.reprojection_error:.2f})"
+
+
+def estimate_affineTransformation_with_points(
+    input_image_points: np.ndarray,
+    reference_image_points: np.ndarray,
+    ransac_reprojection_threshold: float = 20.
+) -> AffineTransformationFit:
+    """
+    Estimates the affine transformation that maps input_image_points onto reference_image_points.
+    With exactly 3 points the transformation is solved exactly; with more points it is fitted with RANSAC, so that
+    misread anchors are discarded as outliers instead of distorting the transformation.
+
+    :param input_image_points: float32 array of the N >= 3 points (x, y) found in the image to transform.
+    :param reference_image_points: float32 array of the N matching points (x, y) of the reference image.
+    :param ransac_reprojection_threshold: maximum distance, in pixels, between a transformed point and its reference
+    point for the anchor to be considered as an inlier.
+
+    :returns: the estimated transformation, its inliers and its reprojection errors.
+    """
+    input_image_points = np.asarray(input_image_points, dtype=np.float32).reshape(-1, 2)
+    reference_image_points = np.asarray(reference_image_points, dtype=np.float32).reshape(-1, 2)
+    assert len(input_image_points) >= 3
+    assert input_image_points.shape == reference_image_points.shape
+    if len(input_image_points) == 3:
+        affine_transformation_matrix = get_affineTransformation_matrix_with_points(input_image_points,
+                                                                                   reference_image_points)
+        inliers_mask = np.ones(3, dtype=bool)
+    else:
+        affine_transformation_matrix, inliers = cv2.estimateAffine2D(
+            input_image_points,
+            reference_image_points,
+            method=cv2.RANSAC,
+            ransacReprojThreshold=ransac_reprojection_threshold
+        )
+        if affine_transformation_matrix is None:
+            raise ValueError(f"No affine transformation could be estimated from {len(input_image_points)} anchors")
+        inliers_mask = inliers.ravel().astype(bool)
+    transformed_points = cv2.transform(input_image_points[:, None, :], affine_transformation_matrix)[:, 0, :]
+    reprojection_errors = np.linalg.norm(transformed_points - reference_image_points, axis=1)
+    return AffineTransformationFit(affine_transformation_matrix, inliers_mask, reprojection_errors)
+
+
+def get_affineTransformation_matrix_with_boxes(
+    input_image_boxes: List[List[Tuple[int, int]]],
+    reference_image_boxes: List[List[Tuple[int, int]]]
+) -> np.ndarray:
+    """
+    Gets the affine transformation matrix that matches the centers of input_image_boxes and reference_image_boxes.
+
+    :param input_image_boxes: list of 3 boxes found in the image to transform used to compute the affine transformation.
+    :param reference_image_boxes: list of 3 boxes found in the reference image used to compute the affine transformation.
+
+    :returns: the transformation matrix.
+    """
+    return get_affineTransformation_matrix_with_points(
+        input_image_points=np.array(input_image_boxes, dtype=np.float32).mean(axis=1),
+        reference_image_points=np.array(reference_image_boxes, dtype=np.float32).mean(axis=1)
+    )
+
+
+def apply_affineTransformation(
+    input_image: np.ndarray,
+    affine_transformation_matrix: np.ndarray,
+    output_image_size: Tuple[int, int]
+) -> np.ndarray:
+    """
+    Applies the affine transformation affine_transformation_matrix to the in-memory image input_image.
+
+    :param input_image: the image to transform.
+    :param affine_transformation_matrix: the affine transformation matrix.
+    :param output_image_size: size (height: int, width: int) of the image after transformation.
+
+    :returns: the transformed image.
+    """
+    return cv2.warpAffine(input_image,
+                          affine_transformation_matrix,
+                          dsize=(output_image_size[1], output_image_size[0]))
+
+
+def get_transformationMatrix_and_image_after_affineTransformation_with_boxes(
+    input_image: np.ndarray,
+    input_image_boxes: List[List[Tuple[int, int]]],
+    reference_image_boxes: List[List[Tuple[int, int]]],
+    output_image_size: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets the transformation matrix and the in-memory image obtained after having applied the affine transformation that
+    matches the centers of input_image_boxes and reference_image_boxes.
+
+    :param input_image: the image to transform.
+    :param input_image_boxes: list of 3 boxes found in the image to transform used to compute the affine transformation.
+    :param reference_image_boxes: list of 3 boxes found in the reference image used to compute the affine transformation.
+    :param output_image_size: size (height: int, width: int) of the image after transformation.
+
+    :returns: the transformation matrix and the transformed image.
+    """
+    affine_transformation_matrix = get_affineTransformation_matrix_with_boxes(input_image_boxes, reference_image_boxes)
+    output_image = apply_affineTransformation(input_image, affine_transformation_matrix, output_image_size)
+    return affine_transformation_matrix, output_image
+
+
 def get_transformationMatrix_and_save_image_after_affineTransformation_with_boxes(
     input_image_path: str,
     output_image_path: str,
@@ -26,17 +176,12 @@ def get_transformationMatrix_and_save_image_after_affineTransformation_with_boxe
     :returns: the transformation matrix.
     """
     logging.debug(f"Applying affine transformation on image {input_image_path}...")
-    input_image_points: np.ndarray = np.array(input_image_boxes, dtype=np.float32).mean(axis=1)
-    # il doit y avoir 3 points ayant 2 coordonnées correspondant aux centres des 3 boîtes
-    assert input_image_points.shape == (3, 2)
-    reference_image_points: np.ndarray = np.array(reference_image_boxes, dtype=np.float32).mean(axis=1)
-    # il doit y avoir 3 points ayant 2 coordonnées correspondant aux centres des 3 boîtes
-    assert reference_image_points.shape == (3, 2)
-
-    affine_transformation_matrix = cv2.getAffineTransform(input_image_points, reference_image_points)
-    output_image = cv2.warpAffine(cv2.imread(input_image_path),
-                                  affine_transformation_matrix,
-                                  dsize=(output_image_size[1], output_image_size[0]))
+    affine_transformation_matrix, output_image = get_transformationMatrix_and_image_after_affineTransformation_with_boxes(
+        input_image=cv2.imread(input_image_path),
+        input_image_boxes=input_image_boxes,
+        reference_image_boxes=reference_image_boxes,
+        output_image_size=output_image_size
+    )
     cv2.imwrite(filename=output_image_path, img=output_image)
     logging.debug(f"Affine transformation applied [OK] on image {input_image_path}, wrote resulting image to {output_image_path}")
     return affine_transformation_matrix
@@ -62,7 +207,8 @@ def find_matching_boxes(
     reference_image_text_elements: List[str]
 ) -> List[List[Tuple[int, int]]]:
     """
-    Return box coordinates of the nearest matches in input_image_text_elements for each text in reference_image_text_elements
+    Return box coordinates of the nearest matches in input_image_text_elements for each text in reference_image_text_elements,
+    i.e. the first text with the lowest Levenshtein distance once accents and surrounding spaces are stripped
 
     :param input_image_text_boxes: the list of the corners of each box found in the input image
     :param input_image_text_elements: the list of the extracted texts in each box found in the input image
@@ -71,25 +217,18 @@ def find_matching_boxes(
     :returns: the list of corners of each box whose text best matches the corresponding text in reference_image_text_elements
     """
     assert len(input_image_text_boxes) == len(input_image_text_elements)
+    # the input texts are normalised only once, whatever the number of reference texts
+    input_image_normalised_texts: List[str] = [strip_accents(lString).strip() for lString in input_image_text_elements]
     input_image_matching_boxes: List[List[Tuple[int, int]]] = []
     for reference_image_text_str in map(lambda lString: strip_accents(lString).strip(), reference_image_text_elements):
-        best_match_distance = np.Inf
-        best_match_index = 0
-        # logging.debug(f"Searching for text {reference_image_texts}")
-        for input_image_text_index, input_image_text_str in enumerate(
-            map(
-                lambda lString: strip_accents(lString).strip(),
-                input_image_text_elements
-            )
-        ):
-            assert isinstance(reference_image_text_str, str)
-            assert isinstance(input_image_text_str, str)
-            distance = Levenshtein.distance(reference_image_text_str,
-                                            input_image_text_str)
-            # logging.debug(f"Levenshtein distance between {reference_image_text} and {input_image_text_str} = {distance}")
-            if distance < best_match_distance:
-                best_match_distance = distance
-                best_match_index = input_image_text_index
+        assert isinstance(reference_image_text_str, str)
+        # extractOne keeps the first text with the lowest Levenshtein distance, as a loop keeping the first strictly
+        # smaller distance, and bounds the computation of each distance by the best distance found so far
+        best_match = fuzzProcess.extractOne(reference_image_text_str,
+                                            input_image_normalised_texts,
+                                            scorer=fuzzLevenshtein.distance,
+                                            processor=None)
+        best_match_index = 0 if best_match is None else best_match[2]
         logging.debug(f"Searching for text {reference_image_text_str} : best match found = {input_image_text_elements[best_match_index]}")
         input_image_matching_boxes.append(input_image_text_boxes[best_match_index])
 
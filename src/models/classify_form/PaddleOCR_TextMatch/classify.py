@@ -1,18 +1,31 @@
 # importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
-from typing import Final, List
+from typing import Dict, Final, List, Optional, Tuple
 # importe le module des paramètres et fonctions systèmes
 import sys
 import logging
 # importe le module des expressions régulières
 import re
+# importe le module des fils d'exécution (threads)
+import threading
+import numpy as np
 # importe le module de boîtes à outils d'OCRisation basées sur PaddlePaddle (PArallel Distributed Deep LEarning),
 # la seule plateforme chinoise indépendante de deep learning pour la R&D, ouverte à la communauté open source
 # depuis 2016
 import paddleocr
+import src.util.instrumentation as instrumentation
+import src.util.ocr_cache as ocrCache
+import src.util.utils as utils
 
 
 # expression régulière du numéro CERFA d'un formulaire
 CERFA_REFERENCE_REGEXP: Final[str] = r"\d{5}\s?\*\s?\d{2}\s*$"
+# largeur, en pixels, à laquelle les bandes sont réduites avant OCRisation, soit celle d'une page A4 rendue à 150 dpi
+STRIP_IMAGE_WIDTH_IN_PIXELS: Final[int] = 1240
+# bandes de page, en fractions (début, fin) de la hauteur de la page, où chercher d'abord le numéro CERFA : l'en-tête,
+# où se trouve le logo CERFA, puis le pied de page
+DEFAULT_IDENTIFICATION_STRIPS: Final[List[Tuple[float, float]]] = [(0., 0.15), (0.88, 1.)]
+# demi-hauteur, en fraction de la hauteur de la page, de la bande apprise autour d'un numéro CERFA trouvé hors des bandes
+LEARNED_STRIP_HALF_HEIGHT_RATIO: Final[float] = 0.05
 
 
 def get_form_reference(input_document_path: str, ocrModel: paddleocr.PaddleOCR) -> str:
@@ -27,7 +40,8 @@ def get_form_reference(input_document_path: str, ocrModel: paddleocr.PaddleOCR)
     :return: reference text
     :rtype: str
     """
-    image_ocr_results = ocrModel.ocr(
+    image_ocr_results = ocrCache.paddleocr_ocr(
+        ocrModel,
         img=input_document_path,
         det=True,
         rec=True,
@@ -37,6 +51,7 @@ def get_form_reference(input_document_path: str, ocrModel: paddleocr.PaddleOCR)
     return get_form_number_in_text_elements(input_document_path=input_document_path, text_elements=text_elements)
 
 
+@instrumentation.instrumented("identification")
 def get_form_number_in_text_elements(input_document_path: str, text_elements: List[str]) -> str:
     matching_text_elements = []
     logging.debug(f"Eléments de texte dans lesquels chercher des correspondances à la regexp {CERFA_REFERENCE_REGEXP} = " + " ".join(text_elements))
@@ -48,6 +63,8 @@ def get_form_number_in_text_elements(input_document_path: str, text_elements: Li
             logging.debug("Correspondances courantes = " + " ".join(matching_text_elements))
     if len(matching_text_elements) == 0:
         raise ValueError(f"Aucun numéro de formulaire CERFA n'a été trouvé dans le document {input_document_path}")
+    # un même numéro peut être imprimé plusieurs fois sur la page
+    matching_text_elements = list(dict.fromkeys(matching_text_elements))
     if len(matching_text_elements) > 1:
         raise ValueError(f"Plusieurs numéros de formulaires CERFA ont été trouvés dans le document {input_document_path} : {matching_text_elements}")
     form_number_str = matching_text_elements[0]
@@ -55,6 +72,112 @@ def get_form_number_in_text_elements(input_document_path: str, text_elements: Li
     return form_number_str
 
 
+def find_form_number_text_box_index(text_elements: List[str]) -> Optional[int]:
+    """
+    Returns the index of the only text element matching CERFA_REFERENCE_REGEXP, or None if there is none or several.
+
+    :param text_elements: text elements extracted by OCR
+    :type text_elements: list of str
+    :rtype: int or None
+    """
+    matching_indices = [lTextElementIdx for lTextElementIdx, text_element in enumerate(text_elements)
+                        if re.search(CERFA_REFERENCE_REGEXP, text_element)]
+    return matching_indices[0] if len(matching_indices) == 1 else None
+
+
+class StripFormClassifier:
+    """
+    Coarse classification of a form: the CERFA number is searched for by OCR in a few horizontal strips of the page
+    only, rendered or downscaled to STRIP_IMAGE_WIDTH_IN_PIXELS, instead of in the whole page at full resolution.
+
+    The strips are the DEFAULT_IDENTIFICATION_STRIPS, the strips declared by the form configuration files (see
+    add_strips) and the strips learned from the documents whose number was only found by a full page OCR (see
+    learn_strip). The strips which identified the most documents are tried first.
+    """
+
+    def __init__(self, strips: Optional[List[Tuple[float, float]]] = None):
+        # nombre de documents identifiés par chaque bande
+        self._strips_hits: Dict[Tuple[float, float], int] = \
+            {strip: 0 for strip in (strips if strips is not None else DEFAULT_IDENTIFICATION_STRIPS)}
+        self._lock = threading.Lock()
+
+    def get_strips(self) -> List[Tuple[float, float]]:
+        """
+        :return: the strips, the ones which identified the most documents first
+        :rtype: list of tuples of float and float
+        """
+        with self._lock:
+            return sorted(self._strips_hits, key=lambda strip: -self._strips_hits[strip])
+
+    def add_strips(self, strips: List[Tuple[float, float]]) -> None:
+        """
+        Adds the strips which are not known yet, e.g. the identification strips of the form configuration files.
+
+        :param strips: strips, as (start, end) fractions of the page height
+        :type strips: list of tuples of float and float
+        """
+        with self._lock:
+            for strip in strips:
+                self._strips_hits.setdefault(strip, 0)
+
+    def learn_strip(self, text_box, image_height: int) -> None:
+        """
+        Adds a strip centered on the box of a CERFA number found by a full page OCR, unless it is already covered by a
+        strip.
+
+        :param text_box: the 4 corners of the box of the CERFA number
+        :param image_height: height of the page image the box was found in
+        """
+        y_ratio = float(np.mean([corner[1] for corner in text_box])) / image_height
+        with self._lock:
+            if any(y0_ratio <= y_ratio <= y1_ratio for y0_ratio, y1_ratio in self._strips_hits):
+                return
+            learned_strip = (max(0., round(y_ratio - LEARNED_STRIP_HALF_HEIGHT_RATIO, 3)),
+                             min(1., round(y_ratio + LEARNED_STRIP_HALF_HEIGHT_RATIO, 3)))
+            self._strips_hits[learned_strip] = 0
+        # la bande apprise est perdue à l'arrêt du processus, sauf à la déclarer dans le fichier de configuration
+        logging.info(f"Nouvelle bande de recherche du numéro CERFA apprise : {learned_strip}, à ajouter aux "
+                     f"\"identification_strips\" du fichier de configuration du formulaire pour la conserver")
+
+    def classify(self, input_document_path: str, form_image: Optional[np.ndarray], ocrModel: paddleocr.PaddleOCR) -> Optional[str]:
+        """
+        Searches for the CERFA number in the strips of the page, one strip after the other. Without a page image, the
+        strips are rendered from the document at STRIP_IMAGE_WIDTH_IN_PIXELS only, one at a time, so that a PDF page
+        is never rendered at full resolution for the identification.
+
+        :param input_document_path: path to the form document, read when form_image is None, used in the messages
+        :type input_document_path: str
+        :param form_image: BGR image of the form, or None to render the strips from the document
+        :type form_image: numpy.ndarray or None
+        :param ocrModel: model to use for text detection and recognition
+        :type ocrModel: paddleocr.PaddleOCR
+        :return: the CERFA number, or None if no strip contains exactly one number
+        :rtype: str or None
+        """
+        strips = self.get_strips()
+        strip_images = utils.iter_strip_image_arrays_from_document(input_document_path, strips, STRIP_IMAGE_WIDTH_IN_PIXELS) \
+            if form_image is None else utils.iter_strip_image_arrays_from_image(form_image, strips, STRIP_IMAGE_WIDTH_IN_PIXELS)
+        for strip, strip_image in zip(strips, strip_images):
+            if strip_image.shape[0] == 0:
+                continue
+            with instrumentation.measure_stage("identification.strip"):
+                strip_ocr_results = ocrCache.paddleocr_ocr(ocrModel, img=strip_image, det=True, rec=True, cls=True)
+            text_elements = [strip_ocr_result[1][0] for strip_ocr_result in strip_ocr_results]
+            if find_form_number_text_box_index(text_elements) is None:
+                continue
+            form_number_str = get_form_number_in_text_elements(input_document_path, text_elements)
+            with self._lock:
+                if strip in self._strips_hits:
+                    self._strips_hits[strip] += 1
+            logging.debug(f"Numéro CERFA {form_number_str} trouvé dans la bande {strip} du document {input_document_path}")
+            return form_number_str
+        return None
+
+
+# classifieur partagé, dont les bandes apprises servent à tous les documents du processus
+strip_form_classifier: StripFormClassifier = StripFormClassifier()
+
+
 def add_form_reference(
     form_image_path: str,
     accepted_references_path: str,
@@ -17,6 +17,7 @@ __all__ = [
     "load_craftnet_model",
     "load_refinenet_model",
     "get_prediction",
+    "get_prediction_batch",
     "export_detected_regions",
     "export_extra_results",
     "empty_cuda_cache",
@@ -27,6 +28,7 @@ read_image = image_utils.read_image
 load_craftnet_model = craft_utils.load_craftnet_model
 load_refinenet_model = craft_utils.load_refinenet_model
 get_prediction = predict.get_prediction
+get_prediction_batch = predict.get_prediction_batch
 export_detected_regions = file_utils.export_detected_regions
 export_extra_results = file_utils.export_extra_results
 empty_cuda_cache = torch_utils.empty_cuda_cache
@@ -106,10 +108,12 @@ class Craft:
         self.refine_net = None
         empty_cuda_cache()
 
-    def detect_text(self, image, image_path=None):
+    def detect_text(self, image, image_path=None, outputs=None):
         """
         Arguments:
             image: path to the image to be processed or numpy array or PIL image
+            outputs: outputs to compute among predict.OUTPUTS, all of them by
+                default, those needed by the export being added if output_dir is given
 
         Output:
             {
@@ -137,19 +141,88 @@ class Craft:
             low_text=self.low_text,
             cuda=self.cuda,
             long_size=self.long_size,
+            outputs=self._get_required_outputs(outputs),
         )
 
-        # arange regions
+        # export if output_dir is given
+        self._export_results(image, prediction_result)
+
+        # return prediction results
+        return prediction_result
+
+    def detect_text_batch(self, images, batch_size=4, max_workers=None, outputs=None):
+        """
+        Arguments:
+            images: list of paths to the images to be processed or numpy arrays or PIL images
+            batch_size: number of images stacked in a single forward pass
+            max_workers: number of post-processing threads of each batch
+            outputs: outputs to compute, see detect_text
+
+        Output:
+            list of the outputs of detect_text, one per image, in the same order,
+            "times" being the elapsed times of the sub modules for the batch of the image
+        """
+        prediction_results = []
+        for batch_start in range(0, len(images), batch_size):
+            batch_images = images[batch_start : batch_start + batch_size]
+
+            # perform prediction
+            batch_prediction_results = get_prediction_batch(
+                images=batch_images,
+                craft_net=self.craft_net,
+                refine_net=self.refine_net,
+                text_threshold=self.text_threshold,
+                link_threshold=self.link_threshold,
+                low_text=self.low_text,
+                cuda=self.cuda,
+                long_size=self.long_size,
+                max_workers=max_workers,
+                outputs=self._get_required_outputs(outputs),
+            )
+
+            # export if output_dir is given
+            for image, prediction_result in zip(batch_images, batch_prediction_results):
+                self._export_results(image, prediction_result)
+            prediction_results.extend(batch_prediction_results)
+
+        # return prediction results
+        return prediction_results
+
+    def _get_regions_output(self):
+        """
+        Output of get_prediction holding the regions to crop
+        """
         if self.crop_type == "box":
-            regions = prediction_result["boxes"]
+            return "boxes"
         elif self.crop_type == "poly":
-            regions = prediction_result["polys"]
+            return "polys"
         else:
             raise TypeError("crop_type can be only 'polys' or 'boxes'")
 
-        # export if output_dir is given
+    def _get_required_outputs(self, outputs):
+        """
+        Requested outputs, with those needed by the export if output_dir is given
+        """
+        if outputs is None:
+            return None
+        outputs = set(outputs)
+        if self.output_dir is not None:
+            outputs.add(self._get_regions_output())
+            if self.export_extra:
+                outputs.add("heatmaps")
+        return outputs
+
+    def _export_results(self, image, prediction_result):
+        """
+        Exports the detected regions of the image and, if export_extra, the
+        extra results to output_dir, if given
+        """
+        # arange regions
+        regions_output = self._get_regions_output()
+
         prediction_result["text_crop_paths"] = []
         if self.output_dir is not None:
+            regions = prediction_result[regions_output]
             # export detected text regions
             if type(image) == str:
                 file_name, file_ext = os.path.splitext(os.path.basename(image))
@@ -173,6 +246,3 @@ class Craft:
                     file_name=file_name,
                     output_dir=self.output_dir,
                 )
-
-        # return prediction results
-        return prediction_result
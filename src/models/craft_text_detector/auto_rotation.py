@@ -1,3 +1,5 @@
+import functools
+
 import cv2
 import numpy as np
 from src.models.craft_text_detector import Craft
@@ -32,37 +34,66 @@ def rotate_without_cropping(angle, img):
     return rotated
 
 
-def straighten_image(img):
+# minimal ratio of the long side to the short side of the boxes used to estimate the text angle
+MIN_BOX_ELONGATION = 2
+
+
+@functools.lru_cache(maxsize=1)
+def get_craft():
+    """
+    Text detector used to straighten images, loaded once
+    """
+    return Craft(output_dir=None, rectify=False, export_extra=False, text_threshold=0.7, link_threshold=0.4,
+                 low_text=0.4, cuda=False, long_size=1280, refiner=True, crop_type="box",)
+
 
-    angle = 100
-    iterations = 0
-    while (abs(angle) >= 1) and iterations < 10:
-        # Text boxes detection
-        craft = Craft(output_dir="figures/test", rectify=False, export_extra=False, text_threshold=0.7, link_threshold=0.4,
-                      low_text=0.4, cuda=False, long_size=1280, refiner=True, crop_type="box",)
-        detected_text = craft.detect_text(image=img)
-        # Angle calculation and image rotation
-        angle, img = straighten_image_from_text_boxes(img, detected_text)
-        iterations += 1
+def straighten_image(img, craft=None):
+    """
+    Arguments:
+        img: image to straighten, as a numpy array
+        craft: text detector, get_craft() by default
+
+    Output:
+        the image rotated by the dominant angle of its text boxes, detected once
+    """
+    if craft is None:
+        craft = get_craft()
+    # Text boxes detection, only the boxes being used to compute the angle
+    detected_text = craft.detect_text(image=img, outputs=["boxes"])
+    # Angle calculation and image rotation
+    angle, img = straighten_image_from_text_boxes(img, detected_text)
     return img
 
 
+def get_text_angle_from_text_boxes(boxes):
+    """
+    Arguments:
+        boxes: coords of the points of the detected text boxes
+
+    Output:
+        median angle, in degrees, of the long sides of the elongated boxes (of
+        all the boxes if none is elongated), as expected by rotate_without_cropping
+        to make them horizontal, 0 if there is no box
+    """
+    angles, elongated_angles = [], []
+    for box in boxes:
+        (_, _), (w, h), angle = cv2.minAreaRect(np.asarray(box, dtype=np.float32))
+        # angle of the long side, whatever the angle convention of the OpenCV version
+        if w < h:
+            angle += 90
+            w, h = h, w
+        angle = (angle + 90) % 180 - 90
+        angles.append(angle)
+        if w >= MIN_BOX_ELONGATION * h:
+            elongated_angles.append(angle)
+    if elongated_angles:
+        return float(np.median(elongated_angles))
+    return float(np.median(angles)) if angles else 0.
+
+
 def straighten_image_from_text_boxes(img, detected_text):
 
-    h, w, _ = img.shape
-    box_sizes = np.array(
-        [(max(box[:, 0]) - min(box[:, 0]), max(box[:, 1]) - min(box[:, 1])) for box in detected_text["boxes"]])
-    largest_dim = np.argmax([np.mean(box_sizes[:, 0]), np.mean(box_sizes[:, 1])])
-    i_max = np.argmax(box_sizes[:, largest_dim])
-    largest_box = detected_text["boxes"][i_max]
-    if largest_dim == 0:
-        opposite = -(largest_box[3, 1] - largest_box[2, 1])
-        adjacent = largest_box[2, 0] - largest_box[3, 0]
-    else:
-        opposite = -(largest_box[1, 1] - largest_box[2, 1])
-        adjacent = largest_box[2, 0] - largest_box[1, 0]
-
-    angle = np.arctan(opposite / adjacent) / np.pi * 180
+    angle = get_text_angle_from_text_boxes(detected_text["boxes"])
     rotated_img = rotate_without_cropping(angle, img)
 
     return angle, rotated_img
@@ -6,6 +6,7 @@ from typing import Optional, Union
 
 import cv2
 import numpy as np
+import scipy.ndimage
 
 import src.models.craft_text_detector.file_utils as file_utils
 import src.models.craft_text_detector.torch_utils as torch_utils
@@ -101,6 +102,11 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         text_score_comb.astype(np.uint8), connectivity=4
     )
 
+    # maximum text score of each component, computed in a single pass over the map
+    max_text_scores = scipy.ndimage.maximum(textmap, labels, index=np.arange(nLabels))
+    # link area, removed from the segmentation map of every component
+    link_area = np.logical_and(link_score == 1, text_score == 0)
+
     det = []
     mapper = []
     for k in range(1, nLabels):
@@ -110,16 +116,9 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
             continue
 
         # thresholding
-        if np.max(textmap[labels == k]) < text_threshold:
+        if max_text_scores[k] < text_threshold:
             continue
 
-        # make segmentation map
-        segmap = np.zeros(textmap.shape, dtype=np.uint8)
-        segmap[labels == k] = 255
-
-        # remove link area
-        segmap[np.logical_and(link_score == 1, text_score == 0)] = 0
-
         x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
         w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
         niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
@@ -133,12 +132,20 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
             ex = img_w
         if ey >= img_h:
             ey = img_h
+
+        # make segmentation map, restricted to the dilation ROI which contains the whole component
+        segmap = np.zeros((ey - sy, ex - sx), dtype=np.uint8)
+        segmap[labels[sy:ey, sx:ex] == k] = 255
+
+        # remove link area
+        segmap[link_area[sy:ey, sx:ex]] = 0
+
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1 + niter, 1 + niter))
-        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+        segmap = cv2.dilate(segmap, kernel)
 
-        # make box
-        np_temp = np.roll(np.array(np.where(segmap != 0)), 1, axis=0)
-        np_contours = np_temp.transpose().reshape(-1, 2)
+        # make box, with the coordinates of the ROI pixels shifted back to the map
+        ys, xs = np.where(segmap != 0)
+        np_contours = np.stack((xs + sx, ys + sy), axis=1)
         rectangle = cv2.minAreaRect(np_contours)
         box = cv2.boxPoints(rectangle)
 
@@ -1,5 +1,7 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 
 import cv2
 import numpy as np
@@ -7,6 +9,10 @@ import numpy as np
 import src.models.craft_text_detector.craft_utils as craft_utils
 import src.models.craft_text_detector.image_utils as image_utils
 import src.models.craft_text_detector.torch_utils as torch_utils
+import src.util.instrumentation as instrumentation
+
+# outputs of get_prediction which can be requested with its outputs argument
+OUTPUTS = ("boxes", "boxes_as_ratios", "polys", "polys_as_ratios", "heatmaps")
 
 
 def get_prediction(
@@ -19,6 +25,7 @@ def get_prediction(
     cuda: bool = False,
     long_size: int = 1280,
     poly: bool = True,
+    outputs: Optional[Iterable[str]] = None,
 ):
     """
     Arguments:
@@ -33,6 +40,8 @@ def get_prediction(
         canvas_size: image size for inference
         long_size: desired longest image size for inference
         poly: enable polygon type
+        outputs: outputs to compute among OUTPUTS, all of them by default;
+            e.g. ["boxes"] skips the polygons, the ratios and the heatmaps
     Output:
         {"masks": lists of predicted masks 2d as bool array,
          "boxes": list of coords of points of predicted boxes,
@@ -41,6 +50,7 @@ def get_prediction(
          "heatmaps": visualizations of the detected characters/links,
          "times": elapsed times of the sub modules, in seconds}
     """
+    outputs = _check_outputs(outputs)
     t0 = time.time()
 
     # read/convert image
@@ -82,35 +92,126 @@ def get_prediction(
     t0 = time.time()
 
     # Post-processing
-    boxes, polys = craft_utils.getDetBoxes(
-        score_text, score_link, text_threshold, link_threshold, low_text, poly
+    prediction_result = _postprocess_score_maps(
+        image, score_text, score_link, ratio_w, ratio_h, text_threshold, link_threshold, low_text, poly, outputs
     )
 
-    # coordinate adjustment
-    boxes = craft_utils.adjustResultCoordinates(boxes, ratio_w, ratio_h)
-    polys = craft_utils.adjustResultCoordinates(polys, ratio_w, ratio_h)
-    for k in range(len(polys)):
-        if polys[k] is None:
-            polys[k] = boxes[k]
+    postprocess_time = time.time() - t0
 
-    # get image size
-    img_height = image.shape[0]
-    img_width = image.shape[1]
+    times = {
+        "resize_time": resize_time,
+        "preprocessing_time": preprocessing_time,
+        "craftnet_time": craftnet_time,
+        "refinenet_time": refinenet_time,
+        "postprocess_time": postprocess_time,
+    }
+    instrumentation.record_stage_times("craft", times)
 
-    # calculate box coords as ratios to image size
-    boxes_as_ratio = []
-    for box in boxes:
-        boxes_as_ratio.append(box / [img_width, img_height])
-    boxes_as_ratio = np.array(boxes_as_ratio)
+    prediction_result["times"] = times
+    return prediction_result
 
-    # calculate poly coords as ratios to image size
-    polys_as_ratio = []
-    for poly in polys:
-        polys_as_ratio.append(poly / [img_width, img_height])
-    polys_as_ratio = np.array(polys_as_ratio, dtype=object)
 
-    text_score_heatmap = image_utils.cvt2HeatmapImg(score_text)
-    link_score_heatmap = image_utils.cvt2HeatmapImg(score_link)
+def get_prediction_batch(
+    images,
+    craft_net,
+    refine_net=None,
+    text_threshold: float = 0.7,
+    link_threshold: float = 0.4,
+    low_text: float = 0.4,
+    cuda: bool = False,
+    long_size: int = 1280,
+    poly: bool = True,
+    max_workers: Optional[int] = None,
+    outputs: Optional[Iterable[str]] = None,
+):
+    """
+    Same as get_prediction for a list of images, with a single forward pass:
+    the resized images are padded to a shared canvas and stacked, then the
+    score maps are split and post-processed in a thread pool.
+
+    Arguments:
+        images: list of paths to the images to be processed or numpy arrays or PIL images
+        craft_net: craft net model
+        refine_net: refine net model
+        text_threshold: text confidence threshold
+        link_threshold: link confidence threshold
+        low_text: text low-bound score
+        cuda: Use cuda for inference
+        long_size: desired longest image size for inference
+        poly: enable polygon type
+        max_workers: number of post-processing threads, see concurrent.futures.ThreadPoolExecutor
+        outputs: outputs to compute among OUTPUTS, all of them by default
+    Output:
+        list of the outputs of get_prediction, one per image, in the same order,
+        "times" being the elapsed times of the sub modules for the whole batch
+    """
+    if len(images) == 0:
+        return []
+    outputs = _check_outputs(outputs)
+    t0 = time.time()
+
+    # read/convert images
+    images = [image_utils.read_image(image) for image in images]
+
+    # resize, then paste on a canvas shared by the batch
+    resized_images = [
+        image_utils.resize_aspect_ratio(image, long_size, interpolation=cv2.INTER_LINEAR)[:2]
+        for image in images
+    ]
+    canvas_h = max(img_resized.shape[0] for img_resized, _ in resized_images)
+    canvas_w = max(img_resized.shape[1] for img_resized, _ in resized_images)
+    batch = np.zeros((len(images), canvas_h, canvas_w, 3), dtype=np.float32)
+    for k, (img_resized, _) in enumerate(resized_images):
+        batch[k, : img_resized.shape[0], : img_resized.shape[1], :] = img_resized
+    resize_time = time.time() - t0
+    t0 = time.time()
+
+    # preprocessing
+    x = image_utils.normalizeMeanVariance(batch)
+    x = torch_utils.from_numpy(x).permute(0, 3, 1, 2)  # [b, h, w, c] to [b, c, h, w]
+    x = torch_utils.Variable(x)
+    if cuda:
+        x = x.cuda()
+    preprocessing_time = time.time() - t0
+    t0 = time.time()
+
+    # forward pass
+    with torch_utils.no_grad():
+        y, feature = craft_net(x)
+    craftnet_time = time.time() - t0
+    t0 = time.time()
+
+    # make score and link maps
+    scores_text = y[:, :, :, 0].cpu().data.numpy()
+    scores_link = y[:, :, :, 1].cpu().data.numpy()
+
+    # refine link
+    if refine_net is not None:
+        with torch_utils.no_grad():
+            y_refiner = refine_net(y, feature)
+        scores_link = y_refiner[:, :, :, 0].cpu().data.numpy()
+    refinenet_time = time.time() - t0
+    t0 = time.time()
+
+    # Post-processing of each image, on the part of the score maps covering it
+    def postprocess(k):
+        img_resized, target_ratio = resized_images[k]
+        map_h, map_w = img_resized.shape[0] // 2, img_resized.shape[1] // 2
+        return _postprocess_score_maps(
+            images[k],
+            scores_text[k, :map_h, :map_w],
+            scores_link[k, :map_h, :map_w],
+            1 / target_ratio,
+            1 / target_ratio,
+            text_threshold,
+            link_threshold,
+            low_text,
+            poly,
+            outputs,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        prediction_results = list(executor.map(postprocess, range(len(images))))
 
     postprocess_time = time.time() - t0
 
@@ -121,15 +222,73 @@ def get_prediction(
         "refinenet_time": refinenet_time,
         "postprocess_time": postprocess_time,
     }
+    instrumentation.record_stage_times("craft", times)
 
-    return {
-        "boxes": boxes,
-        "boxes_as_ratios": boxes_as_ratio,
-        "polys": polys,
-        "polys_as_ratios": polys_as_ratio,
-        "heatmaps": {
-            "text_score_heatmap": text_score_heatmap,
-            "link_score_heatmap": link_score_heatmap,
-        },
-        "times": times,
-    }
+    for prediction_result in prediction_results:
+        prediction_result["times"] = times
+    return prediction_results
+
+
+def _postprocess_score_maps(
+    image, score_text, score_link, ratio_w, ratio_h, text_threshold, link_threshold, low_text, poly, outputs
+):
+    """
+    Requested outputs (boxes, polygons, ratios, heatmaps) of the image from its
+    text and link score maps.
+    """
+    # polygons are only generated when requested, boxes being always needed
+    with_polys = "polys" in outputs or "polys_as_ratios" in outputs
+    boxes, polys = craft_utils.getDetBoxes(
+        score_text, score_link, text_threshold, link_threshold, low_text, poly and with_polys
+    )
+
+    # coordinate adjustment
+    boxes = craft_utils.adjustResultCoordinates(boxes, ratio_w, ratio_h)
+    prediction_result = {}
+    if "boxes" in outputs:
+        prediction_result["boxes"] = boxes
+    if with_polys:
+        polys = craft_utils.adjustResultCoordinates(polys, ratio_w, ratio_h)
+        for k in range(len(polys)):
+            if polys[k] is None:
+                polys[k] = boxes[k]
+        if "polys" in outputs:
+            prediction_result["polys"] = polys
+
+    # get image size
+    img_height = image.shape[0]
+    img_width = image.shape[1]
+
+    # calculate box coords as ratios to image size
+    if "boxes_as_ratios" in outputs:
+        boxes_as_ratio = []
+        for box in boxes:
+            boxes_as_ratio.append(box / [img_width, img_height])
+        prediction_result["boxes_as_ratios"] = np.array(boxes_as_ratio)
+
+    # calculate poly coords as ratios to image size
+    if "polys_as_ratios" in outputs:
+        polys_as_ratio = []
+        for poly in polys:
+            polys_as_ratio.append(poly / [img_width, img_height])
+        prediction_result["polys_as_ratios"] = np.array(polys_as_ratio, dtype=object)
+
+    if "heatmaps" in outputs:
+        prediction_result["heatmaps"] = {
+            "text_score_heatmap": image_utils.cvt2HeatmapImg(score_text),
+            "link_score_heatmap": image_utils.cvt2HeatmapImg(score_link),
+        }
+
+    return prediction_result
+
+
+def _check_outputs(outputs):
+    """
+    Set of the requested outputs, all of them if outputs is None.
+    """
+    if outputs is None:
+        return set(OUTPUTS)
+    unknown_outputs = set(outputs) - set(OUTPUTS)
+    if unknown_outputs:
+        raise ValueError(f"Unknown outputs {sorted(unknown_outputs)}, available outputs are {OUTPUTS}")
+    return set(outputs)
@@ -0,0 +1,161 @@
+"""
+Equivalence of the vectorised craft_utils.getDetBoxes_core with the
+per-component loop of the upstream craft-text-detector it replaces.
+"""
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+from src.models.craft_text_detector.craft_utils import getDetBoxes_core
+
+
+def getDetBoxes_core_with_loop(textmap, linkmap, text_threshold, link_threshold, low_text):
+    """Former getDetBoxes_core, scanning the whole map for each component."""
+    # prepare data
+    linkmap = linkmap.copy()
+    textmap = textmap.copy()
+    img_h, img_w = textmap.shape
+
+    # labeling method
+    ret, text_score = cv2.threshold(textmap, low_text, 1, 0)
+    ret, link_score = cv2.threshold(linkmap, link_threshold, 1, 0)
+
+    text_score_comb = np.clip(text_score + link_score, 0, 1)
+    nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        text_score_comb.astype(np.uint8), connectivity=4
+    )
+
+    det = []
+    mapper = []
+    for k in range(1, nLabels):
+        # size filtering
+        size = stats[k, cv2.CC_STAT_AREA]
+        if size < 10:
+            continue
+
+        # thresholding
+        if np.max(textmap[labels == k]) < text_threshold:
+            continue
+
+        # make segmentation map
+        segmap = np.zeros(textmap.shape, dtype=np.uint8)
+        segmap[labels == k] = 255
+
+        # remove link area
+        segmap[np.logical_and(link_score == 1, text_score == 0)] = 0
+
+        x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
+        w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
+        niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
+        sx, ex, sy, ey = (x - niter, x + w + niter + 1, y - niter, y + h + niter + 1)
+        # boundary check
+        if sx < 0:
+            sx = 0
+        if sy < 0:
+            sy = 0
+        if ex >= img_w:
+            ex = img_w
+        if ey >= img_h:
+            ey = img_h
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1 + niter, 1 + niter))
+        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+
+        # make box
+        np_temp = np.roll(np.array(np.where(segmap != 0)), 1, axis=0)
+        np_contours = np_temp.transpose().reshape(-1, 2)
+        rectangle = cv2.minAreaRect(np_contours)
+        box = cv2.boxPoints(rectangle)
+
+        # boundary check due to minAreaRect may have out of range values
+        # (see https://docs.opencv.org/3.4/d3/dc0/group__imgproc__shape.html#ga3d476a3417130ae5154aea421ca7ead9)
+        for p in box:
+            if p[0] < 0:
+                p[0] = 0
+            if p[1] < 0:
+                p[1] = 0
+            if p[0] >= img_w:
+                p[0] = img_w
+            if p[1] >= img_h:
+                p[1] = img_h
+
+        # align diamond-shape
+        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
+        box_ratio = max(w, h) / (min(w, h) + 1e-5)
+        if abs(1 - box_ratio) <= 0.1:
+            l, r = min(np_contours[:, 0]), max(np_contours[:, 0])
+            t, b = min(np_contours[:, 1]), max(np_contours[:, 1])
+            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
+
+        # make clock-wise order
+        startidx = box.sum(axis=1).argmin()
+        box = np.roll(box, 4 - startidx, 0)
+        box = np.array(box)
+
+        det.append(box)
+        mapper.append(k)
+
+    return det, labels, mapper
+
+
+def synthetic_maps(rng, height, width, components_count):
+    """Blurred ellipses of random scores as text map, and random segments
+    joining them as link map, some of them crossing the map borders."""
+    textmap = np.zeros((height, width), np.float32)
+    linkmap = np.zeros((height, width), np.float32)
+    for _ in range(components_count):
+        cx, cy = int(rng.integers(-5, width + 5)), int(rng.integers(-5, height + 5))
+        ax, ay = int(rng.integers(2, 30)), int(rng.integers(2, 12))
+        cv2.ellipse(textmap, (cx, cy), (ax, ay), float(rng.uniform(-30, 30)), 0, 360,
+                    float(rng.uniform(0.3, 1.0)), -1)
+        cv2.line(linkmap, (cx, cy), (cx + int(rng.integers(-40, 40)), cy + int(rng.integers(-5, 5))),
+                 float(rng.uniform(0.2, 1.0)), 2)
+    return cv2.GaussianBlur(textmap, (5, 5), 0), linkmap
+
+
+def assert_same_detections(textmap, linkmap, text_threshold=0.7, link_threshold=0.4, low_text=0.4):
+    boxes, labels, mapper = getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
+    expected_boxes, expected_labels, expected_mapper = getDetBoxes_core_with_loop(
+        textmap, linkmap, text_threshold, link_threshold, low_text
+    )
+    assert mapper == expected_mapper
+    np.testing.assert_array_equal(labels, expected_labels)
+    assert len(boxes) == len(expected_boxes)
+    for box, expected_box in zip(boxes, expected_boxes):
+        assert box.dtype == expected_box.dtype
+        np.testing.assert_array_equal(box, expected_box)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("height, width, components_count", [(50, 60, 5), (300, 400, 80), (600, 500, 400)])
+def test_getDetBoxes_core_is_the_loop(seed, height, width, components_count):
+    rng = np.random.default_rng(seed)
+    textmap, linkmap = synthetic_maps(rng, height, width, components_count)
+    assert_same_detections(textmap, linkmap)
+
+
+@pytest.mark.parametrize("text_threshold, link_threshold, low_text", [(0.5, 0.2, 0.2), (0.9, 0.6, 0.6)])
+def test_getDetBoxes_core_is_the_loop_for_other_thresholds(text_threshold, link_threshold, low_text):
+    textmap, linkmap = synthetic_maps(np.random.default_rng(0), 300, 400, 120)
+    assert_same_detections(textmap, linkmap, text_threshold, link_threshold, low_text)
+
+
+def test_small_square_and_border_components():
+    textmap = np.zeros((40, 40), np.float32)
+    linkmap = np.zeros((40, 40), np.float32)
+    # component of less than 10 pixels, ignored
+    textmap[2:4, 2:5] = 1.0
+    # square component, whose box is aligned on the axes
+    textmap[10:20, 10:20] = 1.0
+    # component on the bottom right corner
+    textmap[34:40, 30:40] = 0.8
+    # component below the text threshold
+    textmap[25:30, 2:12] = 0.5
+    assert_same_detections(textmap, linkmap)
+
+
+def test_empty_maps():
+    textmap = np.zeros((30, 20), np.float32)
+    boxes, labels, mapper = getDetBoxes_core(textmap, textmap.copy(), 0.7, 0.4, 0.4)
+    assert boxes == [] and mapper == [] and not labels.any()
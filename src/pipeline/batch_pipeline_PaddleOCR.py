@@ -0,0 +1,417 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Callable, Dict, Final, List, Optional
+# importe le module d'analyse des arguments de la ligne de commande
+import argparse
+# importe le module de recherche de chemins selon des motifs de type shell
+import glob
+import json
+import logging
+import os.path
+# importe le module des files d'attente synchronisées entre fils d'exécution
+import queue
+# importe le module des fils d'exécution (threads)
+import threading
+# importe le module de mesure du temps courant
+import time
+import paddleocr
+import src.util.utils as utils
+import src.util.document_loader as documentLoader
+import src.util.instrumentation as instrumentation
+import src.models.classify_form.PaddleOCR_TextMatch.classify as ocrExtractor
+import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+
+
+# --- Constantes ---#
+# extensions des documents acceptés en entrée du traitement par lots
+VALID_INPUT_DOCUMENT_EXTENSIONS: Final[List[str]] = [".pdf"] + utils.VALID_OUTPUT_IMAGE_EXTENSIONS
+# noms des champs d'une ligne d'un manifeste JSONL pouvant contenir le chemin d'un document à traiter
+MANIFEST_DOCUMENT_PATH_FIELD_NAMES: Final[List[str]] = ["input_document_path", "path", "file_name"]
+# qualité en dpi de l'image générée à partir de chaque document
+DOCUMENT_IMAGE_QUALITY_IN_DPI: Final[int] = 350
+# marqueur de fin de flux transmis d'une étape à la suivante
+_END_OF_STREAM: Final[object] = object()
+
+
+def list_input_documents(input_source: str) -> List[str]:
+    r"""Retourne la liste des chemins des documents à traiter à partir de `input_source`, qui peut être :
+    - un répertoire, dont tous les documents d'extension acceptée sont retenus,
+    - un manifeste JSONL (extension ".jsonl"), dont chaque ligne est un objet JSON indiquant le chemin d'un document
+      dans l'un des champs `MANIFEST_DOCUMENT_PATH_FIELD_NAMES` ; les chemins relatifs sont résolus par rapport au
+      répertoire du manifeste,
+    - un motif de recherche de chemins (glob), par exemple "./data/synthetic_forms/*.jpg".
+
+    Parameters
+    ----------
+    input_source : str
+        le répertoire, le manifeste JSONL ou le motif de recherche des documents à traiter.
+
+    Returns
+    -------
+    list of str
+        la liste triée des chemins des documents à traiter.
+    """
+    if os.path.isdir(input_source):
+        return sorted(
+            os.path.join(input_source, file_name) for file_name in os.listdir(input_source)
+            if os.path.splitext(file_name)[1].lower() in VALID_INPUT_DOCUMENT_EXTENSIONS
+        )
+    if os.path.isfile(input_source) and input_source.lower().endswith(".jsonl"):
+        manifest_dir_path_str: str = os.path.dirname(input_source)
+        input_document_paths: List[str] = []
+        with open(input_source, "r") as manifest_file:
+            for manifest_line_number, manifest_line in enumerate(manifest_file, start=1):
+                if not manifest_line.strip():
+                    continue
+                manifest_entry: Dict = json.loads(manifest_line)
+                document_path_field_names: List[str] = \
+                    [field_name for field_name in MANIFEST_DOCUMENT_PATH_FIELD_NAMES if field_name in manifest_entry]
+                if not document_path_field_names:
+                    raise ValueError(f"La ligne {manifest_line_number} du manifeste {input_source} n'indique aucun chemin "
+                                     f"de document parmi les champs {MANIFEST_DOCUMENT_PATH_FIELD_NAMES}")
+                input_document_paths.append(
+                    os.path.join(manifest_dir_path_str, manifest_entry[document_path_field_names[0]])
+                )
+        return input_document_paths
+    return sorted(
+        document_path for document_path in glob.glob(input_source)
+        if os.path.splitext(document_path)[1].lower() in VALID_INPUT_DOCUMENT_EXTENSIONS
+    )
+
+
+class BatchStageStatistics:
+    r"""Statistiques d'exécution d'une étape du traitement par lots : nombre de documents traités, nombre d'erreurs et
+    temps d'occupation cumulé des travailleurs de l'étape."""
+
+    def __init__(self, stage_name_str: str, workers_count: int):
+        self.stage_name_str = stage_name_str
+        self.workers_count = workers_count
+        self.processed_documents_count = 0
+        self.failed_documents_count = 0
+        self.busy_time_in_seconds = 0.
+        self._lock = threading.Lock()
+
+    def record(self, busy_time_in_seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.processed_documents_count += 1
+            self.busy_time_in_seconds += busy_time_in_seconds
+            if failed:
+                self.failed_documents_count += 1
+
+    def get_throughput(self) -> float:
+        r"""Retourne le débit de l'étape, en documents par seconde, en considérant ses travailleurs occupés en parallèle."""
+        if self.busy_time_in_seconds == 0:
+            return 0.
+        return self.processed_documents_count * self.workers_count / self.busy_time_in_seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.stage_name_str,
+            "workers": self.workers_count,
+            "processed_documents": self.processed_documents_count,
+            "failed_documents": self.failed_documents_count,
+            "busy_time_in_seconds": round(self.busy_time_in_seconds, 3),
+            "documents_per_second": round(self.get_throughput(), 3)
+        }
+
+
+class _BatchStage:
+    r"""Etape du traitement par lots : `workers_count` fils d'exécution lisent les tâches de la file d'entrée, leur
+    appliquent `stage_function` et les déposent dans la file de sortie. Une tâche en erreur est transmise telle quelle
+    aux étapes suivantes, qui l'ignorent jusqu'à l'écriture de son résultat."""
+
+    def __init__(
+        self,
+        stage_name_str: str,
+        stage_function: Callable[[List[Dict]], None],
+        input_queue: queue.Queue,
+        output_queue: queue.Queue,
+        workers_count: int = 1,
+        batch_size: int = 1
+    ):
+        self.stage_function = stage_function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.batch_size = batch_size
+        self.statistics = BatchStageStatistics(stage_name_str, workers_count)
+        self._remaining_workers_count = workers_count
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"{stage_name_str}-{worker_index}", daemon=True)
+            for worker_index in range(workers_count)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _get_jobs(self) -> List:
+        r"""Retourne jusqu'à `batch_size` tâches de la file d'entrée, en attendant la première d'entre elles."""
+        jobs: List = [self.input_queue.get()]
+        while len(jobs) < self.batch_size and jobs[-1] is not _END_OF_STREAM:
+            try:
+                jobs.append(self.input_queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _work(self) -> None:
+        while True:
+            jobs: List = self._get_jobs()
+            end_of_stream: bool = jobs[-1] is _END_OF_STREAM
+            if end_of_stream:
+                jobs.pop()
+            jobs_to_process: List[Dict] = [job for job in jobs if job["error"] is None]
+            if jobs_to_process:
+                lBeforeProcessTime = time.perf_counter()
+                try:
+                    self.stage_function(jobs_to_process)
+                except Exception as lException:
+                    logging.exception(f"Erreur lors de l'étape {self.statistics.stage_name_str}")
+                    for job in jobs_to_process:
+                        job["error"] = f"{self.statistics.stage_name_str}: {lException!r}"
+                busy_time_per_job: float = (time.perf_counter() - lBeforeProcessTime) / len(jobs_to_process)
+                for job in jobs_to_process:
+                    self.statistics.record(busy_time_per_job, failed=job["error"] is not None)
+            for job in jobs:
+                self.output_queue.put(job)
+            if end_of_stream:
+                # réinsère le marqueur de fin de flux pour les autres travailleurs de l'étape, le dernier d'entre eux
+                # le transmettant à l'étape suivante
+                with self._lock:
+                    self._remaining_workers_count -= 1
+                    last_worker: bool = self._remaining_workers_count == 0
+                (self.output_queue if last_worker else self.input_queue).put(_END_OF_STREAM)
+                return
+
+
+def _run_on_each_job(job_function: Callable[[Dict], None]) -> Callable[[List[Dict]], None]:
+    r"""Transforme une fonction traitant une tâche en une fonction d'étape traitant une liste de tâches, en isolant les
+    erreurs de chaque tâche."""
+    def stage_function(jobs: List[Dict]) -> None:
+        for job in jobs:
+            try:
+                job_function(job)
+            except Exception as lException:
+                logging.warning(f"Erreur lors du traitement du document {job['input_document_path']} : {lException!r}")
+                job["error"] = repr(lException)
+    return stage_function
+
+
+def _render_document(job: Dict) -> None:
+    # un document de plusieurs pages est extrait page par page par l'étape d'OCRisation (voir _get_ocr_function)
+    if utils.get_document_page_count(job["input_document_path"]) > 1:
+        job["is_multipage"] = True
+        return
+    # lit directement la couche texte et les champs remplis d'un document PDF numérique, qui n'est alors ni rendu ni
+    # OCRisé
+    text_layer: Optional[documentLoader.PdfPageTextLayer] = documentLoader.load_document_text_layer(
+        input_document_path=job["input_document_path"],
+        image_quality_in_dpi=DOCUMENT_IMAGE_QUALITY_IN_DPI
+    )
+    if text_layer is not None:
+        job["text_elements"], job["text_boxes"] = text_layer.text_elements, text_layer.text_boxes
+        return
+    # charge le document en entrée en mémoire sous la forme d'une image, sans passer par un fichier temporaire
+    job["image"] = utils.get_image_array_from_document(
+        input_document_path=job["input_document_path"],
+        image_quality_in_dpi=DOCUMENT_IMAGE_QUALITY_IN_DPI
+    )
+
+
+def _identify_form(job: Dict) -> None:
+    if job.get("is_multipage"):
+        return
+    job["form_number"] = ocrExtractor.get_form_number_in_text_elements(
+        input_document_path=job["input_document_path"],
+        text_elements=job["text_elements"]
+    )
+
+
+def _get_alignment_and_fields_function(configuration_files_dir_path: str) -> Callable[[Dict], None]:
+    def align_document_and_extract_fields(job: Dict) -> None:
+        if job.get("is_multipage"):
+            return
+        # seule la matrice de transformation est nécessaire à l'extraction des champs : l'image n'est pas transformée ;
+        # un alignement peu fiable lève une ValueError, enregistrée comme erreur du document
+        job["fields"], alignment_fit = ocrPipeline.align_and_extract_fields(
+            input_document_path_str=job["input_document_path"],
+            form_number_str=job["form_number"],
+            input_document_text_elements=job["text_elements"],
+            input_document_text_boxes=job["text_boxes"],
+            configuration_files_dir_path_str=configuration_files_dir_path
+        )
+        job["alignment"] = alignment_fit.to_dict()
+    return align_document_and_extract_fields
+
+
+def _get_ocr_function(ocr_model: paddleocr.PaddleOCR, configuration_files_dir_path: str) -> Callable[[Dict], None]:
+    def ocrize_document(job: Dict) -> None:
+        if job.get("is_multipage"):
+            # les pages sont rendues, OCRisées, identifiées et alignées une à une par le fil d'exécution de l'unique
+            # modèle d'OCR, les champs étant réunis par numéro CERFA
+            document_record: Dict = ocrPipeline.extract_multipage_document(
+                input_document_path=job["input_document_path"],
+                configuration_files_dir_path=configuration_files_dir_path,
+                ocr_model=ocr_model,
+                image_quality_in_dpi=DOCUMENT_IMAGE_QUALITY_IN_DPI
+            )
+            job["pages"], job["fields"] = document_record["pages"], document_record["fields"]
+            job["form_number"] = next((page_record["form_number"] for page_record in job["pages"]
+                                       if page_record["form_number"] is not None), None)
+            return
+        # la couche texte d'un document PDF numérique a déjà été lue par l'étape de rendu
+        if "text_elements" in job:
+            return
+        job["text_elements"], job["text_boxes"] = \
+            ocrPipeline.get_form_image_text_elements_and_boxes(job["image"], ocr_model)
+        # libère l'image dès que possible, les étapes suivantes n'en ayant pas besoin
+        del job["image"]
+    return ocrize_document
+
+
+def extract_documents_in_batch(
+    input_source: str,
+    configuration_files_dir_path: str,
+    ocr_model: paddleocr.PaddleOCR,
+    output_jsonl_path: str,
+    render_workers_count: int = 4,
+    alignment_workers_count: int = 4,
+    ocr_batch_size: int = 4,
+    queue_size: int = 16
+) -> List[BatchStageStatistics]:
+    r"""Extrait les champs de tous les documents désignés par `input_source` (voir `list_input_documents`) et écrit un
+    résultat par document dans le fichier JSONL `output_jsonl_path`.
+
+    Les étapes suivantes s'enchaînent en flux, séparées par des files d'attente bornées à `queue_size` documents :
+    - le rendu de chaque document en image conservée en mémoire, par `render_workers_count` travailleurs, ou la lecture
+      directe de la couche texte d'un document PDF numérique (voir `documentLoader.load_document_text_layer`), qui n'est
+      alors pas OCRisé,
+    - l'OCRisation par l'unique modèle `ocr_model`, qui traite les images par lots d'au plus `ocr_batch_size` images
+      afin de rester occupé tant que des images sont prêtes,
+    - l'extraction du numéro CERFA,
+    - la transformation affine et l'extraction des champs, par `alignment_workers_count` travailleurs,
+    - l'écriture des résultats.
+    Une erreur sur un document n'interrompt pas le traitement : elle est indiquée dans la ligne de résultat dudit document.
+
+    Un document PDF de plusieurs pages n'est pas rendu par l'étape de rendu : ses pages sont rendues, OCRisées,
+    identifiées et alignées une à une par l'étape d'OCRisation (voir `ocrPipeline.extract_multipage_document`), et sa
+    ligne de résultat indique l'enregistrement de chaque page (`pages`) et les champs de toutes les pages réunis par
+    numéro CERFA.
+
+    Parameters
+    ----------
+    input_source : str
+        le répertoire, le manifeste JSONL ou le motif de recherche des documents à traiter.
+    configuration_files_dir_path : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser, chargé une seule fois.
+    output_jsonl_path : str
+        le chemin du fichier JSONL des résultats.
+    render_workers_count : int, default=4
+        le nombre de travailleurs de l'étape de rendu.
+    alignment_workers_count : int, default=4
+        le nombre de travailleurs de l'étape de transformation affine et d'extraction des champs.
+    ocr_batch_size : int, default=4
+        le nombre maximal d'images traitées à la suite par le modèle d'OCR.
+    queue_size : int, default=16
+        le nombre maximal de documents en attente entre deux étapes.
+
+    Returns
+    -------
+    list of BatchStageStatistics
+        les statistiques d'exécution de chaque étape.
+    """
+    input_document_paths: List[str] = list_input_documents(input_source)
+    logging.info(f"{len(input_document_paths)} documents à traiter depuis {input_source}")
+
+    queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(5)]
+    stages: List[_BatchStage] = [
+        _BatchStage("render", _run_on_each_job(_render_document), queues[0], queues[1],
+                    workers_count=render_workers_count),
+        _BatchStage("ocr", _run_on_each_job(_get_ocr_function(ocr_model, configuration_files_dir_path)),
+                    queues[1], queues[2], batch_size=ocr_batch_size),
+        _BatchStage("identification", _run_on_each_job(_identify_form), queues[2], queues[3]),
+        _BatchStage("alignment", _run_on_each_job(_get_alignment_and_fields_function(configuration_files_dir_path)),
+                    queues[3], queues[4], workers_count=alignment_workers_count)
+    ]
+    for stage in stages:
+        stage.start()
+
+    def feed_input_queue() -> None:
+        for input_document_path in input_document_paths:
+            queues[0].put({"input_document_path": input_document_path, "error": None})
+        queues[0].put(_END_OF_STREAM)
+
+    feeder_thread = threading.Thread(target=feed_input_queue, name="feeder", daemon=True)
+    feeder_thread.start()
+
+    lBeforeProcessTime = time.perf_counter()
+    written_results_count: int = 0
+    with open(output_jsonl_path, "w") as output_jsonl_file:
+        while True:
+            job = queues[-1].get()
+            if job is _END_OF_STREAM:
+                break
+            output_jsonl_file.write(json.dumps({
+                "input_document_path": job["input_document_path"],
+                "form_number": job.get("form_number"),
+                "alignment": job.get("alignment"),
+                "fields": job.get("fields"),
+                "pages": job.get("pages"),
+                "error": job["error"]
+            }, ensure_ascii=False) + "\n")
+            written_results_count += 1
+    total_time_in_seconds: float = time.perf_counter() - lBeforeProcessTime
+
+    feeder_thread.join()
+    for stage in stages:
+        stage.join()
+    stages_statistics: List[BatchStageStatistics] = [stage.statistics for stage in stages]
+    for stage_statistics in stages_statistics:
+        logging.info(f"Etape {stage_statistics.stage_name_str} : {stage_statistics.to_dict()}")
+    logging.info(f"{written_results_count} résultats écrits dans {output_jsonl_path} en {round(total_time_in_seconds, 2)} "
+                 f"secondes, soit {round(written_results_count / max(total_time_in_seconds, 1e-9), 3)} documents par seconde")
+    return stages_statistics
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Extraction par lots des champs de formulaires CERFA avec PaddleOCR")
+    parser.add_argument("input_source", help="répertoire, manifeste JSONL ou motif de recherche des documents à traiter")
+    parser.add_argument("output_jsonl_path", help="fichier JSONL des résultats, à raison d'une ligne par document")
+    parser.add_argument("--configuration_files_dir_path", default="./data/configs_extraction")
+    parser.add_argument("--render_workers", default=4, type=int)
+    parser.add_argument("--alignment_workers", default=4, type=int)
+    parser.add_argument("--ocr_batch_size", default=4, type=int)
+    parser.add_argument("--queue_size", default=16, type=int)
+    parser.add_argument("--metrics_file", default=None,
+                        help="fichier où écrire, à la fin du traitement, les métriques des étapes au format Prometheus")
+    parser.add_argument("--spans_file", default=None,
+                        help="fichier JSONL où exporter un span par exécution d'étape")
+    parsed_arguments = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.INFO)
+    if parsed_arguments.spans_file is not None:
+        instrumentation.metrics_registry.enable_span_export(parsed_arguments.spans_file)
+    ocr_model: paddleocr.PaddleOCR = paddleocr.PaddleOCR(use_angle_cls=True, lang='fr')
+    stages_statistics: List[BatchStageStatistics] = extract_documents_in_batch(
+        input_source=parsed_arguments.input_source,
+        configuration_files_dir_path=parsed_arguments.configuration_files_dir_path,
+        ocr_model=ocr_model,
+        output_jsonl_path=parsed_arguments.output_jsonl_path,
+        render_workers_count=parsed_arguments.render_workers,
+        alignment_workers_count=parsed_arguments.alignment_workers,
+        ocr_batch_size=parsed_arguments.ocr_batch_size,
+        queue_size=parsed_arguments.queue_size
+    )
+    print(json.dumps([stage_statistics.to_dict() for stage_statistics in stages_statistics], indent=2))
+    if parsed_arguments.metrics_file is not None:
+        instrumentation.metrics_registry.write_prometheus_metrics(parsed_arguments.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
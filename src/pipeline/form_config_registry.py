@@ -0,0 +1,196 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Dict, Final, List, Optional, Tuple
+import logging
+import os
+# importe le module des expressions régulières
+import re
+# importe le module des fils d'exécution (threads)
+import threading
+import numpy as np
+import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+from src.util.spatial_index import UniformGridIndex
+
+
+# --- Constantes ---#
+# expression régulière du nom d'un fichier de configuration JSON d'un formulaire CERFA, dont le groupe capture le numéro,
+# suivi, pour les pages suivant la première d'un formulaire de plusieurs pages, du numéro de la page (ex. 12485_03_p2)
+FORM_CONFIG_FILE_NAME_REGEXP: Final[str] = r"^cerfa_(\d{5}_\d{2}(?:_p\d+)?)\.json$"
+# intervalle par défaut, en secondes, entre deux vérifications des dates de modification des fichiers de configuration
+DEFAULT_WATCH_INTERVAL_IN_SECONDS: Final[float] = 30.
+
+
+class CompiledFormConfig:
+    r"""Configuration d'un formulaire CERFA lue une seule fois, dont les coordonnées sont précalculées :
+    - `reference_points` : tableau float32 (N, 2) des centres des boîtes entourant les éléments de texte de référence,
+    - `field_boxes` : tableau float32 (M, 4) des rectangles (x0, y0, x1, y1) de toutes les boîtes des champs à extraire,
+    - `field_box_field_indices` : tableau int32 (M,) de l'indice, dans `field_names`, du champ de chaque boîte,
+    - `field_boxes_index` : index spatial (grille uniforme) des boîtes des champs, construit une seule fois,
+    - `identification_strips` : bandes de page où chercher le numéro CERFA, déclarées par le fichier.
+    Le dictionnaire `form_config_dict` conserve le format retourné par `read_form_config_file`."""
+
+    def __init__(self, form_number_str: str, form_config_file_path_str: str, modification_time_ns: int):
+        self.form_number_str = form_number_str
+        self.form_config_file_path_str = form_config_file_path_str
+        self.modification_time_ns = modification_time_ns
+        self.form_config_dict: Dict = ocrPipeline.read_form_config_file(form_config_file_path=form_config_file_path_str)
+        self.reference_texts: List[str] = self.form_config_dict[ocrPipeline.FORM_REFERENCE_TEXTS_FIELD_NAME_STR]
+        self.reference_boxes: List[List[Tuple[int, int]]] = \
+            self.form_config_dict[ocrPipeline.FORM_REFERENCE_BOXES_FIELD_NAME_STR]
+        self.reference_size: Tuple[int, int] = self.form_config_dict[ocrPipeline.FORM_REFERENCE_SIZE_FIELD_NAME_STR]
+        if len(self.reference_texts) < 3 or len(self.reference_texts) != len(self.reference_boxes):
+            raise ValueError(f"{len(self.reference_texts)} éléments de texte de référence et "
+                             f"{len(self.reference_boxes)} boîtes de référence, au moins 3 de chaque sont attendus")
+        if len(self.reference_texts) < ocrPipeline.ALIGNMENT_MIN_INLIERS_COUNT:
+            logging.warning(f"Le fichier de configuration {form_config_file_path_str} n'a que {len(self.reference_texts)} "
+                            f"éléments de texte de référence : l'alignement sur ce formulaire, qui en exige "
+                            f"{ocrPipeline.ALIGNMENT_MIN_INLIERS_COUNT} bien placés, sera toujours rejeté")
+        self.reference_points: np.ndarray = np.array(self.reference_boxes, dtype=np.float32).mean(axis=1)
+        self.field_names, self.field_boxes, self.field_box_field_indices = ocrPipeline.pack_field_rectangles(
+            self.form_config_dict[ocrPipeline.FORM_FIELDS_TO_EXTRACT_FIELD_NAME_STR]
+        )
+        self.field_boxes_index: UniformGridIndex = UniformGridIndex(self.field_boxes)
+        self.identification_strips: List[Tuple[float, float]] = \
+            self.form_config_dict[ocrPipeline.FORM_IDENTIFICATION_STRIPS_FIELD_NAME_STR]
+        if any(not 0. <= y0_ratio < y1_ratio <= 1. for y0_ratio, y1_ratio in self.identification_strips):
+            raise ValueError(f"Bandes d'identification {self.identification_strips} invalides, des fractions "
+                             f"(début, fin) de la hauteur de la page sont attendues")
+
+
+class FormConfigRegistry:
+    r"""Registre des configurations des formulaires CERFA d'un répertoire, chargées une seule fois.
+
+    La recherche d'une configuration par numéro CERFA (`get`) est un simple accès à un dictionnaire qui ne touche pas au
+    système de fichiers. Les fichiers modifiés, ajoutés ou supprimés sont pris en compte par `refresh`, appelée
+    périodiquement par un fil d'exécution de surveillance une fois `start_watching` appelée. Le dictionnaire des
+    configurations est remplacé d'un bloc à chaque rechargement, si bien que les lectures concurrentes n'ont pas besoin
+    de verrou."""
+
+    def __init__(self, configuration_files_dir_path_str: str):
+        self.configuration_files_dir_path_str = configuration_files_dir_path_str
+        self._form_configs: Dict[str, CompiledFormConfig] = {}
+        self._refresh_lock = threading.Lock()
+        self._stop_watching_event = threading.Event()
+        self._watching_thread: Optional[threading.Thread] = None
+        self.refresh()
+
+    def __contains__(self, form_number_str: str) -> bool:
+        return form_number_str in self._form_configs
+
+    def get(self, form_number_str: str) -> Optional[CompiledFormConfig]:
+        r"""Retourne la configuration du formulaire de numéro CERFA `form_number_str`, ou None si elle n'existe pas."""
+        return self._form_configs.get(form_number_str)
+
+    def get_form_numbers(self) -> List[str]:
+        return sorted(self._form_configs.keys())
+
+    def get_identification_strips(self) -> List[Tuple[float, float]]:
+        r"""Retourne les bandes de page où chercher le numéro CERFA déclarées par l'ensemble des configurations, le
+        formulaire n'étant pas encore connu lorsqu'elles servent."""
+        return list(dict.fromkeys(identification_strip for form_config in self._form_configs.values()
+                                  for identification_strip in form_config.identification_strips))
+
+    def refresh(self) -> List[str]:
+        r"""Recharge les fichiers de configuration dont la date de modification a changé, charge les nouveaux fichiers et
+        oublie les fichiers supprimés. Un fichier de configuration invalide est ignoré et signalé dans les logs, la
+        configuration précédemment chargée étant alors conservée.
+
+        Returns
+        -------
+        list of str
+            les numéros CERFA des configurations (re)chargées.
+        """
+        with self._refresh_lock:
+            form_configs: Dict[str, CompiledFormConfig] = {}
+            reloaded_form_numbers: List[str] = []
+            with os.scandir(self.configuration_files_dir_path_str) as directory_entries:
+                for directory_entry in directory_entries:
+                    match = re.match(FORM_CONFIG_FILE_NAME_REGEXP, directory_entry.name)
+                    if match is None or not directory_entry.is_file():
+                        continue
+                    form_number_str: str = match.group(1)
+                    modification_time_ns: int = directory_entry.stat().st_mtime_ns
+                    current_form_config: Optional[CompiledFormConfig] = self._form_configs.get(form_number_str)
+                    if current_form_config is not None and current_form_config.modification_time_ns == modification_time_ns:
+                        form_configs[form_number_str] = current_form_config
+                        continue
+                    try:
+                        form_configs[form_number_str] = \
+                            CompiledFormConfig(form_number_str, directory_entry.path, modification_time_ns)
+                        reloaded_form_numbers.append(form_number_str)
+                    except (KeyError, ValueError, TypeError, IndexError) as lException:
+                        logging.warning(f"Le fichier de configuration {directory_entry.path} est invalide et a été "
+                                        f"ignoré : {lException!r}")
+                        if current_form_config is not None:
+                            form_configs[form_number_str] = current_form_config
+            self._form_configs = form_configs
+        if reloaded_form_numbers:
+            logging.info(f"Configurations (re)chargées depuis {self.configuration_files_dir_path_str} : {reloaded_form_numbers}")
+        return reloaded_form_numbers
+
+    def start_watching(self, watch_interval_in_seconds: float = DEFAULT_WATCH_INTERVAL_IN_SECONDS) -> None:
+        r"""Démarre un fil d'exécution qui appelle `refresh` toutes les `watch_interval_in_seconds` secondes."""
+        if self._watching_thread is not None:
+            return
+        self._stop_watching_event.clear()
+
+        def watch() -> None:
+            while not self._stop_watching_event.wait(watch_interval_in_seconds):
+                try:
+                    self.refresh()
+                except OSError:
+                    logging.exception(f"Impossible de relire le répertoire {self.configuration_files_dir_path_str}")
+
+        self._watching_thread = threading.Thread(target=watch, name="form-config-registry-watcher", daemon=True)
+        self._watching_thread.start()
+
+    def stop_watching(self) -> None:
+        if self._watching_thread is None:
+            return
+        self._stop_watching_event.set()
+        self._watching_thread.join()
+        self._watching_thread = None
+
+
+# registres partagés, indexés par chemin absolu du répertoire des fichiers de configuration
+_form_config_registries: Dict[str, FormConfigRegistry] = {}
+_form_config_registries_lock = threading.Lock()
+
+
+def get_form_config_registry(
+    configuration_files_dir_path_str: str,
+    watch_interval_in_seconds: Optional[float] = DEFAULT_WATCH_INTERVAL_IN_SECONDS
+) -> FormConfigRegistry:
+    r"""Retourne le registre partagé des configurations du répertoire `configuration_files_dir_path_str`, créé lors du
+    premier appel puis réutilisé par tous les appels suivants.
+
+    Parameters
+    ----------
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA.
+    watch_interval_in_seconds : float, optional, default=DEFAULT_WATCH_INTERVAL_IN_SECONDS
+        l'intervalle entre deux vérifications des dates de modification des fichiers, ou None pour ne pas surveiller le
+        répertoire lors de la création du registre.
+
+    Returns
+    -------
+    FormConfigRegistry
+        le registre des configurations du répertoire.
+    """
+    registry_key_str: str = os.path.abspath(configuration_files_dir_path_str)
+    with _form_config_registries_lock:
+        form_config_registry: Optional[FormConfigRegistry] = _form_config_registries.get(registry_key_str)
+        if form_config_registry is None:
+            form_config_registry = FormConfigRegistry(configuration_files_dir_path_str)
+            if watch_interval_in_seconds is not None:
+                form_config_registry.start_watching(watch_interval_in_seconds)
+            _form_config_registries[registry_key_str] = form_config_registry
+    return form_config_registry
+
+
+def refresh_form_config_registry(configuration_files_dir_path_str: str) -> None:
+    r"""Recharge sans attendre le registre partagé du répertoire `configuration_files_dir_path_str`, s'il existe, par
+    exemple après l'écriture d'un fichier de configuration."""
+    form_config_registry: Optional[FormConfigRegistry] = \
+        _form_config_registries.get(os.path.abspath(configuration_files_dir_path_str))
+    if form_config_registry is not None:
+        form_config_registry.refresh()
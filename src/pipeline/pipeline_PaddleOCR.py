@@ -1,5 +1,5 @@
 # importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
-from typing import Dict, Final, List, Optional, Tuple
+from typing import Dict, Final, List, Optional, Tuple, Union
 import os.path
 import json
 import tempfile
@@ -7,28 +7,66 @@ import paddleocr
 import cv2
 import numpy as np
 import src.util.utils as utils
+import src.util.document_loader as documentLoader
+import src.util.box_matching as boxMatching
+import src.util.instrumentation as instrumentation
+import src.util.ocr_cache as ocrCache
+from src.util.spatial_index import UniformGridIndex
 import src.models.auto_rotation_translation.functions as ocrFunctions
 import src.models.classify_form.PaddleOCR_TextMatch.classify as ocrExtractor
 import logging
-import pickle
 
 
 # --- Constantes ---#
 # -- Les constantes suivantes définissent des noms de champs dans le fichier de configuration JSON d'un formulaire CERFA. --#
 # nom du champ indiquant les couples "nom du champ à extraire : coordonnées de la boîte l'entourant"
 FORM_FIELDS_TO_EXTRACT_FIELD_NAME_STR: Final[str] = "fields_to_extract"
-# nom du champ listant les coordonnées (x, y) des boîtes entourant les 3 éléments de texte de référence
-# Dans le fichier de configuration, ce nom est donc suivi d'une liste de 3 listes (car 3 éléments de texte de référence) de
-# 4 listes (car 4 points définissent chaque boîte) de 2 nombres flottants (les coordonnées x et y de chaque point)
+# nom du champ listant les coordonnées (x, y) des boîtes entourant les N >= 4 éléments de texte de référence
+# Dans le fichier de configuration, ce nom est donc suivi d'une liste de N listes (une par élément de texte de référence)
+# de 4 listes (car 4 points définissent chaque boîte) de 2 nombres flottants (les coordonnées x et y de chaque point)
 FORM_REFERENCE_BOXES_FIELD_NAME_STR: Final[str] = "reference_boxes"
 # nom du champ indiquant la taille (hauteur et largeur sous forme de liste de 2 entiers) de l'image de référence du formulaire
 FORM_REFERENCE_SIZE_FIELD_NAME_STR: Final[str] = "reference_size"
-# nom du champ listant les 3 éléments de texte de référence à retrouver dans le formulaire
+# nom du champ listant les N >= 4 éléments de texte de référence à retrouver dans le formulaire
 FORM_REFERENCE_TEXTS_FIELD_NAME_STR: Final[str] = "reference_texts"
+# nom du champ facultatif listant les bandes de page, en fractions (début, fin) de la hauteur de la page, où chercher le
+# numéro CERFA du formulaire, en plus des bandes par défaut (voir `StripFormClassifier`)
+FORM_IDENTIFICATION_STRIPS_FIELD_NAME_STR: Final[str] = "identification_strips"
+# part minimale de la surface de la boîte d'un élément de texte devant recouvrir la boîte d'un champ à extraire pour que
+# ledit élément de texte soit associé audit champ
+FIELD_AREA_RATIO_THRESHOLD: Final[float] = 0.5
+# -- Les constantes suivantes définissent les seuils de confiance de l'alignement d'un document sur son image de référence. --#
+# distance maximale, en pixels de l'image de référence, entre le centre transformé de la boîte d'un élément de texte de
+# référence et le centre de la boîte de référence pour que cet élément de texte soit considéré comme bien placé (inlier)
+ALIGNMENT_RANSAC_REPROJECTION_THRESHOLD_IN_PIXELS: Final[float] = 20.
+# nombre minimal d'éléments de texte de référence bien placés pour que l'alignement soit accepté : strictement plus que
+# les 3 points déterminant exactement une transformation affine, un ajustement exact sans point surnuméraire ne
+# permettant de détecter aucun élément de texte mal lu
+ALIGNMENT_MIN_INLIERS_COUNT: Final[int] = 4
+# erreur de reprojection moyenne maximale, en pixels, des éléments de texte de référence bien placés
+ALIGNMENT_MAX_REPROJECTION_ERROR_IN_PIXELS: Final[float] = 10.
+# -- Les constantes suivantes définissent les modes d'extraction des champs d'un document aligné. --#
+# association aux champs des éléments de texte de l'OCRisation de la page entière
+EXTRACTION_MODE_TEXT_BOXES_STR: Final[str] = "text_boxes"
+# reconnaissance seule (sans détection) des découpes des boîtes des champs dans l'image alignée
+EXTRACTION_MODE_FIELD_CROPS_STR: Final[str] = "field_crops"
+# marge, en pixels de l'image de référence, ajoutée autour de la boîte d'un champ avant de la découper
+FIELD_CROP_MARGIN_IN_PIXELS: Final[int] = 5
+# score de reconnaissance minimal du texte d'une découpe, en deçà duquel la découpe est considérée vide
+FIELD_CROP_MIN_RECOGNITION_SCORE: Final[float] = 0.5
+# marge, en fraction de la largeur et de la hauteur de la page, ajoutée autour de la position attendue de la boîte d'un
+# élément de texte de référence pour former la fenêtre où il est cherché, afin de couvrir la rotation et la translation
+# d'un document numérisé
+ANCHOR_SEARCH_WINDOW_MARGIN_RATIO: Final[float] = 0.08
+# facteur de réduction des fenêtres de recherche des éléments de texte de référence avant leur OCRisation
+ANCHOR_SEARCH_WINDOW_SCALE: Final[float] = 0.5
+# -- Les constantes suivantes définissent les documents de plusieurs pages. --#
+# format de la clef de la configuration de la page n > 1 d'un formulaire, lue dans le fichier cerfa_{clef}.json
+PAGE_FORM_CONFIG_KEY_FORMAT_STR: Final[str] = "{form_number_str}_p{page_number}"
 
 
 def get_form_image_text_elements_and_boxes(
-    form_image_path_str: str,
+    form_image_path_str: Union[str, np.ndarray],
     ocr_model: paddleocr.PaddleOCR
 ) -> Tuple[List[str], List[List[Tuple[int, int]]]]:
     r"""Après OCRisation de l'image `form_image_path_str`, retourne :
@@ -37,8 +75,8 @@ def get_form_image_text_elements_and_boxes(
 
     Parameters
     ----------
-    form_image_path_str : str
-        le chemin de l'image à analyser.
+    form_image_path_str : str or numpy.ndarray
+        le chemin de l'image à analyser, ou l'image BGR elle-même déjà chargée en mémoire.
     ocr_model : paddleocr.PaddleOCR
         le modèle PaddleOCR à utiliser pour analyser l'image `form_image_path_str`.
 
@@ -51,7 +89,12 @@ def get_form_image_text_elements_and_boxes(
     """
     # résultats de l'OCRisation de l'image form_image_path_str permettant de récupérer les différents éléments de texte
     # extraits ainsi que les coordonnées des boîtes entourant lesdits éléments de texte
-    input_image_ocr_results = ocr_model.ocr(img=form_image_path_str, det=True, rec=True, cls=True)
+    # la détection, la classification du sens et la reconnaissance du texte sont en outre mesurées séparément, le modèle
+    # n'étant exécuté que si le résultat de cette image n'est pas déjà dans le cache des résultats d'OCR
+    with instrumentation.measure_stage("ocr"):
+        input_image_ocr_results = ocrCache.paddleocr_ocr(
+            instrumentation.instrument_paddleocr_model(ocr_model), img=form_image_path_str, det=True, rec=True, cls=True
+        )
     logging.debug("Nombre de résultats extraits par OCR =", len(input_image_ocr_results))
     # liste des coordonnées des points définissant les boîtes entourant les éléments de texte extraits
     input_document_text_boxes: List[List[Tuple[int, int]]] = [input_image_ocr_result[0] for input_image_ocr_result in input_image_ocr_results]
@@ -67,6 +110,226 @@ def get_form_image_text_elements_and_boxes(
     return input_document_text_elements, input_document_text_boxes
 
 
+def get_anchor_text_elements_and_boxes(
+    form_image: np.ndarray,
+    form_config,
+    ocr_model: paddleocr.PaddleOCR,
+    margin_ratio: float = ANCHOR_SEARCH_WINDOW_MARGIN_RATIO,
+    scale: float = ANCHOR_SEARCH_WINDOW_SCALE
+) -> Tuple[List[str], List[List[Tuple[int, int]]]]:
+    r"""OCRise, au lieu de la page entière, les seules fenêtres entourant la position attendue de chaque élément de texte
+    de référence du formulaire, réduites d'un facteur `scale`, et retourne les éléments de texte qui y sont extraits
+    ainsi que leurs boîtes, exprimées dans le repère de `form_image`. Ces éléments de texte suffisent à aligner le
+    document (voir `get_alignment_fit`) lorsque les champs sont ensuite extraits de l'image alignée.
+
+    Parameters
+    ----------
+    form_image : numpy.ndarray
+        l'image BGR du document.
+    form_config : src.pipeline.form_config_registry.CompiledFormConfig
+        la configuration précompilée du formulaire.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser.
+    margin_ratio : float, default=ANCHOR_SEARCH_WINDOW_MARGIN_RATIO
+        la marge ajoutée autour de chaque boîte de référence, en fraction de la largeur et de la hauteur de la page.
+    scale : float, default=ANCHOR_SEARCH_WINDOW_SCALE
+        le facteur de réduction des fenêtres avant OCRisation.
+
+    Returns
+    -------
+    - list of str
+        la liste des éléments de texte extraits des fenêtres.
+    - list of lists of tuples of float and float
+        la liste des coordonnées des points définissant les boîtes entourant les éléments de texte extraits.
+    """
+    image_height, image_width = form_image.shape[:2]
+    reference_height, reference_width = form_config.reference_size
+    # rectangles (x0, y0, x1, y1) des boîtes de référence, ramenés à la taille de l'image puis élargis de la marge
+    reference_corners: np.ndarray = np.array(form_config.reference_boxes, dtype=np.float32) \
+        * np.array([image_width / reference_width, image_height / reference_height], dtype=np.float32)
+    margins: np.ndarray = np.array([image_width, image_height], dtype=np.float32) * margin_ratio
+    windows: np.ndarray = np.concatenate([reference_corners.min(axis=1) - margins, reference_corners.max(axis=1) + margins],
+                                         axis=1)
+    windows = np.clip(np.rint(windows), 0, [image_width, image_height, image_width, image_height]).astype(np.int64)
+    text_elements: List[str] = []
+    text_boxes: List[List[Tuple[float, float]]] = []
+    with instrumentation.measure_stage("ocr.anchors"):
+        for x0, y0, x1, y1 in windows.tolist():
+            if x1 <= x0 or y1 <= y0:
+                continue
+            window_image: np.ndarray = cv2.resize(form_image[y0:y1, x0:x1], None, fx=scale, fy=scale,
+                                                  interpolation=cv2.INTER_AREA)
+            for window_box, (text_str, _) in ocrCache.paddleocr_ocr(ocr_model, img=window_image, det=True, rec=True,
+                                                                     cls=False):
+                text_elements.append(text_str)
+                text_boxes.append([(x0 + corner[0] / scale, y0 + corner[1] / scale) for corner in window_box])
+    return text_elements, text_boxes
+
+
+def identify_form_on_strips(
+    input_document_path_str: str,
+    form_image: Optional[np.ndarray],
+    ocr_model: paddleocr.PaddleOCR,
+    configuration_files_dir_path_str: str
+) -> Optional[str]:
+    r"""Cherche le numéro CERFA du formulaire par une OCRisation peu coûteuse des seules bandes de page réduites où il
+    se trouve d'ordinaire : les bandes d'en-tête et de pied de page, celles déclarées par les fichiers de configuration
+    (`identification_strips`) et celles apprises (voir `StripFormClassifier`). Sans image de la page, les bandes sont
+    rendues en basse résolution depuis le document, dont la page n'est alors jamais rendue en pleine résolution.
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, lu si `form_image` est None, utilisé dans les messages.
+    form_image : numpy.ndarray, optional
+        l'image BGR du document si elle a déjà été rendue, ou None.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser.
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+
+    Returns
+    -------
+    str or None
+        le numéro CERFA du formulaire, ou None si aucune bande ne contient exactement un numéro.
+    """
+    # importé ici pour éviter une importation circulaire, le registre s'appuyant sur read_form_config_file
+    from src.pipeline.form_config_registry import get_form_config_registry
+    ocrExtractor.strip_form_classifier.add_strips(
+        get_form_config_registry(configuration_files_dir_path_str).get_identification_strips()
+    )
+    return ocrExtractor.strip_form_classifier.classify(
+        input_document_path=input_document_path_str,
+        form_image=form_image,
+        ocrModel=ocr_model
+    )
+
+
+def get_identified_form_text_elements_and_boxes(
+    input_document_path_str: str,
+    form_image: np.ndarray,
+    ocr_model: paddleocr.PaddleOCR,
+    configuration_files_dir_path_str: str,
+    strip_form_number_str: Optional[str],
+    is_full_page_ocr_needed: bool = True
+) -> Tuple[str, List[str], List[List[Tuple[int, int]]]]:
+    r"""Retourne le numéro CERFA du formulaire et les éléments de texte nécessaires à la suite du traitement, une fois
+    le numéro cherché dans les bandes de la page (voir `identify_form_on_strips`).
+
+    Aucune autre OCRisation n'a lieu pour un formulaire identifié sans fichier de configuration, qui ne peut être
+    aligné. Si les éléments de texte de la page entière ne sont pas nécessaires, seules les fenêtres entourant les
+    éléments de texte de référence sont OCRisées (voir `get_anchor_text_elements_and_boxes`). Sinon, ou si le numéro
+    n'a été trouvé dans aucune bande, la page entière est OCRisée en pleine résolution ; une nouvelle bande est alors
+    apprise autour du numéro qui y est trouvé.
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, utilisé dans les messages.
+    form_image : numpy.ndarray
+        l'image BGR du document.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser.
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+    strip_form_number_str : str or None
+        le numéro CERFA trouvé dans les bandes de la page, ou None.
+    is_full_page_ocr_needed : bool, default=True
+        si les éléments de texte de la page entière sont nécessaires, ou seulement ceux servant à l'alignement.
+
+    Returns
+    -------
+    - str
+        le numéro CERFA du formulaire.
+    - list of str
+        la liste des éléments de texte extraits de la page entière, ou des seules fenêtres des éléments de texte de
+        référence, vide pour un formulaire sans fichier de configuration.
+    - list of lists of tuples of int and int
+        la liste des coordonnées des points définissant les boîtes entourant les éléments de texte extraits.
+    """
+    if strip_form_number_str is not None:
+        # importé ici pour éviter une importation circulaire, le registre s'appuyant sur read_form_config_file
+        from src.pipeline.form_config_registry import get_form_config_registry
+        form_config = get_form_config_registry(configuration_files_dir_path_str).get(strip_form_number_str)
+        if form_config is None:
+            # le formulaire, sans fichier de configuration, sera rejeté par l'alignement (voir `get_form_config`)
+            return strip_form_number_str, [], []
+        if is_full_page_ocr_needed:
+            input_document_text_elements, input_document_text_boxes = \
+                get_form_image_text_elements_and_boxes(form_image, ocr_model)
+        else:
+            input_document_text_elements, input_document_text_boxes = \
+                get_anchor_text_elements_and_boxes(form_image, form_config, ocr_model)
+        return strip_form_number_str, input_document_text_elements, input_document_text_boxes
+    input_document_text_elements, input_document_text_boxes = \
+        get_form_image_text_elements_and_boxes(form_image, ocr_model)
+    form_number_str = ocrExtractor.get_form_number_in_text_elements(
+        input_document_path=input_document_path_str,
+        text_elements=input_document_text_elements
+    )
+    form_number_text_box_index: Optional[int] = \
+        ocrExtractor.find_form_number_text_box_index(input_document_text_elements)
+    if form_number_text_box_index is not None:
+        ocrExtractor.strip_form_classifier.learn_strip(
+            text_box=input_document_text_boxes[form_number_text_box_index],
+            image_height=form_image.shape[0]
+        )
+    return form_number_str, input_document_text_elements, input_document_text_boxes
+
+
+def identify_form_and_get_text_elements_and_boxes(
+    input_document_path_str: str,
+    form_image: np.ndarray,
+    ocr_model: paddleocr.PaddleOCR,
+    configuration_files_dir_path_str: str,
+    is_full_page_ocr_needed: bool = True
+) -> Tuple[str, List[str], List[List[Tuple[int, int]]]]:
+    r"""Identifie le formulaire et retourne les éléments de texte nécessaires à la suite du traitement.
+
+    Le numéro CERFA est d'abord cherché dans les seules bandes de la page réduites (voir `identify_form_on_strips`),
+    si bien qu'un formulaire sans fichier de configuration est rejeté sans OCRisation de la page entière. Les éléments
+    de texte de la page entière, s'ils sont nécessaires (`is_full_page_ocr_needed`, pour leur association aux champs),
+    ou ceux des seules fenêtres des éléments de texte de référence sinon (extraction des champs par découpes de l'image
+    alignée, DONUT, alignement seul), sont ensuite extraits (voir `get_identified_form_text_elements_and_boxes`).
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, utilisé dans les messages.
+    form_image : numpy.ndarray
+        l'image BGR du document.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser.
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+    is_full_page_ocr_needed : bool, default=True
+        si les éléments de texte de la page entière sont nécessaires, ou seulement ceux servant à l'alignement.
+
+    Returns
+    -------
+    - str
+        le numéro CERFA du formulaire.
+    - list of str
+        la liste des éléments de texte extraits de la page entière, ou des seules fenêtres des éléments de texte de
+        référence, vide pour un formulaire sans fichier de configuration.
+    - list of lists of tuples of int and int
+        la liste des coordonnées des points définissant les boîtes entourant les éléments de texte extraits.
+    """
+    return get_identified_form_text_elements_and_boxes(
+        input_document_path_str=input_document_path_str,
+        form_image=form_image,
+        ocr_model=ocr_model,
+        configuration_files_dir_path_str=configuration_files_dir_path_str,
+        strip_form_number_str=identify_form_on_strips(
+            input_document_path_str=input_document_path_str,
+            form_image=form_image,
+            ocr_model=ocr_model,
+            configuration_files_dir_path_str=configuration_files_dir_path_str
+        ),
+        is_full_page_ocr_needed=is_full_page_ocr_needed
+    )
+
+
 def get_transformationMatrix_and_save_image_after_affineTransformation(
     input_document_path_str: str,
     form_image_path_str: str,
@@ -106,96 +369,779 @@ def get_transformationMatrix_and_save_image_after_affineTransformation(
     - numpy.ndarray
         la matrice de transformation de l'image.
     """
-    form_config_file_path: str = os.path.join(configuration_files_dir_path_str, f"cerfa_{form_number_str}.json")
-    assert os.path.isfile(
-        form_config_file_path
-    ), f"Le numéro CERFA {form_number_str} a été extrait du document {input_document_path_str}, " \
-       f"mais **aucun fichier de configuration correspondant** {form_config_file_path} n'existe dans le répertoire {configuration_files_dir_path_str}."
-    form_config_file_dict: Dict = read_form_config_file(form_config_file_path=form_config_file_path)
-
-    # trouve les boîtes entourant les éléments de texte correspondant le mieux aux éléments de texte de
-    # l'image de référence du formulaire
+    # l'image transformée est écrite à côté de l'image obtenue du document, donc dans l'espace de travail de la tâche
+    # lorsque celle-ci y a été écrite (voir `utils.get_and_save_image_and_path_from_document`)
+    form_image_withoutPrefix_file_name_str: str = \
+        os.path.basename(form_image_path_str).removeprefix(f"{utils.TEMPORARY_FILE_PREFIX_STR}_")
+    transformed_image_path_str: str = \
+        os.path.join(os.path.dirname(form_image_path_str), f"auto_transformed_{form_image_withoutPrefix_file_name_str}")
+    # applique une rotation à l'image, en sauvegarde le résultat dans un fichier différent pour éviter
+    # tout conflit de nommage et retourne la matrice de transformation de l'image
+    transformed_image, transformation_matrix = get_transformationMatrix_and_image_after_affineTransformation(
+        input_document_path_str=input_document_path_str,
+        form_image=cv2.imread(form_image_path_str),
+        form_number_str=form_number_str,
+        input_document_text_elements=input_document_text_elements,
+        input_document_text_boxes=input_document_text_boxes,
+        configuration_files_dir_path_str=configuration_files_dir_path_str
+    )
+    cv2.imwrite(filename=transformed_image_path_str, img=transformed_image)
+    return transformed_image_path_str, transformation_matrix
+
+
+def get_transformationMatrix_and_image_after_affineTransformation(
+    input_document_path_str: str,
+    form_image: Optional[np.ndarray],
+    form_number_str: str,
+    input_document_text_elements: List[str],
+    input_document_text_boxes: List[List[Tuple[int, int]]],
+    configuration_files_dir_path_str: str
+) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    r"""Equivalent en mémoire de `get_transformationMatrix_and_save_image_after_affineTransformation` : à partir de
+    l'image `form_image` obtenue du document `input_document_path`, trouve les boîtes entourant les éléments de texte
+    correspondant le mieux aux éléments de texte de l'image de référence, puis retourne :
+    - l'image transformée, sans l'écrire sur le disque, ou None si `form_image` vaut None, auquel cas seule la matrice
+      de transformation est calculée,
+    - la matrice de transformation de l'image.
+    Une ValueError est levée si l'alignement est peu fiable (voir `get_alignment_fit`).
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document à analyser.
+    form_image : numpy.ndarray, optional
+        l'image BGR obtenue à partir du document à analyser, ou None si l'image transformée n'est pas nécessaire.
+    form_number_str : str
+        le numéro CERFA du formulaire détecté dans l'image à analyser.
+    input_document_text_elements : list of str
+        liste des éléments de texte extraits de l'OCRisation de l'image à analyser
+    input_document_text_boxes : list of lists of tuples of int and int
+        liste des coordonnées des points définissant les boîtes entourant lesdits éléments de texte
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+
+    Returns
+    -------
+    - numpy.ndarray or None
+        l'image transformée, ou None si `form_image` vaut None.
+    - numpy.ndarray
+        la matrice de transformation de l'image.
+    """
+    form_config = get_form_config(
+        input_document_path_str=input_document_path_str,
+        form_number_str=form_number_str,
+        configuration_files_dir_path_str=configuration_files_dir_path_str
+    )
+
+    transformation_matrix: np.ndarray = get_alignment_fit(
+        input_document_path_str=input_document_path_str,
+        form_config=form_config,
+        input_document_text_elements=input_document_text_elements,
+        input_document_text_boxes=input_document_text_boxes
+    ).affine_transformation_matrix
+    transformed_image: Optional[np.ndarray] = None
+    if form_image is not None:
+        transformed_image = ocrFunctions.apply_affineTransformation(
+            input_image=form_image,
+            affine_transformation_matrix=transformation_matrix,
+            output_image_size=form_config.reference_size
+        )
+    return transformed_image, transformation_matrix
+
+
+@instrumentation.instrumented("alignment")
+def get_alignment_fit(
+    input_document_path_str: str,
+    form_config,
+    input_document_text_elements: List[str],
+    input_document_text_boxes: List[List[Tuple[int, int]]],
+    min_inliers_count: int = ALIGNMENT_MIN_INLIERS_COUNT,
+    max_reprojection_error_in_pixels: float = ALIGNMENT_MAX_REPROJECTION_ERROR_IN_PIXELS
+) -> ocrFunctions.AffineTransformationFit:
+    r"""Trouve les boîtes entourant les éléments de texte correspondant le mieux aux N éléments de texte de référence du
+    formulaire, puis estime la transformation affine alignant le document sur l'image de référence : exactement pour 3
+    éléments de texte de référence, par RANSAC au-delà, les éléments de texte mal lus étant alors écartés. Un alignement
+    peu fiable est rejeté avant les étapes coûteuses suivantes (extraction des champs, inférence DONUT), notamment un
+    ajustement exact sur 3 éléments de texte, qui ne permet de vérifier aucun d'eux : un formulaire doit donc avoir au
+    moins `min_inliers_count` éléments de texte de référence, idéalement 5 ou 6 répartis sur la page.
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, utilisé dans les messages.
+    form_config : src.pipeline.form_config_registry.CompiledFormConfig
+        la configuration précompilée du formulaire.
+    input_document_text_elements : list of str
+        liste des éléments de texte extraits de l'OCRisation de l'image à analyser
+    input_document_text_boxes : list of lists of tuples of int and int
+        liste des coordonnées des points définissant les boîtes entourant lesdits éléments de texte
+    min_inliers_count : int, default=ALIGNMENT_MIN_INLIERS_COUNT
+        nombre minimal d'éléments de texte de référence bien placés.
+    max_reprojection_error_in_pixels : float, default=ALIGNMENT_MAX_REPROJECTION_ERROR_IN_PIXELS
+        erreur de reprojection moyenne maximale des éléments de texte de référence bien placés.
+
+    Returns
+    -------
+    src.models.auto_rotation_translation.functions.AffineTransformationFit
+        la transformation estimée, avec son nombre d'éléments de texte bien placés et son erreur de reprojection.
+
+    Raises
+    ------
+    ValueError
+        si l'alignement est jugé peu fiable.
+    """
     input_document_matching_boxes = ocrFunctions.find_matching_boxes(
         input_image_text_boxes=input_document_text_boxes,
         input_image_text_elements=input_document_text_elements,
-        reference_image_text_elements=form_config_file_dict[FORM_REFERENCE_TEXTS_FIELD_NAME_STR]
+        reference_image_text_elements=form_config.reference_texts
+    )
+    alignment_fit: ocrFunctions.AffineTransformationFit = ocrFunctions.estimate_affineTransformation_with_points(
+        input_image_points=np.array(input_document_matching_boxes, dtype=np.float32).mean(axis=1),
+        reference_image_points=form_config.reference_points,
+        ransac_reprojection_threshold=ALIGNMENT_RANSAC_REPROJECTION_THRESHOLD_IN_PIXELS
     )
+    logging.info(f"Alignement du document {input_document_path_str} : {alignment_fit}")
+    if alignment_fit.inliers_count < min_inliers_count \
+            or alignment_fit.reprojection_error > max_reprojection_error_in_pixels:
+        raise ValueError(f"L'alignement du document {input_document_path_str} sur le formulaire "
+                         f"{form_config.form_number_str} est peu fiable : {alignment_fit.inliers_count} éléments de "
+                         f"texte de référence bien placés sur {len(alignment_fit.inliers_mask)}, erreur de reprojection "
+                         f"moyenne de {alignment_fit.reprojection_error:.2f} pixels")
+    return alignment_fit
 
-    form_image_withoutPrefix_path_str = \
-        form_image_path_str.removeprefix(f"{utils.TEMPORARY_FILE_DIRECTORY_STR}/{utils.TEMPORARY_FILE_PREFIX_STR}_")
-    transformed_image_path_str: str = f"{utils.TEMPORARY_FILE_DIRECTORY_STR}/auto_transformed_{form_image_withoutPrefix_path_str}"
-    # applique une rotation à l'image, en sauvegarde le résultat dans un fichier différent pour éviter
-    # tout conflit de nommage et retourne la matrice de transformation de l'image
-    transformation_matrix: np.ndarray = ocrFunctions.get_transformationMatrix_and_save_image_after_affineTransformation_with_boxes(
-        input_image_path=form_image_path_str,
-        output_image_path=transformed_image_path_str,
-        input_image_boxes=input_document_matching_boxes,
-        reference_image_boxes=form_config_file_dict[FORM_REFERENCE_BOXES_FIELD_NAME_STR],
-        output_image_size=form_config_file_dict[FORM_REFERENCE_SIZE_FIELD_NAME_STR]
+
+def get_form_config(
+    input_document_path_str: str,
+    form_number_str: str,
+    configuration_files_dir_path_str: str
+):
+    r"""Retourne la configuration précompilée du formulaire de numéro CERFA `form_number_str`, lue depuis le registre
+    partagé des configurations du répertoire `configuration_files_dir_path_str` sans accès au système de fichiers.
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, utilisé dans le message d'erreur.
+    form_number_str : str
+        le numéro CERFA du formulaire.
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+
+    Returns
+    -------
+    src.pipeline.form_config_registry.CompiledFormConfig
+        la configuration du formulaire.
+    """
+    # importé ici pour éviter une importation circulaire, le registre s'appuyant sur read_form_config_file
+    from src.pipeline.form_config_registry import get_form_config_registry
+    form_config = get_form_config_registry(configuration_files_dir_path_str).get(form_number_str)
+    assert form_config is not None, \
+        f"Le numéro CERFA {form_number_str} a été extrait du document {input_document_path_str}, " \
+        f"mais **aucun fichier de configuration correspondant** cerfa_{form_number_str}.json n'existe dans le répertoire {configuration_files_dir_path_str}."
+    return form_config
+
+
+def align_and_extract_fields(
+    input_document_path_str: str,
+    form_number_str: str,
+    input_document_text_elements: List[str],
+    input_document_text_boxes: List[List[Tuple[int, int]]],
+    configuration_files_dir_path_str: str
+) -> Tuple[Dict[str, str], ocrFunctions.AffineTransformationFit]:
+    r"""A partir des éléments de texte extraits d'un document et de son numéro CERFA, aligne les boîtes des éléments de
+    texte sur l'image de référence du formulaire puis leur associe les champs à extraire, sans jamais manipuler l'image.
+
+    Parameters
+    ----------
+    input_document_path_str : str
+        le chemin du document analysé, utilisé dans les messages.
+    form_number_str : str
+        le numéro CERFA du formulaire.
+    input_document_text_elements : list of str
+        liste des éléments de texte extraits de l'OCRisation du document
+    input_document_text_boxes : list of lists of tuples of int and int
+        liste des coordonnées des points définissant les boîtes entourant lesdits éléments de texte
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA
+
+    Returns
+    -------
+    - dict of str to str
+        les couples {nom du champ : valeur du champ}.
+    - src.models.auto_rotation_translation.functions.AffineTransformationFit
+        la transformation alignant le document sur l'image de référence.
+    """
+    form_config = get_form_config(
+        input_document_path_str=input_document_path_str,
+        form_number_str=form_number_str,
+        configuration_files_dir_path_str=configuration_files_dir_path_str
     )
-    return transformed_image_path_str, transformation_matrix
+    alignment_fit: ocrFunctions.AffineTransformationFit = get_alignment_fit(
+        input_document_path_str=input_document_path_str,
+        form_config=form_config,
+        input_document_text_elements=input_document_text_elements,
+        input_document_text_boxes=input_document_text_boxes
+    )
+    extracted_fields_dict: Dict[str, str] = extract_fields_from_text_boxes(
+        text_boxes=transform_text_boxes(input_document_text_boxes, alignment_fit.affine_transformation_matrix),
+        text_elements=input_document_text_elements,
+        field_names=form_config.field_names,
+        field_boxes=form_config.field_boxes,
+        field_box_field_indices=form_config.field_box_field_indices,
+        field_boxes_index=form_config.field_boxes_index
+    )
+    return extracted_fields_dict, alignment_fit
 
 
+@instrumentation.instrumented("extract_document")
 def extract_document(
     input_document_path: str,
     configuration_files_dir_path: str,
     ocr_model: paddleocr.PaddleOCR,
-    save_annotated_document: Optional[str] = None
+    save_annotated_document: Optional[str] = None,
+    save_transformed_document: Optional[str] = None,
+    extraction_mode: str = EXTRACTION_MODE_TEXT_BOXES_STR
 ) -> Dict[str, str]:
     """Extract key-value info from a document
     The cerfa number is ocr-ised, then the corresponding configuration file cerfa_*****_**.json
     is searched for in path_dir_configs.
+    Returns the {field name: field value} pairs of the fields_to_extract of the configuration file.
+    In both extraction modes, the cerfa number of a scanned document is first searched for in a few strips
+    of its page, rendered at low resolution (see identify_form_on_strips): a form without configuration
+    file is rejected before the page is rendered at full resolution and OCR-ised.
+    With extraction_mode EXTRACTION_MODE_TEXT_BOXES_STR, the text elements of the full page OCR are
+    matched to the fields; with EXTRACTION_MODE_FIELD_CROPS_STR, the page is never OCR-ised as a whole:
+    the form is aligned on the text elements found in small windows around the expected reference texts,
+    then the field boxes are cropped from the aligned image and only recognised, in batch (see
+    get_identified_form_text_elements_and_boxes and extract_fields_from_field_crops).
+    The text layer and the filled widgets of a digital PDF are read directly (see
+    src.util.document_loader), without rendering nor OCR; other documents are rendered once in memory
+    and handed as is to the OCR model and to the affine transformation:
+    nothing is written on disk unless one of the following paths is set.
     If save_annotated_document is set, input document is saved after auto-transformation,
-    along with reference boxes and extracted boxes [not implemented yet].
+    along with reference boxes and extracted boxes.
+    If save_transformed_document is set, input document is saved after auto-transformation.
     """
-    # exporte le document en entrée vers une image au format PNG afin de faciliter les opérations suivantes
-    png_document_image, png_document_path_str = utils.get_and_save_image_and_path_from_document(
+    # lit directement la couche texte et les champs remplis d'un document PDF numérique, qui n'est alors pas OCRisé ;
+    # les boîtes y étant exactes, les champs sont extraits par association des éléments de texte
+    text_layer: Optional[documentLoader.PdfPageTextLayer] = documentLoader.load_document_text_layer(
         input_document_path=input_document_path,
-        output_image_format="PNG",
-        output_image_quality_in_dpi=350
+        image_quality_in_dpi=350
     )
+    if text_layer is not None:
+        extraction_mode = EXTRACTION_MODE_TEXT_BOXES_STR
+    is_transformed_image_needed: bool = save_annotated_document is not None or save_transformed_document is not None \
+        or extraction_mode == EXTRACTION_MODE_FIELD_CROPS_STR
 
-    # liste des éléments de texte extraits et des coordonnées des points définissant les boîtes entourant lesdits éléments
-    # de texte extraits de l'OCRisation de l'image png_document_path_str
-    input_document_text_elements, input_document_text_boxes = \
-        get_form_image_text_elements_and_boxes(png_document_path_str, ocr_model)
+    # cherche d'abord le numéro CERFA d'un document numérisé dans les bandes de sa page, rendues en basse résolution,
+    # afin de rejeter un formulaire sans fichier de configuration avant le rendu et l'OCRisation de la page entière
+    strip_form_number_str: Optional[str] = None
+    if text_layer is None:
+        strip_form_number_str = identify_form_on_strips(
+            input_document_path_str=input_document_path,
+            form_image=None,
+            ocr_model=ocr_model,
+            configuration_files_dir_path_str=configuration_files_dir_path
+        )
+        if strip_form_number_str is not None:
+            get_form_config(
+                input_document_path_str=input_document_path,
+                form_number_str=strip_form_number_str,
+                configuration_files_dir_path_str=configuration_files_dir_path
+            )
 
-    # extrait le numéro CERFA du formulaire afin de trouver le fichier de configuration dudit formulaire, définissant
-    # les champs, leurs positions, les éléments de texte de référence et la taille de l'image de référence associée
-    form_number_str: str = ocrExtractor.get_form_number_in_text_elements(
-        input_document_path=input_document_path,
-        text_elements=input_document_text_elements
-    )
+    # charge le document en entrée en mémoire sous la forme d'une image, partagée par toutes les étapes suivantes
+    document_image: Optional[np.ndarray] = None
+    if text_layer is None or is_transformed_image_needed:
+        document_image = utils.get_image_array_from_document(
+            input_document_path=input_document_path,
+            image_quality_in_dpi=350
+        )
+
+    if text_layer is not None:
+        input_document_text_elements, input_document_text_boxes = text_layer.text_elements, text_layer.text_boxes
+        form_number_str: str = ocrExtractor.get_form_number_in_text_elements(
+            input_document_path=input_document_path,
+            text_elements=input_document_text_elements
+        )
+    else:
+        # extrait le numéro CERFA du formulaire, afin de trouver le fichier de configuration dudit formulaire,
+        # définissant les champs, leurs positions, les éléments de texte de référence et la taille de l'image de
+        # référence associée, ainsi que la liste des éléments de texte extraits et des coordonnées des points définissant
+        # les boîtes entourant lesdits éléments de texte : ceux de la page entière pour les associer aux champs, ou ceux
+        # des seules fenêtres des éléments de texte de référence pour aligner l'image dont les champs sont découpés
+        form_number_str, input_document_text_elements, input_document_text_boxes = \
+            get_identified_form_text_elements_and_boxes(
+                input_document_path_str=input_document_path,
+                form_image=document_image,
+                ocr_model=ocr_model,
+                configuration_files_dir_path_str=configuration_files_dir_path,
+                strip_form_number_str=strip_form_number_str,
+                is_full_page_ocr_needed=extraction_mode != EXTRACTION_MODE_FIELD_CROPS_STR
+            )
 
     # - trouve les boîtes entourant les éléments de texte correspondant le mieux aux éléments de texte de
     #   l'image de référence du formulaire
-    # - applique une rotation à l'image, en sauvegarde le résultat dans un fichier différent pour éviter
-    #   tout conflit de nommage et retourne l'image obtenue et la matrice de transformation de ladite image
-    transformed_image_path_str, transformation_matrix = get_transformationMatrix_and_save_image_after_affineTransformation(
+    # - calcule la matrice de transformation de l'image, et n'applique la transformation à l'image que si l'image
+    #   transformée doit être sauvegardée
+    image_to_transform: Optional[np.ndarray] = document_image if is_transformed_image_needed else None
+    transformed_image, transformation_matrix = get_transformationMatrix_and_image_after_affineTransformation(
         input_document_path_str=input_document_path,
-        form_image_path_str=png_document_path_str,
+        form_image=image_to_transform,
         form_number_str=form_number_str,
         input_document_text_elements=input_document_text_elements,
         input_document_text_boxes=input_document_text_boxes,
         configuration_files_dir_path_str=configuration_files_dir_path
     )
+    del document_image, image_to_transform
+
+    # applique la transformation à toutes les boîtes extraites en une fois afin de les comparer aux boîtes de référence
+    transformed_input_boxes: np.ndarray = transform_text_boxes(
+        text_boxes=input_document_text_boxes,
+        transformation_matrix=transformation_matrix
+    )
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for transformed_box, text_element_str in zip(transformed_input_boxes, input_document_text_elements):
+            logging.debug(f"{text_element_str} ----- {transformed_box.tolist()}")
+
+    # associe les éléments de texte transformés aux champs à extraire définis dans le fichier de configuration
+    form_config = get_form_config(
+        input_document_path_str=input_document_path,
+        form_number_str=form_number_str,
+        configuration_files_dir_path_str=configuration_files_dir_path
+    )
+    form_config_file_dict: Dict = form_config.form_config_dict
+    if extraction_mode == EXTRACTION_MODE_FIELD_CROPS_STR:
+        extracted_fields_dict: Dict[str, str] = extract_fields_from_field_crops(
+            aligned_image=transformed_image,
+            field_names=form_config.field_names,
+            field_boxes=form_config.field_boxes,
+            field_box_field_indices=form_config.field_box_field_indices,
+            ocr_model=ocr_model
+        )
+    else:
+        extracted_fields_dict: Dict[str, str] = extract_fields_from_text_boxes(
+            text_boxes=transformed_input_boxes,
+            text_elements=input_document_text_elements,
+            field_names=form_config.field_names,
+            field_boxes=form_config.field_boxes,
+            field_box_field_indices=form_config.field_box_field_indices,
+            field_boxes_index=form_config.field_boxes_index
+        )
+
+    if save_transformed_document is not None:
+        cv2.imwrite(filename=save_transformed_document, img=transformed_image)
+    if save_annotated_document is not None:
+        cv2.imwrite(
+            filename=save_annotated_document,
+            img=get_annotated_image(
+                transformed_image=transformed_image,
+                fields_to_extract=form_config_file_dict[FORM_FIELDS_TO_EXTRACT_FIELD_NAME_STR],
+                reference_boxes=form_config_file_dict[FORM_REFERENCE_BOXES_FIELD_NAME_STR],
+                transformed_text_boxes=transformed_input_boxes
+            )
+        )
+    return extracted_fields_dict
+
+
+def get_page_form_config_key(form_number_str: str, page_number: int) -> str:
+    r"""Retourne la clef de la configuration de la page `page_number` (à partir de 1) du formulaire `form_number_str` :
+    le numéro CERFA pour la première page, suivi du numéro de la page pour les suivantes (voir
+    `PAGE_FORM_CONFIG_KEY_FORMAT_STR`)."""
+    if page_number == 1:
+        return form_number_str
+    return PAGE_FORM_CONFIG_KEY_FORMAT_STR.format(form_number_str=form_number_str, page_number=page_number)
+
+
+@instrumentation.instrumented("extract_multipage_document")
+def extract_multipage_document(
+    input_document_path: str,
+    configuration_files_dir_path: str,
+    ocr_model: paddleocr.PaddleOCR,
+    image_quality_in_dpi: int = 350,
+    pages_image_quality_in_dpi: Optional[Dict[int, int]] = None,
+    render_workers_count: int = 0
+) -> Dict:
+    r"""Extrait les champs de toutes les pages d'un document, page par page : chaque page est lue dans la couche texte
+    d'un PDF numérique ou rendue à la demande (voir `utils.iter_document_page_images`), OCRisée, identifiée, alignée
+    sur l'image de référence de sa page puis associée aux champs de sa configuration. Une seule page est ainsi en
+    mémoire à la fois, ou quelques-unes si `render_workers_count` processus rendent les pages suivantes pendant le
+    traitement de la page courante.
+
+    Une page où aucun numéro CERFA n'est trouvé est la page suivante du dernier formulaire identifié, dont la
+    configuration est lue dans le fichier cerfa_{numéro CERFA}_p{numéro de la page}.json. Une page sans configuration
+    ou mal alignée n'interrompt pas l'extraction : son erreur est indiquée dans l'enregistrement de la page.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document, PDF ou image.
+    configuration_files_dir_path : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR à utiliser.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi des images des pages.
+    pages_image_quality_in_dpi : dict of int to int, optional, default=None
+        la qualité en dpi de certaines pages, par indice de page.
+    render_workers_count : int, default=0
+        le nombre de processus de rendu des pages, 0 pour les rendre à la demande dans le processus courant.
+
+    Returns
+    -------
+    dict
+        l'enregistrement du document : son chemin, la liste `pages` des enregistrements de chaque page (indice, numéro
+        CERFA, numéro de la page dans le formulaire, alignement, champs extraits ou erreur) et les champs `fields` de
+        toutes les pages réunis par numéro CERFA, un champ vide d'une page n'écrasant pas la valeur lue sur une autre.
+    """
+    page_count: int = utils.get_document_page_count(input_document_path)
+    # pages numériques, lues dans la couche texte du document
+    pages_text_layers: Dict[int, documentLoader.PdfPageTextLayer] = documentLoader.load_document_text_layers(
+        input_document_path=input_document_path,
+        image_quality_in_dpi=image_quality_in_dpi,
+        pages_image_quality_in_dpi=pages_image_quality_in_dpi
+    )
+
+    def iter_pages_text_elements_and_boxes():
+        # seules les pages numérisées sont rendues, à la demande ou en parallèle, puis OCRisées
+        scanned_pages_images = utils.iter_document_page_images(
+            input_document_path,
+            image_quality_in_dpi=image_quality_in_dpi,
+            pages_image_quality_in_dpi=pages_image_quality_in_dpi,
+            page_indices=[page_index for page_index in range(page_count) if page_index not in pages_text_layers],
+            render_workers_count=render_workers_count
+        )
+        for page_index in range(page_count):
+            if page_index in pages_text_layers:
+                page_text_layer: documentLoader.PdfPageTextLayer = pages_text_layers[page_index]
+                yield page_index, page_text_layer.text_elements, page_text_layer.text_boxes
+                continue
+            _, page_image = next(scanned_pages_images)
+            page_text_elements, page_text_boxes = get_form_image_text_elements_and_boxes(page_image, ocr_model)
+            # libère l'image de la page avant de passer à la suivante
+            del page_image
+            yield page_index, page_text_elements, page_text_boxes
+
+    # importé ici pour éviter une importation circulaire, le registre s'appuyant sur read_form_config_file
+    from src.pipeline.form_config_registry import get_form_config_registry
+    form_config_registry = get_form_config_registry(configuration_files_dir_path)
+    pages_records: List[Dict] = []
+    forms_fields: Dict[str, Dict[str, str]] = {}
+    form_number_str: Optional[str] = None
+    page_number: int = 0
+    for page_index, page_text_elements, page_text_boxes in iter_pages_text_elements_and_boxes():
+        page_record: Dict = {"page_index": page_index, "form_number": None, "page_number": None,
+                             "alignment": None, "fields": None, "error": None}
+        pages_records.append(page_record)
+        try:
+            page_form_number_str: str = ocrExtractor.get_form_number_in_text_elements(
+                input_document_path=input_document_path,
+                text_elements=page_text_elements
+            )
+        except ValueError:
+            page_form_number_str = None
+        if page_form_number_str is not None and (
+                page_form_number_str != form_number_str
+                or get_page_form_config_key(form_number_str, page_number + 1) not in form_config_registry):
+            # début d'un nouveau formulaire, ou d'un nouvel exemplaire du même formulaire s'il n'a pas de page suivante
+            form_number_str, page_number = page_form_number_str, 1
+        elif form_number_str is not None:
+            page_number += 1
+        else:
+            page_record["error"] = repr(ValueError(f"Aucun numéro de formulaire CERFA n'a été trouvé dans la page "
+                                                   f"{page_index + 1} du document {input_document_path}"))
+            continue
+        page_record["form_number"], page_record["page_number"] = form_number_str, page_number
+        try:
+            page_fields_dict, alignment_fit = align_and_extract_fields(
+                input_document_path_str=f"{input_document_path} (page {page_index + 1})",
+                form_number_str=get_page_form_config_key(form_number_str, page_number),
+                input_document_text_elements=page_text_elements,
+                input_document_text_boxes=page_text_boxes,
+                configuration_files_dir_path_str=configuration_files_dir_path
+            )
+        except (AssertionError, ValueError) as lException:
+            logging.warning(f"Page {page_index + 1} du document {input_document_path} non extraite : {lException}")
+            page_record["error"] = repr(lException)
+            continue
+        page_record["alignment"], page_record["fields"] = alignment_fit.to_dict(), page_fields_dict
+        form_fields: Dict[str, str] = forms_fields.setdefault(form_number_str, {})
+        for field_name, field_value in page_fields_dict.items():
+            if field_value or field_name not in form_fields:
+                form_fields[field_name] = field_value
+    return {"input_document_path": input_document_path, "pages": pages_records, "fields": forms_fields}
+
+
+def get_annotated_image(
+    transformed_image: np.ndarray,
+    fields_to_extract: Dict[str, List],
+    reference_boxes: List[List[Tuple[int, int]]],
+    transformed_text_boxes: np.ndarray
+) -> np.ndarray:
+    r"""Retourne une copie de l'image transformée `transformed_image` sur laquelle sont dessinées les boîtes des champs à
+    extraire (en vert), les boîtes des éléments de texte de référence (en bleu) et les boîtes des éléments de texte
+    extraits après transformation (en rouge).
+
+    Parameters
+    ----------
+    transformed_image : numpy.ndarray
+        l'image BGR transformée dans le repère de l'image de référence du formulaire.
+    fields_to_extract : dict
+        les champs à extraire, tels que lus par `read_form_config_file`.
+    reference_boxes : list of lists of tuples of int and int
+        les boîtes entourant les éléments de texte de référence.
+    transformed_text_boxes : numpy.ndarray
+        le tableau (N, 4, 2) des boîtes entourant les éléments de texte extraits, après transformation.
+
+    Returns
+    -------
+    numpy.ndarray
+        l'image annotée.
+    """
+    annotated_image: np.ndarray = transformed_image.copy()
+    for field_corners in fields_to_extract.values():
+        for x0, y0, x1, y1 in get_field_rectangles(field_corners):
+            cv2.rectangle(annotated_image, (int(x0), int(y0)), (int(x1), int(y1)), color=(0, 255, 0), thickness=3)
+    for boxes, color in [(reference_boxes, (255, 0, 0)), (transformed_text_boxes, (0, 0, 255))]:
+        cv2.polylines(
+            annotated_image,
+            list(np.asarray(boxes, dtype=np.int32).reshape(-1, 4, 1, 2)),
+            isClosed=True,
+            color=color,
+            thickness=2
+        )
+    return annotated_image
+
+
+def pack_text_boxes(text_boxes: Union[List[List[Tuple[int, int]]], np.ndarray]) -> np.ndarray:
+    r"""Retourne les coins des boîtes `text_boxes` sous la forme d'un unique tableau float32 (N, 4, 2), sans copie si
+    `text_boxes` est déjà un tel tableau."""
+    return np.asarray(text_boxes, dtype=np.float32).reshape(-1, 4, 2)
+
+
+def transform_text_boxes(
+    text_boxes: Union[List[List[Tuple[int, int]]], np.ndarray],
+    transformation_matrix: np.ndarray
+) -> np.ndarray:
+    r"""Applique la matrice de transformation `transformation_matrix` à tous les coins de toutes les boîtes de
+    `text_boxes` en un seul appel à `cv2.transform`.
+
+    Parameters
+    ----------
+    text_boxes : list of lists of tuples of int and int, or numpy.ndarray
+        liste des coordonnées des points définissant les boîtes entourant les éléments de texte extraits, ou tableau
+        (N, 4, 2) de ces coordonnées.
+    transformation_matrix : numpy.ndarray
+        la matrice de transformation affine (2 x 3) à appliquer.
+
+    Returns
+    -------
+    numpy.ndarray
+        le tableau float32 (N, 4, 2) des coordonnées des coins des boîtes après transformation.
+    """
+    text_boxes_corners: np.ndarray = pack_text_boxes(text_boxes)
+    if len(text_boxes_corners) == 0:
+        return text_boxes_corners
+    # cv2.transform attend un tableau de points à 2 canaux de forme (N * 4, 1, 2)
+    return cv2.transform(text_boxes_corners.reshape(-1, 1, 2), transformation_matrix).reshape(-1, 4, 2)
+
+
+def get_box_bounding_rectangle(box_corners) -> Tuple[float, float, float, float]:
+    r"""Retourne le rectangle (x0, y0, x1, y1) aux côtés parallèles aux axes englobant les coins `box_corners`."""
+    x_coordinates = [float(corner[0]) for corner in box_corners]
+    y_coordinates = [float(corner[1]) for corner in box_corners]
+    return min(x_coordinates), min(y_coordinates), max(x_coordinates), max(y_coordinates)
+
+
+def get_field_rectangles(field_corners: List) -> List[Tuple[float, float, float, float]]:
+    r"""Retourne la liste des rectangles (x0, y0, x1, y1) d'un champ à extraire tel que lu par `read_form_config_file`,
+    c'est-à-dire défini par une seule boîte (liste de 4 coins) ou par une liste de boîtes."""
+    if isinstance(field_corners[0], tuple):
+        return [get_box_bounding_rectangle(field_corners)]
+    return [get_box_bounding_rectangle(box_corners) for box_corners in field_corners]
+
+
+def pack_field_rectangles(fields_to_extract: Dict[str, List]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    r"""Regroupe les rectangles de tous les champs à extraire dans un seul tableau.
+
+    Parameters
+    ----------
+    fields_to_extract : dict
+        les champs à extraire, tels que lus par `read_form_config_file`.
+
+    Returns
+    -------
+    - list of str
+        les noms des champs à extraire.
+    - numpy.ndarray
+        le tableau float32 (M, 4) des rectangles (x0, y0, x1, y1) de toutes les boîtes des champs, dans l'ordre des champs.
+    - numpy.ndarray
+        le tableau int32 (M,) de l'indice du champ de chaque boîte dans la liste des noms des champs.
+    """
+    field_rectangles: List[Tuple[float, float, float, float]] = []
+    field_box_field_indices: List[int] = []
+    for field_index, field_corners in enumerate(fields_to_extract.values()):
+        for field_rectangle in get_field_rectangles(field_corners):
+            field_rectangles.append(field_rectangle)
+            field_box_field_indices.append(field_index)
+    return (
+        list(fields_to_extract.keys()),
+        np.array(field_rectangles, dtype=np.float32).reshape(-1, 4),
+        np.array(field_box_field_indices, dtype=np.int32)
+    )
 
-    pickle.dump(transformation_matrix, open(f"{utils.TEMPORARY_FILE_DIRECTORY_STR}/transformation_matrix.dump", "wb"))
 
-    # apply transformation to each input box to compare with reference boxes
-    transformed_input_boxes: List[List[np.ndarray]] = []
-    for input_document_text_box in input_document_text_boxes:
-        transformed_input_boxes.append([])
-        for corner in input_document_text_box:
-            transformed_corner: np.ndarray = transformation_matrix.dot(np.array([corner[0], corner[1], 1]))
-            transformed_input_boxes[-1].append(transformed_corner)
+@instrumentation.instrumented("field_matching")
+def extract_fields_from_text_boxes(
+    text_boxes: Union[List, np.ndarray],
+    text_elements: List[str],
+    field_names: List[str],
+    field_boxes: np.ndarray,
+    field_box_field_indices: np.ndarray,
+    area_ratio_threshold: float = FIELD_AREA_RATIO_THRESHOLD,
+    field_boxes_index: Optional[UniformGridIndex] = None
+) -> Dict[str, str]:
+    r"""Associe chaque élément de texte au champ à extraire dont l'une des boîtes recouvre le plus sa boîte, à condition
+    que la part de la surface de la boîte de l'élément de texte recouverte dépasse `area_ratio_threshold`, puis retourne
+    les couples {nom du champ : valeur du champ}. Les surfaces d'intersection de toutes les boîtes des éléments de texte
+    avec toutes les boîtes des champs sont calculées en une seule fois, ou, si l'index spatial `field_boxes_index` est
+    fourni, seulement pour les couples de boîtes pouvant se recouvrir.
 
-    for transformed_box, text_element_str in zip(transformed_input_boxes, input_document_text_elements):
-        logging.debug(f"{text_element_str} ----- {transformed_box}")
+    Parameters
+    ----------
+    text_boxes : list or numpy.ndarray
+        liste, ou tableau (N, 4, 2) tel que retourné par `transform_text_boxes`, des coordonnées des coins des boîtes
+        entourant les éléments de texte, exprimées dans le repère de l'image de référence du formulaire (c'est-à-dire
+        après transformation).
+    text_elements : list of str
+        liste des éléments de texte correspondant aux boîtes `text_boxes`.
+    field_names : list of str
+        les noms des champs à extraire.
+    field_boxes : numpy.ndarray
+        le tableau (M, 4) des rectangles (x0, y0, x1, y1) des boîtes des champs, dans l'ordre des champs.
+    field_box_field_indices : numpy.ndarray
+        le tableau (M,) de l'indice dans `field_names` du champ de chaque boîte.
+    area_ratio_threshold : float, default=FIELD_AREA_RATIO_THRESHOLD
+        part minimale de la surface de la boîte d'un élément de texte devant recouvrir une boîte d'un champ.
+    field_boxes_index : UniformGridIndex, optional, default=None
+        l'index spatial construit sur `field_boxes`, une seule fois par formulaire.
 
-    os.remove(png_document_path_str)
-    os.remove(transformed_image_path_str)
-#    raise NotImplementedError
+    Returns
+    -------
+    dict of str to str
+        les couples {nom du champ : valeur du champ}, la valeur étant la concaténation des éléments de texte associés au
+        champ, séparés par des espaces.
+    """
+    fields_text_elements: Dict[str, List[str]] = {field_name: [] for field_name in field_names}
+    text_boxes_corners: np.ndarray = pack_text_boxes(text_boxes)
+    text_boxes_rectangles: np.ndarray = \
+        np.concatenate([text_boxes_corners.min(axis=1), text_boxes_corners.max(axis=1)], axis=1)
+    matched_field_boxes: np.ndarray = boxMatching.match_boxes_to_fields(
+        boxes=text_boxes_rectangles,
+        field_boxes=field_boxes,
+        area_ratio_threshold=area_ratio_threshold,
+        field_boxes_index=field_boxes_index
+    )
+    for text_element_str, matched_field_box in zip(text_elements, matched_field_boxes):
+        if matched_field_box >= 0:
+            fields_text_elements[field_names[field_box_field_indices[matched_field_box]]].append(text_element_str)
+    return {field_name: " ".join(field_text_elements) for field_name, field_text_elements in fields_text_elements.items()}
+
+
+def crop_field_images(
+    aligned_image: np.ndarray,
+    field_boxes: np.ndarray,
+    margin_in_pixels: int = FIELD_CROP_MARGIN_IN_PIXELS
+) -> Tuple[List[np.ndarray], np.ndarray]:
+    r"""Découpe en mémoire, sans copie, les boîtes des champs dans l'image alignée sur l'image de référence.
+
+    Parameters
+    ----------
+    aligned_image : numpy.ndarray
+        l'image BGR du document après transformation affine, dans le repère de l'image de référence.
+    field_boxes : numpy.ndarray
+        le tableau (M, 4) des rectangles (x0, y0, x1, y1) des boîtes des champs.
+    margin_in_pixels : int, default=FIELD_CROP_MARGIN_IN_PIXELS
+        la marge ajoutée autour de chaque boîte.
+
+    Returns
+    -------
+    - list of numpy.ndarray
+        les découpes (vues sur `aligned_image`) des boîtes recouvrant au moins un pixel de l'image.
+    - numpy.ndarray
+        le tableau (K,) des indices, dans `field_boxes`, des boîtes découpées.
+    """
+    image_height, image_width = aligned_image.shape[:2]
+    field_rectangles: np.ndarray = np.rint(np.asarray(field_boxes, dtype=np.float32).reshape(-1, 4)).astype(np.int64)
+    field_rectangles[:, :2] -= margin_in_pixels
+    field_rectangles[:, 2:] += margin_in_pixels
+    field_rectangles[:, [0, 2]] = np.clip(field_rectangles[:, [0, 2]], 0, image_width)
+    field_rectangles[:, [1, 3]] = np.clip(field_rectangles[:, [1, 3]], 0, image_height)
+    cropped_field_box_indices: np.ndarray = np.flatnonzero(
+        (field_rectangles[:, 2] > field_rectangles[:, 0]) & (field_rectangles[:, 3] > field_rectangles[:, 1])
+    )
+    field_crops: List[np.ndarray] = [aligned_image[y0:y1, x0:x1]
+                                     for x0, y0, x1, y1 in field_rectangles[cropped_field_box_indices].tolist()]
+    return field_crops, cropped_field_box_indices
+
+
+@instrumentation.instrumented("field_crops_recognition")
+def recognize_field_crops(field_crops: List[np.ndarray], ocr_model: paddleocr.PaddleOCR) -> List[Tuple[str, float]]:
+    r"""Reconnaît le texte de toutes les découpes `field_crops` en un seul appel au seul module de reconnaissance de
+    PaddleOCR, qui les traite par lots, sans détection ni classification du sens du texte, l'image étant déjà alignée.
+
+    Returns
+    -------
+    list of tuples of str and float
+        le texte reconnu et son score, dans l'ordre des découpes.
+    """
+    if len(field_crops) == 0:
+        return []
+    # équivalent par lots de ocr_model.ocr(img=field_crop, det=False, rec=True, cls=False)
+    recognition_results, _ = ocr_model.text_recognizer(list(field_crops))
+    return [(text_str, float(score)) for text_str, score in recognition_results]
+
+
+def extract_fields_from_field_crops(
+    aligned_image: np.ndarray,
+    field_names: List[str],
+    field_boxes: np.ndarray,
+    field_box_field_indices: np.ndarray,
+    ocr_model: paddleocr.PaddleOCR,
+    min_recognition_score: float = FIELD_CROP_MIN_RECOGNITION_SCORE
+) -> Dict[str, str]:
+    r"""Extrait les champs d'une image alignée sur l'image de référence en reconnaissant directement le texte de la
+    découpe de chaque boîte des champs, bien moins coûteux qu'une détection et une reconnaissance de la page entière.
+
+    Parameters
+    ----------
+    aligned_image : numpy.ndarray
+        l'image BGR du document après transformation affine, dans le repère de l'image de référence.
+    field_names : list of str
+        les noms des champs à extraire.
+    field_boxes : numpy.ndarray
+        le tableau (M, 4) des rectangles (x0, y0, x1, y1) des boîtes des champs, dans l'ordre des champs.
+    field_box_field_indices : numpy.ndarray
+        le tableau (M,) de l'indice dans `field_names` du champ de chaque boîte.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR dont seul le module de reconnaissance est utilisé.
+    min_recognition_score : float, default=FIELD_CROP_MIN_RECOGNITION_SCORE
+        score de reconnaissance minimal du texte d'une découpe.
+
+    Returns
+    -------
+    dict of str to str
+        les couples {nom du champ : valeur du champ}, la valeur étant la concaténation des textes reconnus dans les
+        boîtes du champ, séparés par des espaces.
+    """
+    fields_text_elements: Dict[str, List[str]] = {field_name: [] for field_name in field_names}
+    field_crops, cropped_field_box_indices = crop_field_images(aligned_image, field_boxes)
+    for field_box_index, (text_str, score) in zip(cropped_field_box_indices.tolist(),
+                                                  recognize_field_crops(field_crops, ocr_model)):
+        if text_str.strip() and score >= min_recognition_score:
+            fields_text_elements[field_names[field_box_field_indices[field_box_index]]].append(text_str.strip())
+    return {field_name: " ".join(field_text_elements) for field_name, field_text_elements in fields_text_elements.items()}
 
 
 def register_document_as_reference(
@@ -230,7 +1176,8 @@ def register_document_as_reference(
     )
 
     # Get boxes and size from reference image, to later perform match with input image
-    reference_image_ocr_results = ocr_model.ocr(img=reference_image_path_str, det=True, rec=True, cls=False)
+    reference_image_ocr_results = \
+        ocrCache.paddleocr_ocr(ocr_model, img=reference_image_path_str, det=True, rec=True, cls=False)
     reference_image_allBoxes: List[List[Tuple[int, int]]] = \
         [reference_image_ocr_result[0] for reference_image_ocr_result in reference_image_ocr_results]
     reference_image_allTexts: List[str] = \
@@ -261,6 +1208,11 @@ def register_document_as_reference(
         os.remove(temp_reference_config_file.name)
         raise
 
+    # importé ici pour éviter une importation circulaire, le registre s'appuyant sur read_form_config_file
+    from src.pipeline.form_config_registry import refresh_form_config_registry
+    # rend la nouvelle configuration immédiatement disponible aux extractions suivantes
+    refresh_form_config_registry(reference_documents_dir_path)
+
 
 def reshape_corners_positions(x0, y0, width, height) -> List[Tuple[int, int]]:
     x0, y0, width, height = int(x0), int(y0), int(width), int(height)
@@ -276,9 +1228,11 @@ def read_form_config_file(form_config_file_path: str) -> Dict:
         field_name_1: positions, i.e. list of 4 floats or list of lists of 4 floats, corresponding to x0, y0, width, height.
         field_name_2: same
         ...
-    reference_texts: list of 3 strings
-    reference_boxes: list of boxes, i.e. list of 3 lists of 4 lists of 2 float, describing the x, y coordinates of each corner.
+    reference_texts: list of N >= 4 strings (see ALIGNMENT_MIN_INLIERS_COUNT)
+    reference_boxes: list of boxes, i.e. list of N lists of 4 lists of 2 float, describing the x, y coordinates of each corner.
     reference_size: list of 2 floats, i.e. height and width of the reference image
+    identification_strips (optional): list of lists of 2 floats, i.e. start and end of the page strips, as fractions of
+        the page height, where the CERFA number is searched for
     """
     with open(form_config_file_path, "r") as form_json_config_file:
         form_config_file_dict = json.load(form_json_config_file)
@@ -303,4 +1257,8 @@ def read_form_config_file(form_config_file_path: str) -> Dict:
     reference_height, reference_width = form_config_file_dict[FORM_REFERENCE_SIZE_FIELD_NAME_STR]
     resulting_form_config_file_dict[FORM_REFERENCE_SIZE_FIELD_NAME_STR] = \
         (int(reference_height), int(reference_width))
+    resulting_form_config_file_dict[FORM_IDENTIFICATION_STRIPS_FIELD_NAME_STR] = [
+        (float(y0_ratio), float(y1_ratio))
+            for y0_ratio, y1_ratio in form_config_file_dict.get(FORM_IDENTIFICATION_STRIPS_FIELD_NAME_STR, [])
+    ]
     return resulting_form_config_file_dict
@@ -0,0 +1,149 @@
+import json
+import fitz
+import pytest
+import src.util.ocr_cache as ocrCache
+from src.util.document_loader import load_document_text_layer
+import src.pipeline.batch_pipeline_PaddleOCR as batchPipeline
+import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+
+
+# éléments de texte de référence, imprimés aux mêmes positions sur chaque page
+REFERENCE_TEXTS = [((60, 60), "Alpha premier repere"), ((400, 80), "Bravo second repere"),
+                   ((60, 780), "Charlie troisieme repere"), ((380, 760), "Delta quatrieme repere")]
+# rectangle, en points, du champ de chaque page
+FIELD_RECTANGLE = (200, 400, 400, 420)
+PAGE_SIZE = (595, 842)
+
+
+class FakePaddleOCR:
+    r"""Modèle OCR qui ne doit jamais être appelé, toutes les pages des documents de test étant numériques."""
+
+    def ocr(self, img, det=True, rec=True, cls=True):
+        raise AssertionError("Une page numérique ne doit pas être OCRisée")
+
+
+def add_page(pdf_document, form_number_str, field_name_str, field_value_str):
+    pdf_page = pdf_document.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+    for point, text_str in REFERENCE_TEXTS:
+        pdf_page.insert_text(point, text_str, fontsize=10)
+    if form_number_str is not None:
+        pdf_page.insert_text((450, 40), f"N° {form_number_str}", fontsize=10)
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = field_name_str
+    widget.rect = fitz.Rect(*FIELD_RECTANGLE)
+    if field_value_str:
+        widget.field_value = field_value_str
+    pdf_page.add_widget(widget)
+
+
+def save_pdf(dir_path, pages, file_name_str="document.pdf"):
+    pdf_document = fitz.open()
+    for form_number_str, field_name_str, field_value_str in pages:
+        add_page(pdf_document, form_number_str, field_name_str, field_value_str)
+    pdf_document_path = str(dir_path / file_name_str)
+    pdf_document.save(pdf_document_path)
+    pdf_document.close()
+    return pdf_document_path
+
+
+@pytest.fixture
+def configuration_files_dir_path(tmp_path, monkeypatch):
+    r"""Configurations, au repère d'une page rendue à 72 dpi, des pages 1 et 2 du formulaire 12485*03 et de la page 1
+    du formulaire 13749*05, chacune d'un seul champ."""
+    monkeypatch.setenv(ocrCache.OCR_CACHE_PATH_ENVIRONMENT_VARIABLE_STR, "")
+    # boîtes des éléments de texte de référence, lues dans la couche texte d'une page du formulaire
+    text_layer = load_document_text_layer(save_pdf(tmp_path, [(None, "champ", "")], "reference.pdf"),
+                                          image_quality_in_dpi=72)
+    reference_boxes = [text_layer.text_boxes[text_layer.text_elements.index(text_str)]
+                       for _, text_str in REFERENCE_TEXTS]
+    x0, y0, x1, y1 = FIELD_RECTANGLE
+    configuration_files_dir_path = tmp_path / "configs"
+    configuration_files_dir_path.mkdir()
+    for form_config_key_str, field_name_str in [("12485_03", "nom"), ("12485_03_p2", "adresse"),
+                                                ("13749_05", "montant")]:
+        with open(configuration_files_dir_path / f"cerfa_{form_config_key_str}.json", "w") as form_config_file:
+            json.dump({
+                "fields_to_extract": {field_name_str: [x0, y0, x1 - x0, y1 - y0]},
+                "reference_texts": [text_str for _, text_str in REFERENCE_TEXTS],
+                "reference_boxes": reference_boxes,
+                "reference_size": [PAGE_SIZE[1], PAGE_SIZE[0]]
+            }, form_config_file)
+    return str(configuration_files_dir_path)
+
+
+def extract_multipage_document(document_path, configuration_files_dir_path):
+    return ocrPipeline.extract_multipage_document(document_path, configuration_files_dir_path, FakePaddleOCR(),
+                                                  image_quality_in_dpi=72)
+
+
+def get_pages_summary(document_record):
+    return [(page_record["form_number"], page_record["page_number"], page_record["fields"])
+            for page_record in document_record["pages"]]
+
+
+def test_page_without_form_number_is_the_next_page_of_the_form(tmp_path, configuration_files_dir_path):
+    document_path = save_pdf(tmp_path, [("12485*03", "nom", "Dupont"), (None, "adresse", "1 rue de la Paix"),
+                                        ("13749*05", "montant", "100")])
+    document_record = extract_multipage_document(document_path, configuration_files_dir_path)
+    assert get_pages_summary(document_record) == [
+        ("12485_03", 1, {"nom": "Dupont"}), ("12485_03", 2, {"adresse": "1 rue de la Paix"}),
+        ("13749_05", 1, {"montant": "100"})
+    ]
+    assert all(page_record["error"] is None and page_record["alignment"] is not None
+               for page_record in document_record["pages"])
+    assert document_record["fields"] == {"12485_03": {"nom": "Dupont", "adresse": "1 rue de la Paix"},
+                                         "13749_05": {"montant": "100"}}
+
+
+def test_form_number_without_next_page_config_starts_a_new_copy_of_the_form(tmp_path, configuration_files_dir_path):
+    # aucune configuration cerfa_12485_03_p3.json : la 3e page est la 1re page d'un nouvel exemplaire du formulaire,
+    # dont le champ vide n'écrase pas la valeur lue sur le premier exemplaire, contrairement au champ rempli de sa 2e page
+    document_path = save_pdf(tmp_path, [("12485*03", "nom", "Dupont"), ("12485*03", "adresse", "1 rue de la Paix"),
+                                        ("12485*03", "nom", ""), ("12485*03", "adresse", "2 avenue Foch")])
+    document_record = extract_multipage_document(document_path, configuration_files_dir_path)
+    assert get_pages_summary(document_record) == [
+        ("12485_03", 1, {"nom": "Dupont"}), ("12485_03", 2, {"adresse": "1 rue de la Paix"}),
+        ("12485_03", 1, {"nom": ""}), ("12485_03", 2, {"adresse": "2 avenue Foch"})
+    ]
+    assert document_record["fields"] == {"12485_03": {"nom": "Dupont", "adresse": "2 avenue Foch"}}
+
+
+def test_pages_that_cannot_be_extracted_are_reported_without_stopping(tmp_path, configuration_files_dir_path):
+    # 1re page sans numéro CERFA, page suivante sans configuration (cerfa_13749_05_p2.json), formulaire inconnu
+    document_path = save_pdf(tmp_path, [(None, "nom", "Dupont"), ("13749*05", "montant", "100"),
+                                        (None, "montant", "200"), ("99999*01", "nom", "Durand")])
+    document_record = extract_multipage_document(document_path, configuration_files_dir_path)
+    assert get_pages_summary(document_record) == [
+        (None, None, None), ("13749_05", 1, {"montant": "100"}), ("13749_05", 2, None), ("99999_01", 1, None)
+    ]
+    errors = [page_record["error"] for page_record in document_record["pages"]]
+    assert "Aucun numéro de formulaire CERFA" in errors[0] and errors[1] is None
+    assert "cerfa_13749_05_p2.json" in errors[2] and "cerfa_99999_01.json" in errors[3]
+    assert document_record["fields"] == {"13749_05": {"montant": "100"}}
+
+
+def test_multipage_documents_are_extracted_page_by_page_in_batch(tmp_path, configuration_files_dir_path, monkeypatch):
+    monkeypatch.setattr(batchPipeline, "DOCUMENT_IMAGE_QUALITY_IN_DPI", 72)
+    document_path = save_pdf(tmp_path, [("12485*03", "nom", "Dupont"), (None, "adresse", "1 rue de la Paix")])
+    output_jsonl_path = str(tmp_path / "results.jsonl")
+    batchPipeline.extract_documents_in_batch(document_path, configuration_files_dir_path, FakePaddleOCR(),
+                                             output_jsonl_path, render_workers_count=1, alignment_workers_count=1)
+    with open(output_jsonl_path) as output_jsonl_file:
+        result, = [json.loads(line) for line in output_jsonl_file]
+    assert result["error"] is None and result["form_number"] == "12485_03"
+    assert [page_record["page_number"] for page_record in result["pages"]] == [1, 2]
+    assert result["fields"] == {"12485_03": {"nom": "Dupont", "adresse": "1 rue de la Paix"}}
+
+
+def test_digital_documents_are_not_ocrised_in_batch(tmp_path, configuration_files_dir_path, monkeypatch):
+    monkeypatch.setattr(batchPipeline, "DOCUMENT_IMAGE_QUALITY_IN_DPI", 72)
+    document_path = save_pdf(tmp_path, [("12485*03", "nom", "Dupont")])
+    output_jsonl_path = str(tmp_path / "results.jsonl")
+    # FakePaddleOCR échoue s'il est appelé
+    batchPipeline.extract_documents_in_batch(document_path, configuration_files_dir_path, FakePaddleOCR(),
+                                             output_jsonl_path, render_workers_count=1, alignment_workers_count=1)
+    with open(output_jsonl_path) as output_jsonl_file:
+        result, = [json.loads(line) for line in output_jsonl_file]
+    assert result["error"] is None and result["pages"] is None
+    assert (result["form_number"], result["fields"]) == ("12485_03", {"nom": "Dupont"})
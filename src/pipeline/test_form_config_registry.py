@@ -0,0 +1,99 @@
+import json
+import os
+import re
+import numpy as np
+import pytest
+from src.pipeline.form_config_registry import FORM_CONFIG_FILE_NAME_REGEXP, FormConfigRegistry
+
+
+# configuration minimale d'un formulaire : 4 éléments de texte de référence et 2 champs, dont un de 2 boîtes
+FORM_CONFIG_DICT = {
+    "fields_to_extract": {"nom": [10, 20, 100, 30], "adresse": [[10, 60, 100, 30], [10, 100, 100, 30]]},
+    "reference_texts": ["a", "b", "c", "d"],
+    "reference_boxes": [[[0, 0], [10, 0], [10, 10], [0, 10]], [[100, 0], [110, 0], [110, 10], [100, 10]],
+                        [[0, 200], [20, 200], [20, 220], [0, 220]], [[100, 200], [110, 200], [110, 210], [100, 210]]],
+    "reference_size": [300, 200]
+}
+
+
+def write_form_config(dir_path, file_name_str, form_config_dict, modification_time_ns=None):
+    form_config_file_path = os.path.join(dir_path, file_name_str)
+    with open(form_config_file_path, "w") as form_config_file:
+        json.dump(form_config_dict, form_config_file)
+    if modification_time_ns is not None:
+        os.utime(form_config_file_path, ns=(modification_time_ns, modification_time_ns))
+    return form_config_file_path
+
+
+@pytest.mark.parametrize("file_name_str, form_number_str", [
+    ("cerfa_12485_03.json", "12485_03"),
+    ("cerfa_12485_03_p2.json", "12485_03_p2"),
+    ("cerfa_12485_03_p12.json", "12485_03_p12"),
+    ("cerfa_12485_03_.json", None),
+    ("cerfa_12485_03_p.json", None),
+    ("cerfa_1248_03.json", None),
+    ("cerfa_12485_03.json.bak", None),
+    ("12485_03.json", None),
+])
+def test_form_config_file_name_regexp(file_name_str, form_number_str):
+    match = re.match(FORM_CONFIG_FILE_NAME_REGEXP, file_name_str)
+    assert (match.group(1) if match is not None else None) == form_number_str
+
+
+def test_configs_are_loaded_once_and_precompiled(tmp_path):
+    write_form_config(tmp_path, "cerfa_12485_03.json", FORM_CONFIG_DICT)
+    write_form_config(tmp_path, "cerfa_12485_03_p2.json", FORM_CONFIG_DICT)
+    write_form_config(tmp_path, "cerfa_12485_03_.json", FORM_CONFIG_DICT)
+    registry = FormConfigRegistry(str(tmp_path))
+    assert registry.get_form_numbers() == ["12485_03", "12485_03_p2"]
+    assert "12485_03" in registry and registry.get("99999_99") is None
+
+    form_config = registry.get("12485_03")
+    np.testing.assert_array_equal(form_config.reference_points, [[5, 5], [105, 5], [10, 210], [105, 205]])
+    assert form_config.reference_points.dtype == np.float32
+    assert form_config.field_names == ["nom", "adresse"]
+    np.testing.assert_array_equal(form_config.field_boxes, [[10, 20, 110, 50], [10, 60, 110, 90], [10, 100, 110, 130]])
+    np.testing.assert_array_equal(form_config.field_box_field_indices, [0, 1, 1])
+    # un nouvel appel à refresh ne recharge pas les fichiers inchangés
+    assert registry.refresh() == []
+    assert registry.get("12485_03") is form_config
+
+
+def test_config_is_reloaded_when_its_modification_time_changes(tmp_path):
+    form_config_file_path = write_form_config(tmp_path, "cerfa_12485_03.json", FORM_CONFIG_DICT, 10 ** 18)
+    registry = FormConfigRegistry(str(tmp_path))
+    form_config = registry.get("12485_03")
+
+    modified_form_config_dict = dict(FORM_CONFIG_DICT, reference_texts=["e", "f", "g", "h"])
+    write_form_config(tmp_path, "cerfa_12485_03.json", modified_form_config_dict, 10 ** 18 + 1)
+    assert registry.refresh() == ["12485_03"]
+    assert registry.get("12485_03") is not form_config
+    assert registry.get("12485_03").reference_texts == ["e", "f", "g", "h"]
+
+    os.remove(form_config_file_path)
+    registry.refresh()
+    assert registry.get("12485_03") is None
+
+
+def test_invalid_config_keeps_the_previous_one(tmp_path):
+    write_form_config(tmp_path, "cerfa_12485_03.json", FORM_CONFIG_DICT, 10 ** 18)
+    write_form_config(tmp_path, "cerfa_14011_03.json", dict(FORM_CONFIG_DICT, reference_texts=["a"]))
+    registry = FormConfigRegistry(str(tmp_path))
+    assert registry.get_form_numbers() == ["12485_03"]
+    form_config = registry.get("12485_03")
+
+    write_form_config(tmp_path, "cerfa_12485_03.json", {"reference_texts": []}, 10 ** 18 + 1)
+    assert registry.refresh() == []
+    assert registry.get("12485_03") is form_config
+
+
+def test_identification_strips_are_read_from_the_configs(tmp_path):
+    write_form_config(tmp_path, "cerfa_12485_03.json", dict(FORM_CONFIG_DICT, identification_strips=[[0.4, 0.5]]))
+    write_form_config(tmp_path, "cerfa_12485_03_p2.json", dict(FORM_CONFIG_DICT, identification_strips=[[0.4, 0.5]]))
+    write_form_config(tmp_path, "cerfa_13749_05.json", FORM_CONFIG_DICT)
+    # bande hors de la page : le fichier est ignoré
+    write_form_config(tmp_path, "cerfa_14011_03.json", dict(FORM_CONFIG_DICT, identification_strips=[[0.9, 1.2]]))
+    registry = FormConfigRegistry(str(tmp_path))
+    assert registry.get_form_numbers() == ["12485_03", "12485_03_p2", "13749_05"]
+    assert registry.get("13749_05").identification_strips == []
+    assert registry.get_identification_strips() == [(0.4, 0.5)]
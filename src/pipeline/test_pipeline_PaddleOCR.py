@@ -33,6 +33,7 @@ ocrPipeline.extract_document(
 # ocrPipeline.register_document(
 #     document_to_register_path="data/empty_forms/non-editable/cerfa_12485_03.png",
 #     reference_documents_dir_path="data/configs_extraction",
-#     document_to_register_reference_texts=["cerfa", "S 3704b", "Déclaration signée le"],
+#     document_to_register_reference_texts=["cerfa", "S 3704b", "Déclaration signée le", "DÉCLARATION DE CHOIX DU MÉDECIN TRAITANT",
+#                                           "Date de naissance", "Nom et prénom du médecin traitant", "Identifiant"],
 #     ocr_model=ocr_model
 # )
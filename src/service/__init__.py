@@ -0,0 +1,3 @@
+"""
+Service HTTP d'extraction des formulaires CERFA, dont les modèles sont chargés une seule fois au démarrage.
+"""
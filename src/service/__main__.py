@@ -0,0 +1,20 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import List, Optional
+import argparse
+import logging
+import uvicorn
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Service HTTP d'extraction des formulaires CERFA")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", default=8000, type=int)
+    parsed_arguments = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.INFO)
+    # un seul processus : les réserves de modèles (voir FORMIABLE_*_POOL_SIZE) y sont partagées par toutes les requêtes
+    uvicorn.run("src.service.app:app", host=parsed_arguments.host, port=parsed_arguments.port, workers=1)
+
+
+if __name__ == "__main__":
+    main()
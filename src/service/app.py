@@ -0,0 +1,319 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Dict, Iterator, List, Literal, Optional
+import contextlib
+import logging
+import os
+import queue
+import sys
+import threading
+from pathlib import Path
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from PIL import Image
+import src.util.utils as utils
+import src.util.instrumentation as instrumentation
+import src.util.workspace as jobWorkspace
+import src.models.auto_rotation_translation.functions as ocrFunctions
+import src.models.classify_form.PaddleOCR_TextMatch.classify as ocrExtractor
+import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+from src.pipeline.form_config_registry import get_form_config_registry
+from src.service.model_pool import ModelPool, warm_up_model_pools
+
+
+class ServiceSettings:
+    r"""Paramètres du service, lus dans les variables d'environnement :
+    - FORMIABLE_CONFIGURATION_FILES_DIR_PATH : répertoire des fichiers de configuration JSON des formulaires CERFA,
+    - FORMIABLE_PADDLEOCR_POOL_SIZE : nombre d'instances de PaddleOCR (1 par défaut),
+    - FORMIABLE_DOCTR_POOL_SIZE : nombre d'instances de docTR (0 par défaut, docTR n'étant alors pas chargé),
+    - FORMIABLE_DONUT_MODEL_PATH : répertoire du modèle DONUT entraîné, vide pour ne pas charger DONUT,
+    - FORMIABLE_DONUT_POOL_SIZE : nombre d'instances de DONUT (1 par défaut),
+    - FORMIABLE_MODEL_BORROW_TIMEOUT_IN_SECONDS : attente maximale d'une instance libre avant de répondre 503."""
+
+    def __init__(self):
+        self.configuration_files_dir_path_str: str = \
+            os.environ.get("FORMIABLE_CONFIGURATION_FILES_DIR_PATH", "./data/configs_extraction")
+        self.paddleocr_pool_size: int = int(os.environ.get("FORMIABLE_PADDLEOCR_POOL_SIZE", "1"))
+        self.doctr_pool_size: int = int(os.environ.get("FORMIABLE_DOCTR_POOL_SIZE", "0"))
+        self.donut_model_path_str: str = \
+            os.environ.get("FORMIABLE_DONUT_MODEL_PATH", "./data/models/donut_trained/20231002_095949")
+        self.donut_pool_size: int = int(os.environ.get("FORMIABLE_DONUT_POOL_SIZE", "1"))
+        self.model_borrow_timeout_in_seconds: float = \
+            float(os.environ.get("FORMIABLE_MODEL_BORROW_TIMEOUT_IN_SECONDS", "60"))
+
+
+def _load_paddleocr_model():
+    import paddleocr
+    return instrumentation.instrument_paddleocr_model(paddleocr.PaddleOCR(use_angle_cls=True, lang='fr'))
+
+
+def _load_doctr_model():
+    # first_pipeline importe ses dépendances relativement au répertoire src
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from first_pipeline import load_doctr_model
+    return load_doctr_model()
+
+
+def _identify_form_with_doctr(document_path_str: str, doctr_model) -> str:
+    from doctr.io import DocumentFile
+    from first_pipeline import identify_cerfa
+    if document_path_str.endswith(".pdf"):
+        doctr_document = DocumentFile.from_pdf(document_path_str)
+    else:
+        doctr_document = DocumentFile.from_images(document_path_str)
+    return identify_cerfa(doctr_model(doctr_document))
+
+
+def _get_donut_model_factory(donut_model_path_str: str):
+    def load_donut_model():
+        # importé ici pour ne charger torch et DONUT que s'ils sont utilisés
+        import src.testing_donut as donut
+        return donut.load_model(donut_model_path_str)
+    return load_donut_model
+
+
+@contextlib.contextmanager
+def _pipeline_errors_as_http_errors() -> Iterator[None]:
+    r"""Traduit les erreurs du pipeline en réponses HTTP : configuration absente (AssertionError) en 404, numéro CERFA
+    introuvable ou alignement peu fiable (ValueError) en 422."""
+    try:
+        yield
+    except AssertionError as lAssertionError:
+        raise HTTPException(status_code=404, detail=str(lAssertionError))
+    except ValueError as lValueError:
+        raise HTTPException(status_code=422, detail=str(lValueError))
+
+
+@contextlib.contextmanager
+def _saved_uploaded_document(uploaded_document: UploadFile) -> Iterator[str]:
+    r"""Sauvegarde le document téléversé dans l'espace de travail propre à la requête, supprimé avec tout son contenu à
+    la fin du bloc, et en donne le chemin. Les fichiers intermédiaires des étapes exécutées dans le bloc y sont écrits."""
+    document_extension_str: str = os.path.splitext(uploaded_document.filename or "")[1].lower()
+    with jobWorkspace.scoped_workspace(prefix_str="request_") as request_workspace:
+        document_path_str: str = request_workspace.get_path(f"document{document_extension_str}")
+        with open(document_path_str, "wb") as document_file:
+            document_file.write(uploaded_document.file.read())
+        yield document_path_str
+
+
+def create_app(settings: Optional[ServiceSettings] = None) -> FastAPI:
+    r"""Crée l'application du service d'extraction. Les modèles sont chargés dans un fil d'exécution lancé au démarrage,
+    si bien que la sonde de vivacité (/health/live) répond immédiatement tandis que la sonde de disponibilité
+    (/health/ready) ne répond 200 qu'une fois tous les modèles chargés."""
+    settings = settings or ServiceSettings()
+    paddleocr_pool = ModelPool("paddleocr", _load_paddleocr_model, settings.paddleocr_pool_size)
+    model_pools: List[ModelPool] = [paddleocr_pool]
+    doctr_pool: Optional[ModelPool] = None
+    if settings.doctr_pool_size > 0:
+        doctr_pool = ModelPool("doctr", _load_doctr_model, settings.doctr_pool_size)
+        model_pools.append(doctr_pool)
+    donut_pool: Optional[ModelPool] = None
+    if settings.donut_model_path_str:
+        donut_pool = ModelPool("donut", _get_donut_model_factory(settings.donut_model_path_str), settings.donut_pool_size)
+        model_pools.append(donut_pool)
+    warm_up_errors: List[str] = []
+
+    def warm_up() -> None:
+        try:
+            # les configurations des formulaires sont elles aussi chargées avant de se déclarer prêt
+            get_form_config_registry(settings.configuration_files_dir_path_str)
+            warm_up_model_pools(model_pools)
+        except Exception as lException:
+            logging.exception("Le chargement des modèles a échoué")
+            warm_up_errors.append(repr(lException))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_: FastAPI):
+        threading.Thread(target=warm_up, name="model-pools-warm-up", daemon=True).start()
+        yield
+
+    app = FastAPI(title="formIAble", description="Service d'extraction des formulaires CERFA", lifespan=lifespan)
+
+    @contextlib.contextmanager
+    def borrow_model(model_pool: Optional[ModelPool], engine_str: str):
+        if model_pool is None:
+            raise HTTPException(status_code=400, detail=f"Le moteur {engine_str} n'est pas chargé par ce service")
+        if not model_pool.is_ready():
+            raise HTTPException(status_code=503, detail=f"Le modèle {model_pool.model_name_str} est en cours de chargement")
+        try:
+            with model_pool.borrow(timeout_in_seconds=settings.model_borrow_timeout_in_seconds) as model:
+                yield model
+        except queue.Empty:
+            raise HTTPException(status_code=503, detail=f"Aucune instance du modèle {model_pool.model_name_str} libre")
+
+    def analyse_document(document_name_str: str, document_image: np.ndarray, is_full_page_ocr_needed: bool) -> Dict:
+        # sans OCRisation de la page entière, le formulaire est identifié sur les bandes d'en-tête et de pied de page,
+        # et seuls les éléments de texte de référence sont cherchés pour l'alignement ; un formulaire sans fichier de
+        # configuration est ensuite rejeté par get_form_config, sans autre OCRisation
+        with borrow_model(paddleocr_pool, "paddleocr") as ocr_model, _pipeline_errors_as_http_errors():
+            form_number_str, text_elements, text_boxes = ocrPipeline.identify_form_and_get_text_elements_and_boxes(
+                input_document_path_str=document_name_str,
+                form_image=document_image,
+                ocr_model=ocr_model,
+                configuration_files_dir_path_str=settings.configuration_files_dir_path_str,
+                is_full_page_ocr_needed=is_full_page_ocr_needed
+            )
+        return {"form_number": form_number_str, "text_elements": text_elements, "text_boxes": text_boxes}
+
+    def identify_form(document_name_str: str, document_path_str: str) -> str:
+        # les bandes de la page sont rendues en basse résolution depuis le document, la page entière n'étant rendue et
+        # OCRisée que si le numéro CERFA ne se trouve dans aucune bande
+        with borrow_model(paddleocr_pool, "paddleocr") as ocr_model, _pipeline_errors_as_http_errors():
+            form_number_str: Optional[str] = ocrPipeline.identify_form_on_strips(
+                input_document_path_str=document_path_str,
+                form_image=None,
+                ocr_model=ocr_model,
+                configuration_files_dir_path_str=settings.configuration_files_dir_path_str
+            )
+            if form_number_str is not None:
+                return form_number_str
+            document_image: np.ndarray = utils.get_image_array_from_document(document_path_str)
+            text_elements, _ = ocrPipeline.get_form_image_text_elements_and_boxes(document_image, ocr_model)
+            return ocrExtractor.get_form_number_in_text_elements(
+                input_document_path=document_name_str,
+                text_elements=text_elements
+            )
+
+    @app.get("/health/live")
+    def health_live() -> Dict:
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    def health_ready() -> Dict:
+        if warm_up_errors:
+            raise HTTPException(status_code=500, detail=warm_up_errors[0])
+        not_ready_models: List[str] = \
+            [model_pool.model_name_str for model_pool in model_pools if not model_pool.is_ready()]
+        if not_ready_models:
+            raise HTTPException(status_code=503, detail=f"Modèles en cours de chargement : {not_ready_models}")
+        return {
+            "status": "ready",
+            "available_models": {model_pool.model_name_str: model_pool.get_available_models_count()
+                                 for model_pool in model_pools}
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> str:
+        return instrumentation.metrics_registry.get_prometheus_metrics()
+
+    @app.post("/classify")
+    def classify(document: UploadFile = File(...), engine: Literal["paddleocr", "doctr"] = "paddleocr") -> Dict:
+        r"""Retourne le numéro CERFA du document téléversé."""
+        with _saved_uploaded_document(document) as document_path_str:
+            if engine == "doctr":
+                with borrow_model(doctr_pool, engine) as doctr_model, _pipeline_errors_as_http_errors():
+                    return {"form_number": _identify_form_with_doctr(document_path_str, doctr_model)}
+            return {"form_number": identify_form(document.filename, document_path_str)}
+
+    @app.post("/align")
+    def align(document: UploadFile = File(...)) -> Dict:
+        r"""Retourne le numéro CERFA du document téléversé et la transformation l'alignant sur l'image de référence."""
+        with _saved_uploaded_document(document) as document_path_str:
+            document_image: np.ndarray = utils.get_image_array_from_document(document_path_str)
+        document_analysis: Dict = analyse_document(document.filename, document_image, is_full_page_ocr_needed=False)
+        with _pipeline_errors_as_http_errors():
+            alignment_fit = ocrPipeline.get_alignment_fit(
+                input_document_path_str=document.filename,
+                form_config=ocrPipeline.get_form_config(
+                    input_document_path_str=document.filename,
+                    form_number_str=document_analysis["form_number"],
+                    configuration_files_dir_path_str=settings.configuration_files_dir_path_str
+                ),
+                input_document_text_elements=document_analysis["text_elements"],
+                input_document_text_boxes=document_analysis["text_boxes"]
+            )
+        return {
+            "form_number": document_analysis["form_number"],
+            "transformation_matrix": alignment_fit.affine_transformation_matrix.tolist(),
+            "alignment": alignment_fit.to_dict()
+        }
+
+    @app.post("/extract")
+    def extract(
+        document: UploadFile = File(...),
+        engine: Literal["paddleocr", "paddleocr_crops", "donut"] = "paddleocr"
+    ) -> Dict:
+        r"""Retourne le numéro CERFA du document téléversé et les couples {nom du champ : valeur du champ} extraits, par
+        association des éléments de texte de PaddleOCR aux champs du fichier de configuration, par reconnaissance
+        PaddleOCR des découpes des boîtes des champs dans l'image alignée sur l'image de référence, ou par DONUT sur
+        ladite image alignée.
+
+        Les champs d'un document PDF de plusieurs pages sont extraits page par page par association des éléments de
+        texte (voir `ocrPipeline.extract_multipage_document`) : la réponse indique alors l'enregistrement de chaque page
+        (`pages`) et les champs de toutes les pages réunis par numéro CERFA (`fields`)."""
+        if engine == "donut" and donut_pool is None:
+            raise HTTPException(status_code=400, detail=f"Le moteur {engine} n'est pas chargé par ce service")
+        with _saved_uploaded_document(document) as document_path_str:
+            if utils.get_document_page_count(document_path_str) > 1:
+                if engine != "paddleocr":
+                    raise HTTPException(status_code=400, detail=f"Les documents de plusieurs pages ne sont extraits "
+                                                                f"que par le moteur paddleocr, et non {engine}")
+                with borrow_model(paddleocr_pool, engine) as ocr_model:
+                    document_record: Dict = ocrPipeline.extract_multipage_document(
+                        input_document_path=document_path_str,
+                        configuration_files_dir_path=settings.configuration_files_dir_path_str,
+                        ocr_model=ocr_model
+                    )
+                return {"pages": document_record["pages"], "fields": document_record["fields"]}
+            document_image: np.ndarray = utils.get_image_array_from_document(document_path_str)
+        # seule l'association des éléments de texte aux champs nécessite l'OCRisation de la page entière
+        document_analysis: Dict = analyse_document(document.filename, document_image,
+                                                   is_full_page_ocr_needed=engine == "paddleocr")
+        if engine == "paddleocr":
+            del document_image
+            with _pipeline_errors_as_http_errors():
+                extracted_fields_dict, alignment_fit = ocrPipeline.align_and_extract_fields(
+                    input_document_path_str=document.filename,
+                    form_number_str=document_analysis["form_number"],
+                    input_document_text_elements=document_analysis["text_elements"],
+                    input_document_text_boxes=document_analysis["text_boxes"],
+                    configuration_files_dir_path_str=settings.configuration_files_dir_path_str
+                )
+        else:
+            # l'alignement est vérifié avant de lancer la reconnaissance, afin de ne pas gaspiller une inférence sur une
+            # image mal alignée
+            with _pipeline_errors_as_http_errors():
+                form_config = ocrPipeline.get_form_config(
+                    input_document_path_str=document.filename,
+                    form_number_str=document_analysis["form_number"],
+                    configuration_files_dir_path_str=settings.configuration_files_dir_path_str
+                )
+                alignment_fit = ocrPipeline.get_alignment_fit(
+                    input_document_path_str=document.filename,
+                    form_config=form_config,
+                    input_document_text_elements=document_analysis["text_elements"],
+                    input_document_text_boxes=document_analysis["text_boxes"]
+                )
+            aligned_image: np.ndarray = ocrFunctions.apply_affineTransformation(
+                input_image=document_image,
+                affine_transformation_matrix=alignment_fit.affine_transformation_matrix,
+                output_image_size=form_config.reference_size
+            )
+            del document_image
+            if engine == "paddleocr_crops":
+                with borrow_model(paddleocr_pool, engine) as ocr_model:
+                    extracted_fields_dict = ocrPipeline.extract_fields_from_field_crops(
+                        aligned_image=aligned_image,
+                        field_names=form_config.field_names,
+                        field_boxes=form_config.field_boxes,
+                        field_box_field_indices=form_config.field_box_field_indices,
+                        ocr_model=ocr_model
+                    )
+            else:
+                with borrow_model(donut_pool, engine) as (donut_model, donut_prompt):
+                    import src.testing_donut as donut
+                    extracted_fields_dict = donut.run_model_on_image(
+                        donut_model, donut_prompt, Image.fromarray(cv2.cvtColor(aligned_image, cv2.COLOR_BGR2RGB)),
+                        form_number=document_analysis["form_number"]
+                    )
+        return {
+            "form_number": document_analysis["form_number"],
+            "alignment": alignment_fit.to_dict(),
+            "fields": extracted_fields_dict
+        }
+
+    return app
+
+
+app: FastAPI = create_app()
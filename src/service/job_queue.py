@@ -0,0 +1,260 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Dict, Final, Iterator, Optional, Set, Tuple
+import contextlib
+import json
+import os
+import queue
+import shutil
+# importe le module de base de données SQLite
+import sqlite3
+# importe le module de mesure du temps courant
+import time
+import uuid
+
+
+# --- Constantes ---#
+# variable d'environnement indiquant le chemin de la base SQLite de la file des tâches d'analyse
+JOB_QUEUE_PATH_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_JOB_QUEUE_PATH"
+# chemin par défaut de la base SQLite de la file des tâches d'analyse, les répertoires des tâches étant créés à côté
+DEFAULT_JOB_QUEUE_PATH_STR: Final[str] = "./data/jobs/jobs.sqlite"
+# variable d'environnement indiquant le nombre maximal de tâches en attente au-delà duquel une soumission est refusée
+JOB_QUEUE_MAX_DEPTH_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_JOB_QUEUE_MAX_DEPTH"
+# nombre maximal par défaut de tâches en attente
+DEFAULT_JOB_QUEUE_MAX_DEPTH: Final[int] = 16
+# attente maximale, en secondes, du verrou de la base SQLite partagée par le front-end et les workers
+SQLITE_LOCK_TIMEOUT_IN_SECONDS: Final[float] = 30.
+# durée par défaut, en secondes, du bail d'une tâche en cours : faute de signe de vie de son worker pendant cette durée,
+# la tâche est considérée comme abandonnée
+DEFAULT_JOB_LEASE_IN_SECONDS: Final[float] = 60.
+# nombre maximal par défaut d'exécutions d'une tâche, au-delà duquel une tâche abandonnée échoue au lieu d'être remise
+# en attente, afin qu'un document faisant tomber les workers ne les fasse pas tomber indéfiniment
+DEFAULT_JOB_MAX_ATTEMPTS_COUNT: Final[int] = 2
+# durée par défaut, en secondes, de conservation d'une tâche terminée et de son répertoire, au-delà de laquelle ils sont
+# supprimés, que la page qui l'a soumise ait été fermée ou non
+DEFAULT_JOB_TTL_IN_SECONDS: Final[float] = 3600.
+# -- Les constantes suivantes définissent les états d'une tâche. --#
+JOB_STATUS_QUEUED_STR: Final[str] = "queued"
+JOB_STATUS_RUNNING_STR: Final[str] = "running"
+JOB_STATUS_SUCCEEDED_STR: Final[str] = "succeeded"
+JOB_STATUS_FAILED_STR: Final[str] = "failed"
+
+
+class JobQueue:
+    r"""File des tâches d'analyse de documents, stockée dans une base SQLite partagée par les processus qui soumettent
+    les tâches (front-end Streamlit) et ceux qui les exécutent (workers, voir `src/service/worker.py`). Chaque tâche a un
+    répertoire propre, à côté de la base, où sont déposés le document à analyser et les fichiers produits.
+
+    Le nombre de tâches en attente est borné par `max_depth` : au-delà, `submit` lève queue.Full, que l'appelant traduit
+    en réponse « occupé » plutôt que de laisser la file grossir sans fin. Une tâche passe par les états
+    JOB_STATUS_QUEUED_STR, JOB_STATUS_RUNNING_STR puis JOB_STATUS_SUCCEEDED_STR ou JOB_STATUS_FAILED_STR ; pendant son
+    exécution, l'étape en cours et l'avancement (entre 0 et 1) sont mis à jour pour être affichés par le front-end.
+
+    Une tâche en cours est tenue par un bail que son worker renouvelle (`heartbeat`, `update_progress`) : une tâche dont
+    le bail a expiré, parce que son worker a été interrompu, quel que soit son nom (celui d'un pod disparu par exemple),
+    est remise en attente ou, après `DEFAULT_JOB_MAX_ATTEMPTS_COUNT` exécutions, échoue (voir `requeue_expired_jobs`).
+    Une tâche terminée est supprimée avec son répertoire au plus tard `DEFAULT_JOB_TTL_IN_SECONDS` secondes après sa fin
+    (voir `purge_finished_jobs`), même si la page qui l'a soumise n'a jamais lu son résultat."""
+
+    def __init__(self, job_queue_path_str: str, max_depth: int = DEFAULT_JOB_QUEUE_MAX_DEPTH):
+        assert max_depth >= 1, "La file des tâches doit pouvoir contenir au moins une tâche en attente"
+        self.job_queue_path_str = job_queue_path_str
+        self.max_depth = max_depth
+        os.makedirs(self.get_jobs_dir_path(), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, parameters TEXT NOT NULL, stage TEXT, "
+                "progress REAL NOT NULL DEFAULT 0, result TEXT, error TEXT, worker_name TEXT, "
+                "submission_time REAL NOT NULL, start_time REAL, end_time REAL, heartbeat_time REAL, "
+                "attempts_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            # ajoute les colonnes du bail à une base créée avant leur introduction
+            columns_names = [column[1] for column in connection.execute("PRAGMA table_info(jobs)")]
+            if "heartbeat_time" not in columns_names:
+                connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_time REAL")
+            if "attempts_count" not in columns_names:
+                connection.execute("ALTER TABLE jobs ADD COLUMN attempts_count INTEGER NOT NULL DEFAULT 0")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_submission_time ON jobs (status, submission_time)")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # une connexion par appel : la base est partagée entre processus et fils d'exécution
+        connection = sqlite3.connect(self.job_queue_path_str, timeout=SQLITE_LOCK_TIMEOUT_IN_SECONDS, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def get_jobs_dir_path(self) -> str:
+        return os.path.dirname(os.path.abspath(self.job_queue_path_str))
+
+    def get_job_dir_path(self, job_id_str: str) -> str:
+        r"""Retourne le répertoire propre à la tâche `job_id_str`."""
+        return os.path.join(self.get_jobs_dir_path(), job_id_str)
+
+    def create_job_dir(self) -> str:
+        r"""Réserve un identifiant de tâche et crée son répertoire, où déposer le document avant de soumettre la tâche."""
+        job_id_str: str = uuid.uuid4().hex
+        os.makedirs(self.get_job_dir_path(job_id_str))
+        return job_id_str
+
+    def submit(self, job_id_str: str, parameters: Dict) -> None:
+        r"""Met en attente la tâche `job_id_str`, dont le répertoire a été créé par `create_job_dir`, avec les paramètres
+        `parameters` (sérialisables en JSON). Lève queue.Full si `max_depth` tâches sont déjà en attente."""
+        with self._connect() as connection:
+            # la vérification de la profondeur et l'insertion forment une seule transaction, exclusive en écriture
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                queued_jobs_count: int = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_STATUS_QUEUED_STR,)
+                ).fetchone()[0]
+                if queued_jobs_count >= self.max_depth:
+                    raise queue.Full(f"{queued_jobs_count} tâches sont déjà en attente")
+                connection.execute(
+                    "INSERT INTO jobs (job_id, status, parameters, submission_time) VALUES (?, ?, ?, ?)",
+                    (job_id_str, JOB_STATUS_QUEUED_STR, json.dumps(parameters), time.time())
+                )
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def claim(self, worker_name_str: str) -> Optional[Dict]:
+        r"""Attribue au worker `worker_name_str` la plus ancienne tâche en attente, qui passe à l'état
+        JOB_STATUS_RUNNING_STR, et la retourne, ou retourne None si aucune tâche n'est en attente."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY submission_time LIMIT 1", (JOB_STATUS_QUEUED_STR,)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, worker_name = ?, start_time = ?, heartbeat_time = ?, "
+                    "attempts_count = attempts_count + 1 WHERE job_id = ?",
+                    (JOB_STATUS_RUNNING_STR, worker_name_str, time.time(), time.time(), row[0])
+                )
+            connection.execute("COMMIT")
+        return self.get(row[0]) if row is not None else None
+
+    def update_progress(self, job_id_str: str, stage_str: str, progress: float) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET stage = ?, progress = ?, heartbeat_time = ? WHERE job_id = ?",
+                               (stage_str, progress, time.time(), job_id_str))
+
+    def heartbeat(self, job_id_str: str) -> None:
+        r"""Renouvelle le bail de la tâche en cours `job_id_str`."""
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET heartbeat_time = ? WHERE job_id = ? AND status = ?",
+                               (time.time(), job_id_str, JOB_STATUS_RUNNING_STR))
+
+    def succeed(self, job_id_str: str, result: Dict) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, progress = 1, result = ?, end_time = ? WHERE job_id = ?",
+                (JOB_STATUS_SUCCEEDED_STR, json.dumps(result), time.time(), job_id_str)
+            )
+
+    def fail(self, job_id_str: str, error_str: str) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, end_time = ? WHERE job_id = ?",
+                (JOB_STATUS_FAILED_STR, error_str, time.time(), job_id_str)
+            )
+
+    def get(self, job_id_str: str) -> Optional[Dict]:
+        r"""Retourne l'état de la tâche `job_id_str`, ou None si elle n'existe pas."""
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id_str,)).fetchone()
+        if row is None:
+            return None
+        job: Dict = dict(row)
+        job["parameters"] = json.loads(job["parameters"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["queue_position"] = self.get_queue_position(job_id_str) if job["status"] == JOB_STATUS_QUEUED_STR else 0
+        return job
+
+    def get_queue_position(self, job_id_str: str) -> int:
+        r"""Retourne le nombre de tâches en attente soumises avant la tâche `job_id_str`."""
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND submission_time < "
+                "(SELECT submission_time FROM jobs WHERE job_id = ?)",
+                (JOB_STATUS_QUEUED_STR, job_id_str)
+            ).fetchone()[0]
+
+    def requeue_expired_jobs(
+        self,
+        lease_in_seconds: float = DEFAULT_JOB_LEASE_IN_SECONDS,
+        max_attempts_count: int = DEFAULT_JOB_MAX_ATTEMPTS_COUNT
+    ) -> Tuple[int, int]:
+        r"""Remet en attente les tâches à l'état JOB_STATUS_RUNNING_STR dont le bail n'a pas été renouvelé depuis
+        `lease_in_seconds` secondes, leur worker ayant été interrompu avant de les terminer, ou les fait échouer si
+        elles ont déjà été exécutées `max_attempts_count` fois.
+
+        Returns
+        -------
+        - int
+            le nombre de tâches remises en attente.
+        - int
+            le nombre de tâches ayant échoué.
+        """
+        expiration_time: float = time.time() - lease_in_seconds
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            failed_jobs_count: int = connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, end_time = ? "
+                "WHERE status = ? AND COALESCE(heartbeat_time, start_time, 0) < ? AND attempts_count >= ?",
+                (JOB_STATUS_FAILED_STR, f"L'analyse du document a été interrompue {max_attempts_count} fois",
+                 time.time(), JOB_STATUS_RUNNING_STR, expiration_time, max_attempts_count)
+            ).rowcount
+            requeued_jobs_count: int = connection.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, progress = 0, worker_name = NULL, start_time = NULL, "
+                "heartbeat_time = NULL WHERE status = ? AND COALESCE(heartbeat_time, start_time, 0) < ?",
+                (JOB_STATUS_QUEUED_STR, JOB_STATUS_RUNNING_STR, expiration_time)
+            ).rowcount
+            connection.execute("COMMIT")
+        return requeued_jobs_count, failed_jobs_count
+
+    def purge_finished_jobs(self, ttl_in_seconds: float = DEFAULT_JOB_TTL_IN_SECONDS) -> int:
+        r"""Supprime les tâches terminées (JOB_STATUS_SUCCEEDED_STR ou JOB_STATUS_FAILED_STR) depuis plus de
+        `ttl_in_seconds` secondes, ainsi que leurs répertoires et ceux, plus anciens que `ttl_in_seconds`, d'aucune tâche
+        (document déposé mais jamais soumis).
+
+        Returns
+        -------
+        int
+            le nombre de tâches supprimées.
+        """
+        expiration_time: float = time.time() - ttl_in_seconds
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            expired_jobs_ids: Set[str] = {row[0] for row in connection.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) AND end_time < ?",
+                (JOB_STATUS_SUCCEEDED_STR, JOB_STATUS_FAILED_STR, expiration_time)
+            )}
+            connection.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id_str,) for job_id_str in expired_jobs_ids])
+            connection.execute("COMMIT")
+            jobs_ids: Set[str] = {row[0] for row in connection.execute("SELECT job_id FROM jobs")}
+        with os.scandir(self.get_jobs_dir_path()) as jobs_dir_entries:
+            for jobs_dir_entry in jobs_dir_entries:
+                if jobs_dir_entry.is_dir() and jobs_dir_entry.name not in jobs_ids \
+                        and (jobs_dir_entry.name in expired_jobs_ids or jobs_dir_entry.stat().st_mtime < expiration_time):
+                    shutil.rmtree(jobs_dir_entry.path, ignore_errors=True)
+        return len(expired_jobs_ids)
+
+    def delete(self, job_id_str: str) -> None:
+        r"""Supprime la tâche `job_id_str` et son répertoire, une fois son résultat lu."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM jobs WHERE job_id = ?", (job_id_str,))
+        shutil.rmtree(self.get_job_dir_path(job_id_str), ignore_errors=True)
+
+
+def get_job_queue() -> JobQueue:
+    r"""Retourne la file des tâches au chemin indiqué par la variable d'environnement FORMIABLE_JOB_QUEUE_PATH
+    (DEFAULT_JOB_QUEUE_PATH_STR par défaut), bornée à FORMIABLE_JOB_QUEUE_MAX_DEPTH tâches en attente."""
+    return JobQueue(
+        os.environ.get(JOB_QUEUE_PATH_ENVIRONMENT_VARIABLE_STR, DEFAULT_JOB_QUEUE_PATH_STR),
+        max_depth=int(os.environ.get(JOB_QUEUE_MAX_DEPTH_ENVIRONMENT_VARIABLE_STR, DEFAULT_JOB_QUEUE_MAX_DEPTH))
+    )
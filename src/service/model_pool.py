@@ -0,0 +1,55 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Any, Callable, Iterator, List, Optional
+import contextlib
+import logging
+import queue
+import threading
+import src.util.instrumentation as instrumentation
+
+
+class ModelPool:
+    r"""Réserve d'instances d'un même modèle, chargées une seule fois par `warm_up` puis prêtées à tour de rôle aux
+    requêtes par `borrow`. Une instance n'est jamais utilisée par deux requêtes à la fois, les modèles PaddleOCR, docTR
+    et DONUT n'étant pas conçus pour des appels concurrents."""
+
+    def __init__(self, model_name_str: str, model_factory: Callable[[], Any], pool_size: int):
+        assert pool_size >= 1, f"La réserve du modèle {model_name_str} doit contenir au moins une instance"
+        self.model_name_str = model_name_str
+        self.model_factory = model_factory
+        self.pool_size = pool_size
+        self._available_models: queue.Queue = queue.Queue()
+        self._loaded_models_count: int = 0
+        self._ready_event = threading.Event()
+
+    def warm_up(self) -> None:
+        r"""Charge toutes les instances du modèle. La réserve n'est prête qu'une fois la dernière instance chargée."""
+        while self._loaded_models_count < self.pool_size:
+            logging.info(f"Chargement de l'instance {self._loaded_models_count + 1}/{self.pool_size} du modèle "
+                         f"{self.model_name_str}...")
+            with instrumentation.measure_stage(f"{self.model_name_str}.load"):
+                self._available_models.put(self.model_factory())
+            self._loaded_models_count += 1
+        self._ready_event.set()
+
+    def is_ready(self) -> bool:
+        return self._ready_event.is_set()
+
+    @contextlib.contextmanager
+    def borrow(self, timeout_in_seconds: Optional[float] = None) -> Iterator[Any]:
+        r"""Prête une instance du modèle le temps du bloc, en attendant au plus `timeout_in_seconds` secondes qu'une
+        instance se libère (indéfiniment si None). Lève queue.Empty si aucune instance ne s'est libérée à temps."""
+        model = self._available_models.get(timeout=timeout_in_seconds)
+        try:
+            yield model
+        finally:
+            self._available_models.put(model)
+
+    def get_available_models_count(self) -> int:
+        return self._available_models.qsize()
+
+
+def warm_up_model_pools(model_pools: List[ModelPool]) -> None:
+    r"""Charge successivement les instances de toutes les réserves `model_pools`."""
+    for model_pool in model_pools:
+        model_pool.warm_up()
+    logging.info(f"Modèles prêts : {[model_pool.model_name_str for model_pool in model_pools]}")
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import queue
+import time
+import pytest
+import src.service.job_queue as jobQueue
+from src.service.job_queue import JobQueue
+
+
+def submit_jobs(job_queue, jobs_count):
+    job_ids = []
+    for job_index in range(jobs_count):
+        job_id_str = job_queue.create_job_dir()
+        job_queue.submit(job_id_str, {"job_index": job_index})
+        job_ids.append(job_id_str)
+    return job_ids
+
+
+def claim_jobs(job_queue_path_str, worker_name_str, claimed_jobs_ids):
+    job_queue = JobQueue(job_queue_path_str)
+    while True:
+        job = job_queue.claim(worker_name_str)
+        if job is None:
+            return
+        claimed_jobs_ids.append(job["job_id"])
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"), max_depth=3)
+
+
+def test_submission_beyond_max_depth_is_refused(job_queue):
+    submit_jobs(job_queue, 3)
+    with pytest.raises(queue.Full):
+        submit_jobs(job_queue, 1)
+    # seules les tâches en attente comptent : une tâche attribuée libère une place
+    job_queue.claim("worker")
+    submit_jobs(job_queue, 1)
+
+
+def test_jobs_are_claimed_in_submission_order(job_queue):
+    job_ids = submit_jobs(job_queue, 3)
+    assert [job_queue.get(job_id_str)["queue_position"] for job_id_str in job_ids] == [0, 1, 2]
+    job = job_queue.claim("worker")
+    assert job["job_id"] == job_ids[0] and job["status"] == jobQueue.JOB_STATUS_RUNNING_STR
+    assert job["worker_name"] == "worker" and job["attempts_count"] == 1
+    assert job["parameters"] == {"job_index": 0}
+    assert job_queue.get(job_ids[2])["queue_position"] == 1
+
+
+def test_each_job_is_claimed_once_by_concurrent_workers(tmp_path):
+    job_queue_path_str = str(tmp_path / "jobs.sqlite")
+    job_queue = JobQueue(job_queue_path_str, max_depth=40)
+    job_ids = submit_jobs(job_queue, 40)
+    with multiprocessing.Manager() as manager:
+        claimed_jobs_ids = manager.list()
+        worker_processes = [
+            multiprocessing.Process(target=claim_jobs,
+                                    args=(job_queue_path_str, f"worker-{worker_index}", claimed_jobs_ids))
+            for worker_index in range(4)
+        ]
+        for worker_process in worker_processes:
+            worker_process.start()
+        for worker_process in worker_processes:
+            worker_process.join()
+        assert sorted(claimed_jobs_ids) == sorted(job_ids)
+
+
+def test_job_lifecycle(job_queue):
+    job_id_str, = submit_jobs(job_queue, 1)
+    job_queue.claim("worker")
+    job_queue.update_progress(job_id_str, "alignment", 0.4)
+    assert (job_queue.get(job_id_str)["stage"], job_queue.get(job_id_str)["progress"]) == ("alignment", 0.4)
+    job_queue.succeed(job_id_str, {"fields": {"nom": "Dupont"}})
+    job = job_queue.get(job_id_str)
+    assert job["status"] == jobQueue.JOB_STATUS_SUCCEEDED_STR and job["progress"] == 1
+    assert job["result"] == {"fields": {"nom": "Dupont"}}
+    job_queue.delete(job_id_str)
+    assert job_queue.get(job_id_str) is None
+
+
+def test_jobs_whose_lease_expired_are_requeued_then_failed(job_queue, monkeypatch):
+    clock = [1000.]
+    monkeypatch.setattr(jobQueue.time, "time", lambda: clock[0])
+    abandoned_job_id_str, kept_job_id_str = submit_jobs(job_queue, 2)
+    job_queue.claim("pod-1-worker-0")
+    job_queue.claim("pod-1-worker-1")
+    clock[0] += 50
+    job_queue.heartbeat(kept_job_id_str)
+    assert job_queue.requeue_expired_jobs(lease_in_seconds=60) == (0, 0)
+
+    clock[0] += 20
+    # le bail de la première tâche, sans signe de vie depuis 70 secondes, a expiré, quel que soit le nom de son worker
+    assert job_queue.requeue_expired_jobs(lease_in_seconds=60) == (1, 0)
+    assert job_queue.get(abandoned_job_id_str)["status"] == jobQueue.JOB_STATUS_QUEUED_STR
+    assert job_queue.get(kept_job_id_str)["status"] == jobQueue.JOB_STATUS_RUNNING_STR
+
+    # abandonnée une seconde fois, la tâche échoue
+    assert job_queue.claim("pod-2-worker-0")["job_id"] == abandoned_job_id_str
+    clock[0] += 61
+    job_queue.update_progress(kept_job_id_str, "donut", 0.6)
+    assert job_queue.requeue_expired_jobs(lease_in_seconds=60, max_attempts_count=2) == (0, 1)
+    abandoned_job = job_queue.get(abandoned_job_id_str)
+    assert abandoned_job["status"] == jobQueue.JOB_STATUS_FAILED_STR and abandoned_job["error"]
+    assert job_queue.get(kept_job_id_str)["status"] == jobQueue.JOB_STATUS_RUNNING_STR
+
+
+def test_lease_columns_are_added_to_an_existing_queue(tmp_path):
+    job_queue_path_str = str(tmp_path / "jobs.sqlite")
+    with JobQueue(job_queue_path_str)._connect() as connection:
+        connection.execute("ALTER TABLE jobs DROP COLUMN heartbeat_time")
+        connection.execute("ALTER TABLE jobs DROP COLUMN attempts_count")
+    job_queue = JobQueue(job_queue_path_str)
+    submit_jobs(job_queue, 1)
+    assert job_queue.claim("worker")["attempts_count"] == 1
+    assert job_queue.requeue_expired_jobs(lease_in_seconds=60) == (0, 0)
+
+
+def test_finished_jobs_and_orphan_job_dirs_are_purged_after_their_ttl(job_queue, monkeypatch):
+    clock = [time.time()]
+    monkeypatch.setattr(jobQueue.time, "time", lambda: clock[0])
+    succeeded_job_id_str, failed_job_id_str, running_job_id_str = submit_jobs(job_queue, 3)
+    for job_id_str in [succeeded_job_id_str, failed_job_id_str, running_job_id_str]:
+        job_queue.claim("worker")
+    job_queue.succeed(succeeded_job_id_str, {})
+    job_queue.fail(failed_job_id_str, "erreur")
+    # document déposé mais jamais soumis, la page ayant été fermée
+    orphan_job_id_str = job_queue.create_job_dir()
+    assert job_queue.purge_finished_jobs(ttl_in_seconds=3600) == 0
+
+    clock[0] += 3601
+    assert job_queue.purge_finished_jobs(ttl_in_seconds=3600) == 2
+    assert [job_queue.get(job_id_str) is not None for job_id_str in
+            [succeeded_job_id_str, failed_job_id_str, running_job_id_str]] == [False, False, True]
+    assert [os.path.isdir(job_queue.get_job_dir_path(job_id_str)) for job_id_str in
+            [succeeded_job_id_str, failed_job_id_str, running_job_id_str, orphan_job_id_str]] \
+        == [False, False, True, False]
+    # la base elle-même n'est pas touchée
+    assert os.path.isfile(job_queue.job_queue_path_str)
@@ -0,0 +1,314 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Callable, Dict, Final, Iterator, List, Optional
+import argparse
+import contextlib
+import logging
+import multiprocessing
+import os
+import socket
+# importe le module des fils d'exécution (threads)
+import threading
+# importe le module de mesure du temps courant
+import time
+import cv2
+import numpy as np
+from PIL import Image
+import src.util.utils as utils
+import src.util.document_loader as documentLoader
+import src.util.instrumentation as instrumentation
+import src.models.classify_form.PaddleOCR_TextMatch.classify as ocrExtractor
+import src.pipeline.pipeline_PaddleOCR as ocrPipeline
+from src.service.job_queue import DEFAULT_JOB_LEASE_IN_SECONDS, DEFAULT_JOB_TTL_IN_SECONDS, JobQueue, get_job_queue
+
+
+# --- Constantes ---#
+# nom du fichier de l'image du document alignée sur l'image de référence, écrite dans le répertoire de la tâche
+TRANSFORMED_IMAGE_FILE_NAME_STR: Final[str] = "transformed_document.png"
+# intervalle par défaut, en secondes, entre deux recherches de tâche en attente par un worker inoccupé
+DEFAULT_POLL_INTERVAL_IN_SECONDS: Final[float] = 0.5
+# nombre de renouvellements du bail de la tâche en cours par durée du bail, afin qu'un renouvellement retardé ne suffise
+# pas à le faire expirer
+JOB_HEARTBEATS_COUNT_PER_LEASE: Final[int] = 4
+
+
+def analyse_job_document(
+    job_dir_path_str: str,
+    document_file_name_str: str,
+    document_name_str: str,
+    ocr_model,
+    donut_model_path_str: str,
+    configuration_files_dir_path_str: str,
+    report_progress: Callable[[str, float], None]
+) -> Dict:
+    r"""Analyse le document d'une tâche comme le faisait la page Streamlit : identification du numéro CERFA (couche texte
+    d'un PDF numérique ou OCRisation PaddleOCR des bandes d'en-tête et de pied de page), alignement sur l'image de référence puis lecture des champs par DONUT.
+    Faute de fichier de configuration, ou si l'alignement est peu fiable (voir `ocrPipeline.get_alignment_fit`), DONUT
+    lit l'image non alignée, la raison étant indiquée dans le résultat. Un document PDF de plusieurs pages est analysé
+    page par page (voir `analyse_multipage_job_document`).
+
+    Parameters
+    ----------
+    job_dir_path_str : str
+        le répertoire de la tâche, où se trouve le document et où est écrite l'image alignée.
+    document_file_name_str : str
+        le nom du fichier du document dans le répertoire de la tâche.
+    document_name_str : str
+        le nom du document téléversé, utilisé dans les messages.
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR du worker.
+    donut_model_path_str : str
+        le répertoire du modèle DONUT entraîné.
+    configuration_files_dir_path_str : str
+        chemin du répertoire des fichiers de configuration JSON des formulaires CERFA.
+    report_progress : callable
+        fonction appelée avec le nom de l'étape commençant et l'avancement, entre 0 et 1.
+
+    Returns
+    -------
+    dict
+        le résultat de l'analyse, sérialisable en JSON : numéro CERFA, présence d'un fichier de configuration, nom du
+        fichier de l'image alignée dans le répertoire de la tâche (None si le document n'a pu être aligné), erreur d'un alignement peu fiable, champs lus par
+        DONUT et durée de chaque étape.
+    """
+    document_path_str: str = os.path.join(job_dir_path_str, document_file_name_str)
+    if utils.get_document_page_count(document_path_str) > 1:
+        return analyse_multipage_job_document(
+            document_path_str=document_path_str,
+            document_name_str=document_name_str,
+            ocr_model=ocr_model,
+            configuration_files_dir_path_str=configuration_files_dir_path_str,
+            report_progress=report_progress
+        )
+    durations: Dict[str, float] = {}
+
+    report_progress("identification", 0.05)
+    with instrumentation.measure_stage("job.identification", document_name=document_name_str) as stage_measure:
+        # le document est rendu une seule fois en mémoire, sans écrire son image sur le disque
+        document_image: np.ndarray = utils.get_image_array_from_document(document_path_str, image_quality_in_dpi=350)
+        # texte d'un document PDF numérique, lu directement dans sa couche texte et ses champs remplis, les boîtes étant
+        # exprimées dans le repère de l'image rendue à 350 dpi
+        text_layer: Optional[documentLoader.PdfPageTextLayer] = \
+            documentLoader.load_document_text_layer(document_path_str, image_quality_in_dpi=350)
+        if text_layer is not None:
+            text_elements, text_boxes = text_layer.text_elements, text_layer.text_boxes
+            form_number_str: str = ocrExtractor.get_form_number_in_text_elements(
+                input_document_path=document_name_str,
+                text_elements=text_elements
+            )
+        else:
+            # DONUT lisant les champs, seuls le numéro CERFA, cherché sur les bandes d'en-tête et de pied de page, et les
+            # éléments de texte de référence nécessaires à l'alignement sont OCRisés
+            form_number_str, text_elements, text_boxes = ocrPipeline.identify_form_and_get_text_elements_and_boxes(
+                input_document_path_str=document_name_str,
+                form_image=document_image,
+                ocr_model=ocr_model,
+                configuration_files_dir_path_str=configuration_files_dir_path_str,
+                is_full_page_ocr_needed=False
+            )
+    durations["identification"] = stage_measure.wall_time_in_seconds
+
+    report_progress("alignment", 0.4)
+    # seule l'image alignée, affichée par la page, est écrite dans le répertoire de la tâche
+    transformed_image_file_name_str: Optional[str] = None
+    is_form_config_found: bool = True
+    alignment_error_str: Optional[str] = None
+    with instrumentation.measure_stage("job.alignment", form_number=form_number_str) as stage_measure:
+        try:
+            document_image, _ = ocrPipeline.get_transformationMatrix_and_image_after_affineTransformation(
+                input_document_path_str=document_name_str,
+                form_image=document_image,
+                form_number_str=form_number_str,
+                input_document_text_elements=text_elements,
+                input_document_text_boxes=text_boxes,
+                configuration_files_dir_path_str=configuration_files_dir_path_str
+            )
+            transformed_image_file_name_str = TRANSFORMED_IMAGE_FILE_NAME_STR
+            cv2.imwrite(filename=os.path.join(job_dir_path_str, transformed_image_file_name_str), img=document_image)
+        except AssertionError:
+            # aucun fichier de configuration n'existe pour ce formulaire : DONUT lit l'image non alignée
+            is_form_config_found = False
+        except ValueError as lValueError:
+            # alignement peu fiable : DONUT lit de même l'image non alignée
+            alignment_error_str = str(lValueError)
+    durations["alignment"] = stage_measure.wall_time_in_seconds
+
+    report_progress("donut", 0.6)
+    # importé ici pour ne charger torch et DONUT que dans les workers
+    import src.testing_donut as donut
+    with instrumentation.measure_stage("job.donut", form_number=form_number_str) as stage_measure:
+        donut_model, donut_prompt = donut.get_model(donut_model_path_str)
+        fields: Dict[str, str] = donut.run_model_on_image(
+            donut_model, donut_prompt, Image.fromarray(cv2.cvtColor(document_image, cv2.COLOR_BGR2RGB)),
+            form_number=form_number_str
+        )
+    del document_image
+    durations["donut"] = stage_measure.wall_time_in_seconds
+    return {
+        "form_number": form_number_str,
+        "is_form_config_found": is_form_config_found,
+        "transformed_image_file_name": transformed_image_file_name_str,
+        "alignment_error": alignment_error_str,
+        "fields": fields,
+        "durations": durations
+    }
+
+
+def analyse_multipage_job_document(
+    document_path_str: str,
+    document_name_str: str,
+    ocr_model,
+    configuration_files_dir_path_str: str,
+    report_progress: Callable[[str, float], None]
+) -> Dict:
+    r"""Analyse un document PDF de plusieurs pages : les champs de chaque page sont extraits par association des
+    éléments de texte de sa couche texte ou de son OCRisation PaddleOCR aux champs de la configuration de sa page (voir
+    `ocrPipeline.extract_multipage_document`), DONUT ne lisant que la première page d'un formulaire.
+
+    Returns
+    -------
+    dict
+        le résultat de l'analyse, sérialisable en JSON : numéro CERFA de la première page identifiée, enregistrement de
+        chaque page (`pages`), champs de toutes les pages réunis par numéro CERFA (`forms_fields`) et durée de
+        l'extraction.
+    """
+    report_progress("extraction", 0.05)
+    with instrumentation.measure_stage("job.extraction", document_name=document_name_str) as stage_measure:
+        document_record: Dict = ocrPipeline.extract_multipage_document(
+            input_document_path=document_path_str,
+            configuration_files_dir_path=configuration_files_dir_path_str,
+            ocr_model=ocr_model
+        )
+    forms_numbers: List[str] = [page_record["form_number"] for page_record in document_record["pages"]
+                                if page_record["form_number"] is not None]
+    if not forms_numbers:
+        raise ValueError(f"Aucun numéro de formulaire CERFA n'a été trouvé dans le document {document_name_str}")
+    return {
+        "form_number": forms_numbers[0],
+        "pages": document_record["pages"],
+        "forms_fields": document_record["fields"],
+        "durations": {"extraction": stage_measure.wall_time_in_seconds}
+    }
+
+
+@contextlib.contextmanager
+def _job_lease_kept(job_queue: JobQueue, job_id_str: str, lease_in_seconds: float) -> Iterator[None]:
+    r"""Renouvelle le bail de la tâche `job_id_str`, depuis un fil d'exécution dédié, pendant l'exécution du bloc : le
+    bail n'expire ainsi que si le processus du worker est interrompu, et non pendant une étape longue."""
+    stop_event = threading.Event()
+
+    def keep_lease() -> None:
+        while not stop_event.wait(lease_in_seconds / JOB_HEARTBEATS_COUNT_PER_LEASE):
+            job_queue.heartbeat(job_id_str)
+
+    heartbeat_thread = threading.Thread(target=keep_lease, name=f"heartbeat-{job_id_str}", daemon=True)
+    heartbeat_thread.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        heartbeat_thread.join()
+
+
+def requeue_expired_jobs(job_queue: JobQueue, lease_in_seconds: float) -> None:
+    r"""Remet en attente, ou fait échouer, les tâches dont le worker a été interrompu (voir
+    `JobQueue.requeue_expired_jobs`)."""
+    requeued_jobs_count, failed_jobs_count = job_queue.requeue_expired_jobs(lease_in_seconds=lease_in_seconds)
+    if requeued_jobs_count or failed_jobs_count:
+        logging.warning(f"Tâches dont le bail de {lease_in_seconds} secondes a expiré : {requeued_jobs_count} remises "
+                        f"en attente, {failed_jobs_count} en échec")
+
+
+def purge_finished_jobs(job_queue: JobQueue, ttl_in_seconds: float) -> None:
+    r"""Supprime les tâches terminées depuis plus de `ttl_in_seconds` secondes et leurs répertoires (voir
+    `JobQueue.purge_finished_jobs`)."""
+    purged_jobs_count: int = job_queue.purge_finished_jobs(ttl_in_seconds=ttl_in_seconds)
+    if purged_jobs_count:
+        logging.info(f"{purged_jobs_count} tâches terminées depuis plus de {ttl_in_seconds} secondes supprimées")
+
+
+def run_worker(
+    worker_name_str: str,
+    donut_model_path_str: str,
+    configuration_files_dir_path_str: str,
+    poll_interval_in_seconds: float = DEFAULT_POLL_INTERVAL_IN_SECONDS,
+    lease_in_seconds: float = DEFAULT_JOB_LEASE_IN_SECONDS,
+    ttl_in_seconds: float = DEFAULT_JOB_TTL_IN_SECONDS
+) -> None:
+    r"""Boucle d'un worker : charge une seule fois les modèles, puis exécute une à une les tâches en attente de la file
+    (voir `job_queue.get_job_queue`), en renouvelant le bail de la tâche en cours. Inoccupé, le worker remet en attente,
+    au plus une fois par durée de bail, les tâches dont le bail a expiré, laissées en cours par un worker interrompu,
+    de ce pod ou d'un autre, et supprime les tâches terminées depuis plus de `ttl_in_seconds` secondes, dont la page a
+    pu être fermée sans les supprimer."""
+    logging.basicConfig(level=logging.INFO)
+    job_queue: JobQueue = get_job_queue()
+    import paddleocr
+    ocr_model = instrumentation.instrument_paddleocr_model(paddleocr.PaddleOCR(use_angle_cls=True, lang='fr'))
+    import src.testing_donut as donut
+    donut.get_model(donut_model_path_str)
+    logging.info(f"Worker {worker_name_str} prêt")
+    last_requeue_time: float = 0.
+    while True:
+        job: Optional[Dict] = job_queue.claim(worker_name_str)
+        if job is None:
+            if time.time() - last_requeue_time >= lease_in_seconds:
+                requeue_expired_jobs(job_queue, lease_in_seconds)
+                purge_finished_jobs(job_queue, ttl_in_seconds)
+                last_requeue_time = time.time()
+            time.sleep(poll_interval_in_seconds)
+            continue
+        job_id_str: str = job["job_id"]
+        logging.info(f"Worker {worker_name_str} : début de la tâche {job_id_str}")
+        try:
+            # les étapes de la tâche appartiennent à la trace de l'étape "job"
+            with _job_lease_kept(job_queue, job_id_str, lease_in_seconds), \
+                    instrumentation.measure_stage("job", job_id=job_id_str, worker_name=worker_name_str):
+                result: Dict = analyse_job_document(
+                    job_dir_path_str=job_queue.get_job_dir_path(job_id_str),
+                    document_file_name_str=job["parameters"]["document_file_name"],
+                    document_name_str=job["parameters"]["document_name"],
+                    ocr_model=ocr_model,
+                    donut_model_path_str=donut_model_path_str,
+                    configuration_files_dir_path_str=configuration_files_dir_path_str,
+                    report_progress=lambda stage_str, progress: job_queue.update_progress(job_id_str, stage_str, progress)
+                )
+        except (AssertionError, ValueError) as lException:
+            job_queue.fail(job_id_str, str(lException))
+        except Exception as lException:
+            logging.exception(f"La tâche {job_id_str} a échoué")
+            job_queue.fail(job_id_str, repr(lException))
+        else:
+            job_queue.succeed(job_id_str, result)
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Workers d'analyse des formulaires CERFA soumis à la file des tâches")
+    parser.add_argument("--workers", default=1, type=int, help="nombre de processus workers, chacun chargeant ses modèles")
+    parser.add_argument("--donut_model_path", default="./data/models/donut_trained/20231002_095949")
+    parser.add_argument("--configuration_files_dir_path", default="./data/configs_extraction")
+    parser.add_argument("--poll_interval", default=DEFAULT_POLL_INTERVAL_IN_SECONDS, type=float)
+    parser.add_argument("--job_lease", default=DEFAULT_JOB_LEASE_IN_SECONDS, type=float,
+                        help="durée, en secondes, sans signe de vie d'un worker au-delà de laquelle sa tâche est reprise")
+    parser.add_argument("--job_ttl", default=DEFAULT_JOB_TTL_IN_SECONDS, type=float,
+                        help="durée, en secondes, de conservation d'une tâche terminée et de son répertoire")
+    parsed_arguments = parser.parse_args(arguments)
+
+    # crée la base de la file des tâches avant de lancer les workers
+    get_job_queue()
+    worker_processes: List[multiprocessing.Process] = [
+        multiprocessing.Process(
+            target=run_worker,
+            name=f"{socket.gethostname()}-worker-{worker_index}",
+            args=(f"{socket.gethostname()}-worker-{worker_index}", parsed_arguments.donut_model_path,
+                  parsed_arguments.configuration_files_dir_path, parsed_arguments.poll_interval,
+                  parsed_arguments.job_lease, parsed_arguments.job_ttl)
+        )
+        for worker_index in range(parsed_arguments.workers)
+    ]
+    for worker_process in worker_processes:
+        worker_process.start()
+    for worker_process in worker_processes:
+        worker_process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import torch
 import os
 import json
 import datetime
+import threading
+from collections import OrderedDict
 from PIL import Image
 from sconf import Config
 
@@ -16,27 +18,265 @@ cwd = Path().resolve()
 # de modules présents dans les sous-répertoires dudit répertoire
 sys.path.append(str(cwd))
 from src.donut_lib import train
+import src.util.instrumentation as instrumentation
+import src.donut_decoding as donut_decoding
 
 from donut import DonutModel
 
 
+# number of DONUT checkpoints kept loaded at the same time, the least recently used one being evicted first
+MODEL_CACHE_SIZE = 2
+# default number of images stacked into one encoder batch by run_model_on_files
+INFERENCE_BATCH_SIZE = 4
+# environment variable enabling the CPU inference profile (see apply_cpu_inference_profile) when set to 1
+CPU_INFERENCE_PROFILE_ENVIRONMENT_VARIABLE = "FORMIABLE_DONUT_CPU_PROFILE"
 
-def run_model_on_file(model_path, file_path):
+# loaded (model, prompt) pairs, keyed by (absolute model path, last modification time of the checkpoint, CPU profile)
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+def get_cpu_limit():
+    """
+    Gets the number of CPUs the process may use: the CPU limit of the container (cgroup v2 or v1 quota) if any, else
+    the number of CPUs the process is allowed to run on.
+
+    :returns: the number of CPUs, at least 1.
+    """
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as cpu_max_file:
+            quota, period = cpu_max_file.read().split()[:2]
+        if quota != "max":
+            return max(1, min(cpu_count, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as quota_file, \
+                    open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as period_file:
+                quota, period = int(quota_file.read()), int(period_file.read())
+            if quota > 0:
+                return max(1, min(cpu_count, int(quota / period)))
+        except (OSError, ValueError):
+            pass
+    return cpu_count
+
+
+def configure_cpu_threads(cpu_count=None):
+    """
+    Sets the torch intra-op thread count to the CPU limit of the pod, and the inter-op thread count to 1, the DONUT
+    inference being a single sequential graph. Without this, torch sizes its pools on the CPUs of the node and
+    oversubscribes the pod.
+
+    :param cpu_count: number of threads to use, defaults to get_cpu_limit().
+    """
+    cpu_count = cpu_count or get_cpu_limit()
+    torch.set_num_threads(cpu_count)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # the inter-op pool can only be sized before its first use
+        pass
+
+
+class TracedEncoder(torch.nn.Module):
+    """
+    TorchScript trace of a DONUT Swin encoder, keeping the preprocessing of the original encoder.
+    """
+
+    def __init__(self, encoder, traced_encoder):
+        super().__init__()
+        self.traced_encoder = traced_encoder
+        self.prepare_input = encoder.prepare_input
+
+    def forward(self, image_tensors):
+        return self.traced_encoder(image_tensors)
+
+
+def export_encoder(model, export_path, export_format="torchscript"):
+    """
+    Exports the Swin encoder of a DONUT model to TorchScript or ONNX, traced on an input of the encoder size.
+
+    :param model: the model returned by load_model.
+    :param export_path: path of the exported file.
+    :param export_format: "torchscript" or "onnx".
+
+    :returns: the TorchScript module for "torchscript", None for "onnx".
+    """
+    example_image_tensors = torch.zeros(1, 3, *model.encoder.input_size)
+    with torch.no_grad():
+        if export_format == "torchscript":
+            traced_encoder = torch.jit.trace(model.encoder, example_image_tensors)
+            torch.jit.save(traced_encoder, export_path)
+            return traced_encoder
+        elif export_format == "onnx":
+            torch.onnx.export(model.encoder, example_image_tensors, export_path,
+                              input_names=["image_tensors"], output_names=["last_hidden_state"],
+                              dynamic_axes={"image_tensors": {0: "batch"}, "last_hidden_state": {0: "batch"}})
+            return None
+    raise ValueError(f"Unknown export format {export_format}")
+
+
+def apply_cpu_inference_profile(model, trace_encoder=False):
+    """
+    Optimises a DONUT model loaded on CPU: the linear layers of the BART decoder, which runs once per generated token,
+    are dynamically quantised to int8, and the thread counts are set from the CPU limit of the pod. Optionally, the
+    Swin encoder is replaced by its TorchScript trace.
+
+    :param model: the model returned by load_model, on CPU.
+    :param trace_encoder: whether to replace the encoder by its TorchScript trace.
+
+    :returns: the optimised model.
+    """
+    configure_cpu_threads()
+    model.decoder.model = torch.quantization.quantize_dynamic(model.decoder.model, {torch.nn.Linear}, dtype=torch.qint8)
+    if trace_encoder:
+        with torch.no_grad():
+            traced_encoder = torch.jit.trace(model.encoder, torch.zeros(1, 3, *model.encoder.input_size))
+        model.encoder = TracedEncoder(model.encoder, traced_encoder)
+    return model
+
+
+def is_cpu_inference_profile_enabled():
+    """
+    :returns: whether the CPU inference profile is enabled by the environment.
+    """
+    return os.environ.get(CPU_INFERENCE_PROFILE_ENVIRONMENT_VARIABLE, "0") == "1" and not torch.cuda.is_available()
+
+
+def load_model(model_path, cpu_profile=None):
+    """
+    Loads the DONUT model saved in model_path, in half precision on GPU if available, along with its task prompt.
+
+    :param model_path: path of the directory of the trained model.
+    :param cpu_profile: whether to apply the CPU inference profile on CPU, defaults to the
+    FORMIABLE_DONUT_CPU_PROFILE environment variable.
+
+    :returns: the model in evaluation mode and the prompt to start decoding with.
+    """
+    if cpu_profile is None:
+        cpu_profile = is_cpu_inference_profile_enabled()
     with open(os.path.join(model_path, 'special_tokens_map.json'), "r") as file:
         special_tokens = json.load(file)
         prompt = special_tokens["additional_special_tokens"][0]
-    model = DonutModel.from_pretrained(model_path, ignore_mismatched_sizes=True)
-    if torch.cuda.is_available():
-        model.half()
-        device = torch.device("cuda")
-        model.to(device)
-    else:
-        model.to("cpu")
-    model.eval()
+    with instrumentation.measure_stage("donut.load", model_path=model_path):
+        model = DonutModel.from_pretrained(model_path, ignore_mismatched_sizes=True)
+        if torch.cuda.is_available():
+            model.half()
+            device = torch.device("cuda")
+            model.to(device)
+        else:
+            model.to("cpu")
+        model.eval()
+        if cpu_profile and not torch.cuda.is_available():
+            model = apply_cpu_inference_profile(model)
+    return model, prompt
+
+
+def run_model_on_image(model, prompt, image, form_number=None):
+    """
+    Runs an already loaded DONUT model on a PIL image.
+
+    :param model: the model returned by load_model.
+    :param prompt: the prompt returned by load_model.
+    :param image: the RGB PIL image of the form.
+    :param form_number: CERFA number of the form, e.g. "12485_03". When its key schema is known, decoding is
+    constrained to the keys of the form and stops once they are all closed, see src.donut_decoding.
+
+    :returns: the {field name: field value} pairs read by the model.
+    """
+    return run_model_on_images(model, prompt, [image], form_number=form_number)[0]
+
+
+def get_model_modification_time(model_path):
+    """
+    :param model_path: path of the directory of the trained model.
+
+    :returns: the last modification time, in nanoseconds, of the files of the checkpoint.
+    """
+    with os.scandir(model_path) as directory_entries:
+        return max([os.stat(model_path).st_mtime_ns] + [directory_entry.stat().st_mtime_ns
+                                                         for directory_entry in directory_entries])
+
+
+def get_model(model_path, cpu_profile=None):
+    """
+    Returns the DONUT model saved in model_path and its prompt, loaded once and kept resident. The cache is keyed by
+    model path and modification time, so that a retrained checkpoint is reloaded, and keeps at most MODEL_CACHE_SIZE
+    checkpoints, evicting the least recently used one.
+
+    :param model_path: path of the directory of the trained model.
+    :param cpu_profile: whether to apply the CPU inference profile, see load_model.
+
+    :returns: the model in evaluation mode and the prompt to start decoding with.
+    """
+    model_path = os.path.abspath(model_path)
+    if cpu_profile is None:
+        cpu_profile = is_cpu_inference_profile_enabled()
+    cache_key = (model_path, get_model_modification_time(model_path), cpu_profile)
+    with _model_cache_lock:
+        if cache_key in _model_cache:
+            _model_cache.move_to_end(cache_key)
+            return _model_cache[cache_key]
+        # the model is loaded under the lock so that concurrent sessions do not load the same checkpoint twice
+        for stale_cache_key in [lCacheKey for lCacheKey in _model_cache
+                                if lCacheKey[0] == model_path and lCacheKey[2] == cpu_profile]:
+            del _model_cache[stale_cache_key]
+        _model_cache[cache_key] = load_model(model_path, cpu_profile=cpu_profile)
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+        return _model_cache[cache_key]
+
+
+def run_model_on_images(model, prompt, images, form_number=None):
+    """
+    Runs an already loaded DONUT model on several PIL images at once: the preprocessed images are stacked into one
+    encoder batch and decoded together.
+
+    :param model: the model returned by load_model.
+    :param prompt: the prompt returned by load_model.
+    :param images: the RGB PIL images of the forms.
+    :param form_number: CERFA number shared by the forms, see run_model_on_image.
+
+    :returns: the {field name: field value} pairs read by the model, in the order of the images.
+    """
+    if len(images) == 0:
+        return []
+    key_schema = donut_decoding.get_form_key_schema(form_number) if form_number else None
+    image_tensors = torch.stack([model.encoder.prepare_input(image) for image in images])
+    with torch.inference_mode(), instrumentation.measure_stage("donut.decoding", batch_size=len(images),
+                                                               constrained=key_schema is not None):
+        if key_schema is not None:
+            return donut_decoding.run_constrained_inference(model, prompt, image_tensors, key_schema)
+        prompt_tensors = model.decoder.tokenizer(prompt, add_special_tokens=False, return_tensors="pt")["input_ids"]
+        output = model.inference(image_tensors=image_tensors,
+                                 prompt_tensors=prompt_tensors.expand(len(images), -1))
+        return output["predictions"]
+
+
+def run_model_on_file(model_path, file_path, cpu_profile=None, form_number=None):
+    model, prompt = get_model(model_path, cpu_profile=cpu_profile)
     image = Image.open(file_path).convert("RGB")
-    with torch.no_grad():
-        output = model.inference(image=image, prompt=prompt)
-        return output["predictions"][0]
+    return run_model_on_image(model, prompt, image, form_number=form_number)
+
+
+def run_model_on_files(model_path, file_paths, batch_size=INFERENCE_BATCH_SIZE, cpu_profile=None, form_number=None):
+    """
+    Runs the DONUT model saved in model_path on the images file_paths, batch_size images at a time.
+
+    :param model_path: path of the directory of the trained model.
+    :param file_paths: paths of the images of the forms.
+    :param batch_size: number of images stacked into one encoder batch.
+    :param cpu_profile: whether to apply the CPU inference profile, see load_model.
+    :param form_number: CERFA number shared by the forms, see run_model_on_image.
+
+    :returns: the {field name: field value} pairs read by the model, in the order of file_paths.
+    """
+    model, prompt = get_model(model_path, cpu_profile=cpu_profile)
+    predictions = []
+    for batch_start in range(0, len(file_paths), batch_size):
+        images = [Image.open(file_path).convert("RGB") for file_path in file_paths[batch_start:batch_start + batch_size]]
+        predictions.extend(run_model_on_images(model, prompt, images, form_number=form_number))
+    return predictions
 
 
 def train_from_config_file(config_path, exp_name):
@@ -0,0 +1,113 @@
+"""
+Vectorised assignment of OCR bounding boxes to template fields.
+"""
+from typing import Optional
+
+import numpy as np
+
+from .spatial_index import UniformGridIndex
+
+
+def compute_intersection_areas(boxes: np.ndarray, field_boxes: np.ndarray) -> np.ndarray:
+    """Compute the intersection area of every box with every field box in one broadcast.
+
+    Args:
+        boxes (np.ndarray): (N, 4) array of x0, y0, x1, y1 coordinates.
+        field_boxes (np.ndarray): (M, 4) array of x0, y0, x1, y1 coordinates.
+
+    Returns:
+        np.ndarray: (N, M) array of intersection areas, 0 where boxes do not intersect.
+    """
+    x0 = np.maximum(boxes[:, None, 0], field_boxes[None, :, 0])
+    y0 = np.maximum(boxes[:, None, 1], field_boxes[None, :, 1])
+    x1 = np.minimum(boxes[:, None, 2], field_boxes[None, :, 2])
+    y1 = np.minimum(boxes[:, None, 3], field_boxes[None, :, 3])
+    return np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+
+
+def match_boxes_to_fields(
+    boxes: np.ndarray,
+    field_boxes: np.ndarray,
+    area_ratio_threshold: float,
+    field_boxes_index: Optional[UniformGridIndex] = None,
+) -> np.ndarray:
+    """Assign each box to the field box it overlaps the most.
+
+    A box can only be assigned to a field box covering strictly more than
+    area_ratio_threshold of its area. Ties are broken in favour of the
+    first field box, as in a loop keeping the first strictly larger
+    intersection. Boxes with a null area are never assigned.
+
+    When field_boxes_index is given, only the (box, field box) pairs
+    sharing a cell of the index are tested, so that the cost grows with
+    the number of actual overlaps instead of N * M.
+
+    Args:
+        boxes (np.ndarray): (N, 4) array of x0, y0, x1, y1 coordinates.
+        field_boxes (np.ndarray): (M, 4) array of x0, y0, x1, y1 coordinates.
+        area_ratio_threshold (float): Ratio over which intersection
+            of a box and of a field box is considered.
+        field_boxes_index (Optional[UniformGridIndex]): Spatial index
+            built on field_boxes.
+
+    Returns:
+        np.ndarray: (N,) array of the index of the matched field box
+        of each box, -1 if the box is not matched.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    field_boxes = np.asarray(field_boxes, dtype=np.float64).reshape(-1, 4)
+    matches = np.full(len(boxes), -1, dtype=np.int64)
+    if len(boxes) == 0 or len(field_boxes) == 0:
+        return matches
+    if field_boxes_index is not None:
+        return _match_boxes_to_fields_with_index(boxes, field_boxes, area_ratio_threshold, field_boxes_index)
+
+    intersection_areas = compute_intersection_areas(boxes, field_boxes)
+    box_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    area_ratios = np.divide(
+        intersection_areas,
+        box_areas[:, None],
+        out=np.zeros_like(intersection_areas),
+        where=box_areas[:, None] > 0,
+    )
+    intersection_areas[area_ratios <= area_ratio_threshold] = 0
+
+    best_field_boxes = intersection_areas.argmax(axis=1)
+    matched = intersection_areas[np.arange(len(boxes)), best_field_boxes] > 0
+    matches[matched] = best_field_boxes[matched]
+    return matches
+
+
+def _match_boxes_to_fields_with_index(
+    boxes: np.ndarray,
+    field_boxes: np.ndarray,
+    area_ratio_threshold: float,
+    field_boxes_index: UniformGridIndex,
+) -> np.ndarray:
+    """Same as match_boxes_to_fields, on the candidate pairs of the index only."""
+    matches = np.full(len(boxes), -1, dtype=np.int64)
+    box_indices, field_box_indices = field_boxes_index.query_pairs(boxes)
+    pair_boxes = boxes[box_indices]
+    pair_field_boxes = field_boxes[field_box_indices]
+    intersection_areas = (
+        np.clip(np.minimum(pair_boxes[:, 2], pair_field_boxes[:, 2])
+                - np.maximum(pair_boxes[:, 0], pair_field_boxes[:, 0]), 0, None)
+        * np.clip(np.minimum(pair_boxes[:, 3], pair_field_boxes[:, 3])
+                  - np.maximum(pair_boxes[:, 1], pair_field_boxes[:, 1]), 0, None)
+    )
+    box_areas = (pair_boxes[:, 2] - pair_boxes[:, 0]) * (pair_boxes[:, 3] - pair_boxes[:, 1])
+    area_ratios = np.divide(
+        intersection_areas, box_areas, out=np.zeros_like(intersection_areas), where=box_areas > 0
+    )
+    kept = (area_ratios > area_ratio_threshold) & (intersection_areas > 0)
+    box_indices = box_indices[kept]
+    field_box_indices = field_box_indices[kept]
+    intersection_areas = intersection_areas[kept]
+
+    # for each box, largest intersection first then lowest field box index
+    order = np.lexsort((field_box_indices, -intersection_areas, box_indices))
+    box_indices = box_indices[order]
+    first_of_box = np.ones(len(box_indices), dtype=bool)
+    first_of_box[1:] = box_indices[1:] != box_indices[:-1]
+    matches[box_indices[first_of_box]] = field_box_indices[order][first_of_box]
+    return matches
@@ -0,0 +1,193 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Dict, Final, List, Optional, Tuple
+# importe le module OS pour l'accès aux fonctions de gestion de fichiers et de chemins
+import os
+# importe le module de PyMuPDF permettant d'afficher et de manipuler par divers outils des documents PDF via Python
+import fitz
+
+
+# --- Constantes ---
+# nombre minimal de mots de la couche texte d'une page PDF pour la considérer comme numérique plutôt que numérisée
+DIGITAL_PAGE_MIN_WORDS_COUNT: Final[int] = 10
+# résolution, en dpi, des coordonnées natives d'une page PDF (1 point = 1/72 pouce)
+PDF_POINTS_PER_INCH: Final[int] = 72
+# valeurs des cases à cocher non cochées, ignorées
+UNCHECKED_WIDGET_VALUES: Final[List[str]] = ["", "Off"]
+
+
+class PdfPageTextLayer:
+    r"""Texte d'une page PDF numérique, lu directement dans le document sans OCRisation, au même format que les
+    résultats de PaddleOCR :
+    - `text_elements` : liste des éléments de texte, à raison d'un par ligne de la couche texte et d'un par champ de
+      formulaire (widget AcroForm) rempli,
+    - `text_boxes` : liste des coordonnées des 4 coins des boîtes entourant lesdits éléments de texte, en pixels de
+      l'image de la page rendue à `image_quality_in_dpi` dpi,
+    - `widget_values` : couples {nom du champ du formulaire : valeur du champ} des widgets remplis,
+    - `page_size` : hauteur et largeur en pixels de l'image de la page rendue à `image_quality_in_dpi` dpi."""
+
+    def __init__(
+        self,
+        text_elements: List[str],
+        text_boxes: List[List[Tuple[float, float]]],
+        widget_values: Dict[str, str],
+        page_size: Tuple[int, int],
+        image_quality_in_dpi: int
+    ):
+        self.text_elements = text_elements
+        self.text_boxes = text_boxes
+        self.widget_values = widget_values
+        self.page_size = page_size
+        self.image_quality_in_dpi = image_quality_in_dpi
+
+    def get_page_content(self) -> str:
+        r"""Retourne le texte de la page, à raison d'un élément de texte par ligne."""
+        return "\n".join(self.text_elements)
+
+
+def get_rectangle_corners(x0: float, y0: float, x1: float, y1: float, scale: float) -> List[Tuple[float, float]]:
+    r"""Retourne les 4 coins, dans l'ordre de PaddleOCR, du rectangle (x0, y0, x1, y1) mis à l'échelle `scale`."""
+    x0, y0, x1, y1 = x0 * scale, y0 * scale, x1 * scale, y1 * scale
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def get_pdf_page_text_layer(
+    pdf_page: fitz.Page,
+    image_quality_in_dpi: int = 350,
+    min_words_count: int = DIGITAL_PAGE_MIN_WORDS_COUNT
+) -> Optional[PdfPageTextLayer]:
+    r"""Lit les mots de la couche texte (`get_text("words")`) et les champs remplis (`widgets()`) de la page PDF
+    `pdf_page`. Les mots sont regroupés par ligne, comme le fait la détection de PaddleOCR.
+
+    Parameters
+    ----------
+    pdf_page : fitz.Page
+        la page PDF à lire.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi de l'image de la page dans le repère de laquelle sont exprimées les boîtes.
+    min_words_count : int, default=DIGITAL_PAGE_MIN_WORDS_COUNT
+        le nombre minimal de mots en deçà duquel, sans champ rempli, la page est considérée comme numérisée.
+
+    Returns
+    -------
+    PdfPageTextLayer or None
+        le texte de la page, ou None si la page est numérisée et doit être OCRisée.
+    """
+    scale: float = image_quality_in_dpi / PDF_POINTS_PER_INCH
+    widget_values: Dict[str, str] = {}
+    widget_rectangles: Dict[str, fitz.Rect] = {}
+    for widget in pdf_page.widgets():
+        widget_value = widget.field_value
+        if not widget.field_name or widget_value in UNCHECKED_WIDGET_VALUES or widget_value in [None, False]:
+            continue
+        # seul le bouton coché d'un groupe de cases à cocher ou de boutons radio porte la valeur du champ
+        if widget.field_type in [fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.PDF_WIDGET_TYPE_RADIOBUTTON] \
+                and str(widget_value) != str(widget.on_state()):
+            continue
+        widget_values[widget.field_name] = str(widget_value)
+        widget_rectangles[widget.field_name] = widget.rect
+
+    # mots de la page regroupés par (bloc, ligne), dans l'ordre de lecture, hormis ceux de l'apparence des champs
+    # remplis, dont la valeur est déjà lue dans les widgets
+    lines_words: Dict[Tuple[int, int], List[Tuple[float, float, float, float, str]]] = {}
+    for x0, y0, x1, y1, word_str, block_number, line_number, _ in pdf_page.get_text("words", sort=True):
+        word_center = fitz.Point((x0 + x1) / 2, (y0 + y1) / 2)
+        if any(word_center in widget_rectangle for widget_rectangle in widget_rectangles.values()):
+            continue
+        lines_words.setdefault((block_number, line_number), []).append((x0, y0, x1, y1, word_str))
+    words_count: int = sum(len(line_words) for line_words in lines_words.values())
+
+    if words_count < min_words_count and not widget_values:
+        return None
+
+    text_elements: List[str] = []
+    text_boxes: List[List[Tuple[float, float]]] = []
+    for line_words in lines_words.values():
+        # les mots d'une ligne sont lus de gauche à droite, comme à l'image, quel que soit leur ordre dans le PDF
+        line_words.sort(key=lambda word: word[0])
+        text_elements.append(" ".join(word[4] for word in line_words))
+        text_boxes.append(get_rectangle_corners(
+            min(word[0] for word in line_words), min(word[1] for word in line_words),
+            max(word[2] for word in line_words), max(word[3] for word in line_words),
+            scale
+        ))
+    for field_name, field_value in widget_values.items():
+        widget_rectangle: fitz.Rect = widget_rectangles[field_name]
+        text_elements.append(field_value)
+        text_boxes.append(get_rectangle_corners(widget_rectangle.x0, widget_rectangle.y0,
+                                                widget_rectangle.x1, widget_rectangle.y1, scale))
+    return PdfPageTextLayer(
+        text_elements=text_elements,
+        text_boxes=text_boxes,
+        widget_values=widget_values,
+        page_size=(round(pdf_page.rect.height * scale), round(pdf_page.rect.width * scale)),
+        image_quality_in_dpi=image_quality_in_dpi
+    )
+
+
+def load_document_text_layer(
+    input_document_path: str,
+    image_quality_in_dpi: int = 350,
+    page_index: int = 0
+) -> Optional[PdfPageTextLayer]:
+    r"""Chargeur commun des documents : retourne le texte de la page `page_index` du document `input_document_path`
+    lu directement dans sa couche texte et ses champs de formulaire s'il s'agit d'un PDF numérique, ou None s'il s'agit
+    d'une image ou d'une page numérisée, qui doit alors être rendue et OCRisée.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document, PDF ou image.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi de l'image de la page dans le repère de laquelle sont exprimées les boîtes, celle à laquelle
+        la page serait rendue pour être OCRisée.
+    page_index : int, default=0
+        l'indice de la page à lire.
+
+    Returns
+    -------
+    PdfPageTextLayer or None
+        le texte de la page, ou None si le document doit être OCRisé.
+    """
+    if os.path.splitext(input_document_path)[1].lower() != ".pdf":
+        return None
+    with fitz.open(input_document_path) as pdf_document:
+        if page_index >= pdf_document.page_count:
+            return None
+        return get_pdf_page_text_layer(pdf_document.load_page(page_index), image_quality_in_dpi=image_quality_in_dpi)
+
+
+def load_document_text_layers(
+    input_document_path: str,
+    image_quality_in_dpi: int = 350,
+    pages_image_quality_in_dpi: Optional[Dict[int, int]] = None
+) -> Dict[int, PdfPageTextLayer]:
+    r"""Retourne le texte de chaque page numérique du document `input_document_path`, lu dans sa couche texte et ses
+    champs de formulaire, le document n'étant ouvert qu'une fois pour toutes ses pages.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document, PDF ou image.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi de l'image des pages dans le repère de laquelle sont exprimées les boîtes.
+    pages_image_quality_in_dpi : dict of int to int, optional, default=None
+        la qualité en dpi de certaines pages, par indice de page, remplaçant `image_quality_in_dpi`.
+
+    Returns
+    -------
+    dict of int to PdfPageTextLayer
+        le texte de chaque page numérique, par indice de page ; les pages numérisées, à OCRiser, en sont absentes, de
+        même que l'unique page d'une image.
+    """
+    if os.path.splitext(input_document_path)[1].lower() != ".pdf":
+        return {}
+    pages_text_layers: Dict[int, PdfPageTextLayer] = {}
+    with fitz.open(input_document_path) as pdf_document:
+        for page_index in range(pdf_document.page_count):
+            text_layer: Optional[PdfPageTextLayer] = get_pdf_page_text_layer(
+                pdf_document.load_page(page_index),
+                image_quality_in_dpi=(pages_image_quality_in_dpi or {}).get(page_index, image_quality_in_dpi)
+            )
+            if text_layer is not None:
+                pages_text_layers[page_index] = text_layer
+    return pages_text_layers
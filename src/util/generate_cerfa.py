@@ -17,7 +17,8 @@ logging.basicConfig(level=logging.INFO)
 
 class Champ:
 
-    def __init__(self, type_champ, proprietes, multiline=False, marge="bas"):
+    def __init__(self, type_champ, proprietes, multiline=False, marge="bas", nom=None):
+        self.nom = nom
         self.type_champ = type_champ
         self.pos = proprietes["pos"]
         self.donnees = proprietes["type"] if "type" in proprietes.keys() else None
@@ -40,15 +41,16 @@ class Formulaire:
         for champ, proprietes in structure["champs_libres"].items():
             multiline = False if isinstance(proprietes["pos"][0], int) else True
             marge = proprietes["marge"] if "marge" in proprietes.keys() else "bas"
-            self.champs_libres.append(Champ("libre", proprietes, multiline, marge))
+            self.champs_libres.append(Champ("libre", proprietes, multiline, marge, nom=champ))
         self.champs_cases = []
         for champ, proprietes in structure["champs_avec_cases"].items():
-            self.champs_cases.append(Champ("cases", proprietes))
+            self.champs_cases.append(Champ("cases", proprietes, nom=champ))
         self.champs_image = []
         for champ, proprietes in structure["champs_image"].items():
             self.champs_image.append(Champ("libre", proprietes))
         self.cases_a_cocher = []
-
+        # valeurs {nom du champ : valeur} écrites dans le dernier exemplaire généré
+        self.valeurs_exemplaire = {}
 
     def creation_fausse_info(self, type_champ, champ, draw, font):
 
@@ -157,6 +159,7 @@ class Formulaire:
 
         image = Image.open(_cerfa_path)
         draw = ImageDraw.Draw(image)
+        self.valeurs_exemplaire = {}
         x_noise_range = 0.02
         y_noise_range = 0.05
         for champ in self.champs_cases:
@@ -165,9 +168,10 @@ class Formulaire:
             x_eps = np.random.randint(0, max(1, int(x_noise_range * largeur_moyenne_case)))
             y_eps = np.random.randint(0, max(1, int(y_noise_range * hauteur_moyenne_case)))
             color = np.random.choice(list(color_list.keys()))
-            fausse_info = self.creation_fausse_info("cases", champ, draw, font)
+            fausse_info = list(self.creation_fausse_info("cases", champ, draw, font))
             for box, text in fausse_info:
                 draw.text((box[0] + x_eps, box[1] - y_eps), text, color_list[color], font=font)
+            self.valeurs_exemplaire[champ.nom] = "".join(text for _, text in fausse_info)
         for champ in self.champs_libres:
             sign = -1 if champ.marge == "bas" else 1
             largeur_moyenne_case = np.mean([x[2] for x in champ.pos]) if champ.multiline else champ.pos[2]
@@ -175,7 +179,9 @@ class Formulaire:
             x_eps = np.random.randint(0, min(10, max(1, int(x_noise_range * largeur_moyenne_case))))
             y_eps = np.random.randint(0, min(20, max(1, int(y_noise_range * hauteur_moyenne_case))))
             color = np.random.choice(list(color_list.keys()))
-            fausse_info = self.creation_fausse_info("champ_libre", champ, draw, font)
+            fausse_info = list(self.creation_fausse_info("champ_libre", champ, draw, font))
+            # les lignes d'un champ sont réunies et ses retours à la ligne remplacés par des espaces
+            self.valeurs_exemplaire[champ.nom] = " ".join(" ".join(text.split()) for _, text, _ in fausse_info if text.strip())
             for box, text, box_font in fausse_info:
                 _, _, w, _ = draw.multiline_textbbox((0, 0), text, font=box_font)
                 if w > box[2]:
@@ -202,6 +208,8 @@ class Formulaire:
         return image
 
 
+# si enregistrer_valeurs, les valeurs écrites dans chaque exemplaire sont ajoutées au fichier metadata.jsonl de save_dir,
+# au format des annotations d'entraînement de DONUT (voir AnnotatorJsonDonut)
 def creation_faux_cerfa_non_editables(nom_cerfa,
                                       path_structure_cerfa,
                                       path_cerfa,
@@ -210,7 +218,8 @@ def creation_faux_cerfa_non_editables(nom_cerfa,
                                       path_folder_signatures,
                                       path_usable_fonts_list,
                                       min_rotation_angle=-90,
-                                      max_rotation_angle=90):
+                                      max_rotation_angle=90,
+                                      enregistrer_valeurs=False):
 
     with open(path_structure_cerfa, "r") as f:
         structure_cerfa = json.load(f)
@@ -257,6 +266,12 @@ def creation_faux_cerfa_non_editables(nom_cerfa,
         while os.path.exists(path_fake_cerfa(nom_cerfa, save_dir, index_fake_cerfa)):
             index_fake_cerfa += 1
         image.convert("RGB").save(path_fake_cerfa(nom_cerfa, save_dir, index_fake_cerfa))
+        if enregistrer_valeurs:
+            with open(os.path.join(save_dir, "metadata.jsonl"), "a") as metadata_file:
+                metadata_file.write(json.dumps({
+                    "file_name": os.path.basename(path_fake_cerfa(nom_cerfa, save_dir, index_fake_cerfa)),
+                    "ground_truth": json.dumps({"gt_parse": cerfa.valeurs_exemplaire}, ensure_ascii=False)
+                }, ensure_ascii=False) + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,292 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Callable, Dict, Final, Iterator, List, Optional, Tuple
+# importe le module des gestionnaires de contexte
+import contextlib
+# importe le module des variables de contexte, propres à chaque fil d'exécution
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+try:
+    # le module resource n'existe que sur les systèmes Unix
+    import resource
+except ImportError:
+    resource = None
+
+
+# --- Constantes ---#
+# variable d'environnement donnant le chemin du fichier JSONL où exporter les spans, l'export étant désactivé sinon
+SPANS_FILE_PATH_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_SPANS_FILE_PATH"
+# préfixe des noms des métriques Prometheus
+METRICS_PREFIX_STR: Final[str] = "formiable"
+# bornes supérieures, en secondes, des intervalles de l'histogramme des durées des étapes
+DURATION_HISTOGRAM_BUCKETS_IN_SECONDS: Final[Tuple[float, ...]] = \
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+
+def get_peak_rss_in_bytes() -> Optional[int]:
+    r"""Retourne le pic de mémoire résidente (RSS) du processus depuis son démarrage, en octets, ou None si cette mesure
+    n'est pas disponible sur le système."""
+    if resource is None:
+        return None
+    peak_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est exprimé en kilo-octets sous Linux et en octets sous macOS
+    return peak_rss if os.uname().sysname == "Darwin" else peak_rss * 1024
+
+
+class StageMeasure:
+    r"""Mesure d'une exécution d'une étape du pipeline, complétée à la sortie de `measure_stage` :
+    - `wall_time_in_seconds` : durée réelle,
+    - `cpu_time_in_seconds` : temps CPU du fil d'exécution ayant exécuté l'étape (les fils d'exécution natifs des
+      bibliothèques de calcul ne sont pas comptés),
+    - `peak_rss_in_bytes` : pic de mémoire résidente du processus à la fin de l'étape.
+    Des attributs libres peuvent être ajoutés au span par `set_attribute` pendant l'exécution de l'étape."""
+
+    def __init__(self, stage_name_str: str, attributes: Dict):
+        self.stage_name_str = stage_name_str
+        self.attributes = dict(attributes)
+        self.trace_id_str: str = uuid.uuid4().hex
+        self.span_id_str: str = uuid.uuid4().hex[:16]
+        self.parent_span_id_str: Optional[str] = None
+        self.start_time_unix_ns: int = time.time_ns()
+        self.end_time_unix_ns: Optional[int] = None
+        self.wall_time_in_seconds: Optional[float] = None
+        self.cpu_time_in_seconds: Optional[float] = None
+        self.peak_rss_in_bytes: Optional[int] = None
+        self.error_str: Optional[str] = None
+
+    def set_attribute(self, key_str: str, value) -> None:
+        self.attributes[key_str] = value
+
+    def to_span_dict(self) -> Dict:
+        r"""Retourne la mesure sous la forme d'un span au format proche de l'export JSON d'OpenTelemetry."""
+        return {
+            "name": self.stage_name_str,
+            "context": {"trace_id": self.trace_id_str, "span_id": self.span_id_str},
+            "parent_id": self.parent_span_id_str,
+            "start_time_unix_nano": self.start_time_unix_ns,
+            "end_time_unix_nano": self.end_time_unix_ns,
+            "attributes": {
+                **self.attributes,
+                "wall_time_in_seconds": self.wall_time_in_seconds,
+                "cpu_time_in_seconds": self.cpu_time_in_seconds,
+                "peak_rss_in_bytes": self.peak_rss_in_bytes
+            },
+            "status": {"status_code": "ERROR" if self.error_str is not None else "OK", "description": self.error_str}
+        }
+
+
+class _StageMetrics:
+    r"""Métriques cumulées d'une étape du pipeline."""
+
+    def __init__(self):
+        self.count: int = 0
+        self.failures_count: int = 0
+        self.wall_time_sum_in_seconds: float = 0.
+        self.cpu_time_sum_in_seconds: float = 0.
+        self.peak_rss_in_bytes: int = 0
+        self.bucket_counts: List[int] = [0] * len(DURATION_HISTOGRAM_BUCKETS_IN_SECONDS)
+
+
+class MetricsRegistry:
+    r"""Registre, partagé entre les fils d'exécution, des métriques cumulées de chaque étape et de l'export des spans."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages_metrics: Dict[str, _StageMetrics] = {}
+        self._spans_file = None
+        spans_file_path_str: Optional[str] = os.environ.get(SPANS_FILE_PATH_ENVIRONMENT_VARIABLE_STR)
+        if spans_file_path_str:
+            self.enable_span_export(spans_file_path_str)
+
+    def enable_span_export(self, spans_file_path_str: str) -> None:
+        r"""Ajoute désormais chaque span, sur une ligne JSON, à la fin du fichier `spans_file_path_str`."""
+        with self._lock:
+            if self._spans_file is not None:
+                self._spans_file.close()
+            self._spans_file = open(spans_file_path_str, "a", buffering=1)
+
+    def disable_span_export(self) -> None:
+        with self._lock:
+            if self._spans_file is not None:
+                self._spans_file.close()
+            self._spans_file = None
+
+    def record(
+        self,
+        stage_name_str: str,
+        wall_time_in_seconds: float,
+        cpu_time_in_seconds: float = 0.,
+        peak_rss_in_bytes: Optional[int] = None,
+        failed: bool = False,
+        stage_measure: Optional[StageMeasure] = None
+    ) -> None:
+        r"""Ajoute une exécution de l'étape `stage_name_str` aux métriques cumulées, et exporte son span s'il est fourni
+        et que l'export est activé."""
+        with self._lock:
+            stage_metrics: _StageMetrics = self._stages_metrics.setdefault(stage_name_str, _StageMetrics())
+            stage_metrics.count += 1
+            stage_metrics.failures_count += int(failed)
+            stage_metrics.wall_time_sum_in_seconds += wall_time_in_seconds
+            stage_metrics.cpu_time_sum_in_seconds += cpu_time_in_seconds
+            if peak_rss_in_bytes is not None:
+                stage_metrics.peak_rss_in_bytes = max(stage_metrics.peak_rss_in_bytes, peak_rss_in_bytes)
+            for bucket_index, bucket_upper_bound in enumerate(DURATION_HISTOGRAM_BUCKETS_IN_SECONDS):
+                if wall_time_in_seconds <= bucket_upper_bound:
+                    stage_metrics.bucket_counts[bucket_index] += 1
+            if stage_measure is not None and self._spans_file is not None:
+                self._spans_file.write(json.dumps(stage_measure.to_span_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages_metrics = {}
+
+    def get_prometheus_metrics(self) -> str:
+        r"""Retourne les métriques cumulées au format d'exposition texte de Prometheus."""
+        with self._lock:
+            stages_metrics: List[Tuple[str, _StageMetrics]] = sorted(self._stages_metrics.items())
+            lines: List[str] = [
+                f"# HELP {METRICS_PREFIX_STR}_stage_duration_seconds Wall time of the extraction pipeline stages.",
+                f"# TYPE {METRICS_PREFIX_STR}_stage_duration_seconds histogram"
+            ]
+            for stage_name_str, stage_metrics in stages_metrics:
+                for bucket_upper_bound, bucket_count in \
+                        zip(DURATION_HISTOGRAM_BUCKETS_IN_SECONDS, stage_metrics.bucket_counts):
+                    lines.append(f'{METRICS_PREFIX_STR}_stage_duration_seconds_bucket'
+                                 f'{{stage="{stage_name_str}",le="{bucket_upper_bound}"}} {bucket_count}')
+                lines.append(f'{METRICS_PREFIX_STR}_stage_duration_seconds_bucket'
+                             f'{{stage="{stage_name_str}",le="+Inf"}} {stage_metrics.count}')
+                lines.append(f'{METRICS_PREFIX_STR}_stage_duration_seconds_sum{{stage="{stage_name_str}"}} '
+                             f'{stage_metrics.wall_time_sum_in_seconds}')
+                lines.append(f'{METRICS_PREFIX_STR}_stage_duration_seconds_count{{stage="{stage_name_str}"}} '
+                             f'{stage_metrics.count}')
+            for metric_name_str, metric_type_str, help_str, get_value in [
+                ("stage_cpu_seconds_total", "counter", "CPU time of the threads running the stages.",
+                 lambda lStageMetrics: lStageMetrics.cpu_time_sum_in_seconds),
+                ("stage_failures_total", "counter", "Number of stage executions that raised an exception.",
+                 lambda lStageMetrics: lStageMetrics.failures_count),
+                ("stage_peak_rss_bytes", "gauge", "Peak resident set size of the process at the end of the stages.",
+                 lambda lStageMetrics: lStageMetrics.peak_rss_in_bytes)
+            ]:
+                lines.append(f"# HELP {METRICS_PREFIX_STR}_{metric_name_str} {help_str}")
+                lines.append(f"# TYPE {METRICS_PREFIX_STR}_{metric_name_str} {metric_type_str}")
+                for stage_name_str, stage_metrics in stages_metrics:
+                    lines.append(f'{METRICS_PREFIX_STR}_{metric_name_str}{{stage="{stage_name_str}"}} '
+                                 f'{get_value(stage_metrics)}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_metrics(self, metrics_file_path_str: str) -> None:
+        r"""Ecrit les métriques dans le fichier `metrics_file_path_str`, par exemple pour le collecteur textfile du
+        node exporter de Prometheus. Le fichier est remplacé d'un bloc pour ne jamais être lu à moitié écrit."""
+        temporary_metrics_file_path_str: str = f"{metrics_file_path_str}.tmp"
+        with open(temporary_metrics_file_path_str, "w") as metrics_file:
+            metrics_file.write(self.get_prometheus_metrics())
+        os.replace(temporary_metrics_file_path_str, metrics_file_path_str)
+
+
+# registre partagé par tout le processus
+metrics_registry: MetricsRegistry = MetricsRegistry()
+# mesure de l'étape en cours dans le contexte courant, parente des mesures des étapes imbriquées
+_current_stage_measure: contextvars.ContextVar = contextvars.ContextVar("current_stage_measure", default=None)
+
+
+@contextlib.contextmanager
+def measure_stage(stage_name_str: str, **attributes) -> Iterator[StageMeasure]:
+    r"""Mesure la durée réelle, le temps CPU et le pic de mémoire résidente de l'exécution du bloc, les ajoute aux
+    métriques de l'étape `stage_name_str` et exporte le span correspondant si l'export est activé. Les étapes
+    imbriquées appartiennent à la même trace que l'étape englobante.
+
+    Parameters
+    ----------
+    stage_name_str : str
+        le nom de l'étape, par exemple "render", "ocr", "identification", "alignment", "field_matching" ou "donut".
+    **attributes
+        des attributs ajoutés au span, par exemple le chemin du document traité.
+
+    Yields
+    ------
+    StageMeasure
+        la mesure de l'étape, complétée à la sortie du bloc.
+    """
+    stage_measure = StageMeasure(stage_name_str, attributes)
+    parent_stage_measure: Optional[StageMeasure] = _current_stage_measure.get()
+    if parent_stage_measure is not None:
+        stage_measure.trace_id_str = parent_stage_measure.trace_id_str
+        stage_measure.parent_span_id_str = parent_stage_measure.span_id_str
+    context_token = _current_stage_measure.set(stage_measure)
+    lBeforeProcessTime: float = time.perf_counter()
+    lBeforeProcessCpuTime: float = time.thread_time()
+    try:
+        yield stage_measure
+    except BaseException as lException:
+        stage_measure.error_str = repr(lException)
+        raise
+    finally:
+        stage_measure.wall_time_in_seconds = time.perf_counter() - lBeforeProcessTime
+        stage_measure.cpu_time_in_seconds = time.thread_time() - lBeforeProcessCpuTime
+        stage_measure.peak_rss_in_bytes = get_peak_rss_in_bytes()
+        stage_measure.end_time_unix_ns = time.time_ns()
+        _current_stage_measure.reset(context_token)
+        metrics_registry.record(
+            stage_name_str,
+            wall_time_in_seconds=stage_measure.wall_time_in_seconds,
+            cpu_time_in_seconds=stage_measure.cpu_time_in_seconds,
+            peak_rss_in_bytes=stage_measure.peak_rss_in_bytes,
+            failed=stage_measure.error_str is not None,
+            stage_measure=stage_measure
+        )
+        logging.debug(f"Etape {stage_name_str} : {stage_measure.wall_time_in_seconds:.3f} s, "
+                      f"{stage_measure.cpu_time_in_seconds:.3f} s CPU")
+
+
+def instrumented(stage_name_str: str) -> Callable[[Callable], Callable]:
+    r"""Décorateur mesurant chaque appel de la fonction décorée comme une exécution de l'étape `stage_name_str`."""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def instrumented_function(*args, **kwargs):
+            with measure_stage(stage_name_str):
+                return function(*args, **kwargs)
+        return instrumented_function
+    return decorator
+
+
+def record_stage_times(stage_name_prefix_str: str, times: Dict[str, float]) -> None:
+    r"""Ajoute aux métriques des durées déjà mesurées, par exemple le dictionnaire `times` retourné par
+    `craft_text_detector.predict.get_prediction`, chaque clef devenant l'étape `{stage_name_prefix_str}.{clef}`."""
+    for time_name_str, time_in_seconds in times.items():
+        metrics_registry.record(f"{stage_name_prefix_str}.{time_name_str}", wall_time_in_seconds=time_in_seconds)
+
+
+def instrument_paddleocr_model(ocr_model):
+    r"""Mesure séparément la détection ("ocr.det"), la classification du sens ("ocr.cls") et la reconnaissance
+    ("ocr.rec") du texte effectuées par le modèle PaddleOCR `ocr_model`, en enveloppant ses sous-modèles. Le modèle est
+    modifié en place et retourné ; l'appel est sans effet sur un modèle déjà instrumenté."""
+    if getattr(ocr_model, "_is_instrumented", False):
+        return ocr_model
+    for attribute_name_str, stage_name_str in [("text_detector", "ocr.det"),
+                                               ("text_classifier", "ocr.cls"),
+                                               ("text_recognizer", "ocr.rec")]:
+        sub_model = getattr(ocr_model, attribute_name_str, None)
+        if sub_model is not None:
+            setattr(ocr_model, attribute_name_str, _InstrumentedSubModel(sub_model, stage_name_str))
+    ocr_model._is_instrumented = True
+    return ocr_model
+
+
+class _InstrumentedSubModel:
+    r"""Sous-modèle PaddleOCR dont chaque appel est mesuré, les autres attributs étant ceux du sous-modèle."""
+
+    def __init__(self, sub_model, stage_name_str: str):
+        self._sub_model = sub_model
+        self._stage_name_str = stage_name_str
+
+    def __call__(self, *args, **kwargs):
+        with measure_stage(self._stage_name_str):
+            return self._sub_model(*args, **kwargs)
+
+    def __getattr__(self, attribute_name_str: str):
+        return getattr(self._sub_model, attribute_name_str)
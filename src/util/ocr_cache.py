@@ -0,0 +1,211 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Dict, Final, List, Optional, Union
+# importe le module des fonctions de hachage
+import hashlib
+import json
+import logging
+# importe le module OS pour l'accès aux fonctions de gestion de fichiers et de chemins
+import os
+# importe le module de base de données SQLite
+import sqlite3
+# importe le module des fils d'exécution (threads)
+import threading
+# importe le module de mesure du temps courant
+import time
+# importe le module de traitement scientifique, dont les tableaux multi-dimensionnels
+import numpy as np
+
+
+# --- Constantes ---
+# variable d'environnement indiquant le chemin de la base SQLite du cache des résultats d'OCR, le cache étant désactivé
+# si elle est définie mais vide
+OCR_CACHE_PATH_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_OCR_CACHE_PATH"
+# chemin par défaut de la base SQLite du cache des résultats d'OCR
+DEFAULT_OCR_CACHE_PATH_STR: Final[str] = "./data/cache/ocr_cache.sqlite"
+# variable d'environnement indiquant la taille maximale, en octets, des résultats conservés en cache
+OCR_CACHE_MAX_SIZE_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_OCR_CACHE_MAX_SIZE_IN_BYTES"
+# taille maximale par défaut, en octets, des résultats conservés en cache
+DEFAULT_OCR_CACHE_MAX_SIZE_IN_BYTES: Final[int] = 512 * 1024 * 1024
+# part de la taille maximale à laquelle le cache est ramené lorsqu'il la dépasse, afin de ne pas évincer à chaque ajout
+OCR_CACHE_EVICTION_TARGET_RATIO: Final[float] = 0.9
+
+
+class OcrResultCache:
+    r"""Cache persistant des résultats d'OCR, adressé par le contenu de l'image : la clef est le hachage de l'image,
+    du moteur d'OCR, de la version de son modèle et des paramètres de l'appel. Chaque résultat est stocké dans une base
+    SQLite sous forme compacte : les coins des boîtes en un tableau float32 (N, 4, 2) et les scores en un tableau
+    float32 (N,), sérialisés en octets, et les textes en une liste JSON. La taille totale des résultats est plafonnée à
+    `max_size_in_bytes`, les résultats les moins récemment lus étant évincés en premier."""
+
+    def __init__(self, cache_path_str: str, max_size_in_bytes: int = DEFAULT_OCR_CACHE_MAX_SIZE_IN_BYTES):
+        self.cache_path_str = cache_path_str
+        self.max_size_in_bytes = max_size_in_bytes
+        if os.path.dirname(cache_path_str):
+            os.makedirs(os.path.dirname(cache_path_str), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_path_str, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            "key TEXT PRIMARY KEY, boxes BLOB NOT NULL, scores BLOB NOT NULL, texts TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access_time REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ocr_results_last_access_time ON ocr_results (last_access_time)")
+        self.hits_count: int = 0
+        self.misses_count: int = 0
+
+    def get(self, key_str: str) -> Optional[List]:
+        r"""Retourne le résultat d'OCR de clef `key_str` au format de `paddleocr.PaddleOCR.ocr`, c'est-à-dire une liste
+        de [boîte, (texte, score)], ou None s'il n'est pas en cache."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT boxes, scores, texts FROM ocr_results WHERE key = ?", (key_str,)
+            ).fetchone()
+            if row is None:
+                self.misses_count += 1
+                return None
+            self._connection.execute("UPDATE ocr_results SET last_access_time = ? WHERE key = ?", (time.time(), key_str))
+            self.hits_count += 1
+        boxes_bytes, scores_bytes, texts_json_str = row
+        boxes: np.ndarray = np.frombuffer(boxes_bytes, dtype=np.float32).reshape(-1, 4, 2)
+        scores: np.ndarray = np.frombuffer(scores_bytes, dtype=np.float32)
+        return [[box, (text_str, score)]
+                for box, text_str, score in zip(boxes.tolist(), json.loads(texts_json_str), scores.tolist())]
+
+    def put(self, key_str: str, ocr_results: List) -> None:
+        r"""Stocke le résultat d'OCR `ocr_results`, au format de `paddleocr.PaddleOCR.ocr`, sous la clef `key_str`, puis
+        évince les résultats les moins récemment lus si la taille maximale est dépassée."""
+        boxes_bytes: bytes = np.asarray([ocr_result[0] for ocr_result in ocr_results], dtype=np.float32).tobytes()
+        scores_bytes: bytes = np.asarray([ocr_result[1][1] for ocr_result in ocr_results], dtype=np.float32).tobytes()
+        texts_json_str: str = json.dumps([ocr_result[1][0] for ocr_result in ocr_results], ensure_ascii=False)
+        size: int = len(boxes_bytes) + len(scores_bytes) + len(texts_json_str.encode()) + len(key_str)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, boxes, scores, texts, size, last_access_time) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key_str, boxes_bytes, scores_bytes, texts_json_str, size, time.time())
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        total_size: int = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+        if total_size <= self.max_size_in_bytes:
+            return
+        size_to_free: int = total_size - int(self.max_size_in_bytes * OCR_CACHE_EVICTION_TARGET_RATIO)
+        freed_size: int = 0
+        evicted_keys: List[str] = []
+        for key_str, size in self._connection.execute("SELECT key, size FROM ocr_results ORDER BY last_access_time"):
+            evicted_keys.append(key_str)
+            freed_size += size
+            if freed_size >= size_to_free:
+                break
+        self._connection.executemany("DELETE FROM ocr_results WHERE key = ?", [(key_str,) for key_str in evicted_keys])
+        logging.debug(f"{len(evicted_keys)} résultats d'OCR évincés du cache {self.cache_path_str}")
+
+    def get_statistics(self) -> Dict[str, int]:
+        with self._lock:
+            entries_count, total_size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results"
+            ).fetchone()
+        return {"entries_count": entries_count, "size_in_bytes": total_size,
+                "hits_count": self.hits_count, "misses_count": self.misses_count}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM ocr_results")
+
+
+def get_image_hash(image: Union[str, np.ndarray]) -> str:
+    r"""Retourne le hachage du contenu de l'image `image` : les octets du fichier s'il s'agit d'un chemin, les pixels et
+    la forme du tableau sinon."""
+    image_hash = hashlib.blake2b(digest_size=20)
+    if isinstance(image, str):
+        with open(image, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(1 << 20), b""):
+                image_hash.update(chunk)
+    else:
+        image_array: np.ndarray = np.ascontiguousarray(image)
+        image_hash.update(f"{image_array.shape}{image_array.dtype}".encode())
+        image_hash.update(image_array.data)
+    return image_hash.hexdigest()
+
+
+def get_paddleocr_model_version(ocr_model) -> str:
+    r"""Retourne la version du modèle PaddleOCR `ocr_model` : celle du paquet paddleocr et les arguments du modèle, dont
+    les répertoires des modèles de détection, de classification et de reconnaissance, qui en identifient les poids, et
+    les seuils de détection et de reconnaissance."""
+    import paddleocr
+    model_arguments = getattr(ocr_model, "args", None)
+    return json.dumps(
+        [getattr(paddleocr, "VERSION", getattr(paddleocr, "__version__", "")), type(ocr_model).__name__,
+         sorted(vars(model_arguments).items()) if model_arguments is not None else None],
+        default=str
+    )
+
+
+def get_ocr_cache_key(image_hash_str: str, engine_str: str, model_version_str: str, parameters: Dict) -> str:
+    r"""Retourne la clef du cache d'un résultat d'OCR."""
+    return hashlib.blake2b(
+        json.dumps([image_hash_str, engine_str, model_version_str, parameters], sort_keys=True).encode(),
+        digest_size=20
+    ).hexdigest()
+
+
+_ocr_cache: Optional[OcrResultCache] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OcrResultCache]:
+    r"""Retourne le cache partagé des résultats d'OCR, ouvert lors du premier appel au chemin indiqué par la variable
+    d'environnement FORMIABLE_OCR_CACHE_PATH (DEFAULT_OCR_CACHE_PATH_STR par défaut), ou None si le cache est désactivé
+    en définissant cette variable à une chaîne vide."""
+    global _ocr_cache
+    cache_path_str: str = os.environ.get(OCR_CACHE_PATH_ENVIRONMENT_VARIABLE_STR, DEFAULT_OCR_CACHE_PATH_STR)
+    if not cache_path_str:
+        return None
+    with _ocr_cache_lock:
+        if _ocr_cache is None or _ocr_cache.cache_path_str != cache_path_str:
+            _ocr_cache = OcrResultCache(
+                cache_path_str,
+                max_size_in_bytes=int(os.environ.get(OCR_CACHE_MAX_SIZE_ENVIRONMENT_VARIABLE_STR,
+                                                     DEFAULT_OCR_CACHE_MAX_SIZE_IN_BYTES))
+            )
+        return _ocr_cache
+
+
+def paddleocr_ocr(ocr_model, img: Union[str, np.ndarray], det: bool = True, rec: bool = True, cls: bool = True) -> List:
+    r"""Appel de `ocr_model.ocr(img=img, det=det, rec=rec, cls=cls)` passant par le cache partagé des résultats d'OCR :
+    le modèle n'est exécuté que si le résultat de cette image, de ce modèle et de ces paramètres n'est pas en cache.
+    Seuls les appels avec détection et reconnaissance, dont le résultat a toujours le même format, sont mis en cache.
+
+    Parameters
+    ----------
+    ocr_model : paddleocr.PaddleOCR
+        le modèle PaddleOCR.
+    img : str or numpy.ndarray
+        le chemin de l'image ou l'image BGR elle-même.
+    det, rec, cls : bool
+        les paramètres de `paddleocr.PaddleOCR.ocr`.
+
+    Returns
+    -------
+    list
+        le résultat de l'OCR, au format de `paddleocr.PaddleOCR.ocr` : une liste, vide si aucun texte n'a été détecté,
+        de [boîte, (texte, score)].
+    """
+    if not (det and rec):
+        return ocr_model.ocr(img=img, det=det, rec=rec, cls=cls)
+    ocr_cache: Optional[OcrResultCache] = get_ocr_cache()
+    if ocr_cache is None:
+        return ocr_model.ocr(img=img, det=det, rec=rec, cls=cls) or []
+    key_str: str = get_ocr_cache_key(
+        image_hash_str=get_image_hash(img),
+        engine_str="paddleocr",
+        model_version_str=get_paddleocr_model_version(ocr_model),
+        parameters={"det": det, "rec": rec, "cls": cls}
+    )
+    ocr_results: Optional[List] = ocr_cache.get(key_str)
+    if ocr_results is None:
+        ocr_results = ocr_model.ocr(img=img, det=det, rec=rec, cls=cls) or []
+        ocr_cache.put(key_str, ocr_results)
+    return ocr_results
@@ -0,0 +1,110 @@
+"""
+Uniform grid spatial index over the boxes of a template page, used to
+only test each OCR box against the template boxes it can overlap.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Maximum number of grid cells along each axis
+MAX_CELLS_PER_AXIS = 256
+
+
+class UniformGridIndex:
+    """Uniform grid over page coordinates, each cell listing the boxes
+    overlapping it.
+
+    The index is built once per template page: boxes of different pages
+    must go into different indexes. Cell lists are stored in CSR form
+    (cell_starts, cell_box_indices) so that queries stay vectorised.
+    """
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        cell_size: Optional[Tuple[float, float]] = None,
+    ):
+        """
+        Args:
+            boxes (np.ndarray): (M, 4) array of x0, y0, x1, y1 coordinates.
+            cell_size (Optional[Tuple[float, float]]): Width and height of
+                the grid cells. Defaults to the median box width and height,
+                so that a box spans a handful of cells.
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        n_boxes = len(self.boxes)
+        if n_boxes == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = np.ones(2)
+            self.n_cells = np.ones(2, dtype=np.int64)
+            self.cell_starts = np.zeros(2, dtype=np.int64)
+            self.cell_box_indices = np.zeros(0, dtype=np.int64)
+            return
+
+        self.origin = self.boxes[:, :2].min(axis=0)
+        extent = np.maximum(self.boxes[:, 2:].max(axis=0) - self.origin, 1.0)
+        if cell_size is None:
+            cell_size = np.median(self.boxes[:, 2:] - self.boxes[:, :2], axis=0)
+        cell_size = np.maximum(np.asarray(cell_size, dtype=np.float64), extent / MAX_CELLS_PER_AXIS)
+        self.cell_size = np.maximum(cell_size, 1e-6)
+        self.n_cells = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        box_indices, cell_ids = self._get_box_cells(self.boxes, np.arange(n_boxes))
+        order = np.argsort(cell_ids, kind="stable")
+        self.cell_box_indices = box_indices[order]
+        counts = np.bincount(cell_ids, minlength=int(self.n_cells.prod()))
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)])
+
+    def _get_cell_ranges(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the first and last cell coordinates covered by each box,
+        clipped to the grid."""
+        first_cells = np.floor((boxes[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+        last_cells = np.floor((boxes[:, 2:] - self.origin) / self.cell_size).astype(np.int64)
+        return (
+            np.clip(first_cells, 0, self.n_cells - 1),
+            np.clip(last_cells, 0, self.n_cells - 1),
+        )
+
+    def _get_box_cells(self, boxes: np.ndarray, box_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (box index, cell id) pairs for every cell covered by each box."""
+        first_cells, last_cells = self._get_cell_ranges(boxes)
+        # boxes lying entirely outside of the grid do not cover any cell
+        inside = np.all(
+            (boxes[:, 2:] >= self.origin) & (boxes[:, :2] <= self.origin + self.n_cells * self.cell_size),
+            axis=1,
+        )
+        spans = np.where(inside[:, None], last_cells - first_cells + 1, 0)
+        n_box_cells = spans[:, 0] * spans[:, 1]
+        pair_box_indices = np.repeat(box_indices, n_box_cells)
+        # rank of each cell within the cells covered by its box
+        ranks = np.arange(n_box_cells.sum()) - np.repeat(np.cumsum(n_box_cells) - n_box_cells, n_box_cells)
+        pair_spans_x = np.repeat(spans[:, 0], n_box_cells)
+        cells_x = np.repeat(first_cells[:, 0], n_box_cells) + ranks % np.maximum(pair_spans_x, 1)
+        cells_y = np.repeat(first_cells[:, 1], n_box_cells) + ranks // np.maximum(pair_spans_x, 1)
+        return pair_box_indices, cells_y * self.n_cells[0] + cells_x
+
+    def query_pairs(self, query_boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the candidate (query box index, indexed box index) pairs,
+        i.e. the pairs of boxes sharing at least one grid cell, without
+        duplicates and sorted by query box then indexed box.
+
+        Args:
+            query_boxes (np.ndarray): (N, 4) array of x0, y0, x1, y1 coordinates.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Query box indices and indexed box indices.
+        """
+        query_boxes = np.asarray(query_boxes, dtype=np.float64).reshape(-1, 4)
+        if len(query_boxes) == 0 or len(self.cell_box_indices) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        query_indices, cell_ids = self._get_box_cells(query_boxes, np.arange(len(query_boxes)))
+        cell_counts = self.cell_starts[cell_ids + 1] - self.cell_starts[cell_ids]
+        pair_query_indices = np.repeat(query_indices, cell_counts)
+        ranks = np.arange(cell_counts.sum()) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+        pair_box_indices = self.cell_box_indices[np.repeat(self.cell_starts[cell_ids], cell_counts) + ranks]
+
+        # an indexed box spanning several cells shared with the query box is only kept once
+        pair_codes = np.unique(pair_query_indices * len(self.boxes) + pair_box_indices)
+        return pair_codes // len(self.boxes), pair_codes % len(self.boxes)
@@ -0,0 +1,92 @@
+"""
+Equivalence of src.util.box_matching with the loop of
+first_pipeline.match_bounding_boxes_to_template it replaces.
+"""
+import numpy as np
+import pytest
+
+from src.util.box_matching import compute_intersection_areas, match_boxes_to_fields
+
+
+def match_boxes_to_fields_with_loop(boxes, field_boxes, area_ratio_threshold):
+    """Former double loop of match_bounding_boxes_to_template, returning
+    the index of the matched field box of each box, -1 if none."""
+    matches = []
+    for x0_1, y0_1, x1_1, y1_1 in boxes:
+        box_area = (x1_1 - x0_1) * (y1_1 - y0_1)
+        field_to_increment = -1
+        max_intersection_area = 0
+        for field_index, (x0_2, y0_2, x1_2, y1_2) in enumerate(field_boxes):
+            x0, y0 = max(x0_1, x0_2), max(y0_1, y0_2)
+            x1, y1 = min(x1_1, x1_2), min(y1_1, y1_2)
+            if x0 <= x1 and y0 <= y1:
+                intersection_area = (x1 - x0) * (y1 - y0)
+                if (intersection_area / box_area > area_ratio_threshold) and (
+                    intersection_area > max_intersection_area
+                ):
+                    max_intersection_area = intersection_area
+                    field_to_increment = field_index
+        matches.append(field_to_increment)
+    return np.array(matches, dtype=np.int64)
+
+
+def random_boxes(rng, count, max_coordinate, max_size):
+    """Integer boxes on a small page, so that boxes often share borders
+    and several field boxes often tie on the intersection area."""
+    x0y0 = rng.integers(0, max_coordinate, size=(count, 2))
+    sizes = rng.integers(1, max_size, size=(count, 2))
+    return np.concatenate([x0y0, x0y0 + sizes], axis=1).astype(np.float64)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("area_ratio_threshold", [0.0, 0.2, 0.5])
+def test_match_boxes_to_fields_is_the_loop(seed, area_ratio_threshold):
+    rng = np.random.default_rng(seed)
+    boxes = random_boxes(rng, 200, 40, 8)
+    field_boxes = random_boxes(rng, 30, 40, 12)
+    np.testing.assert_array_equal(
+        match_boxes_to_fields(boxes, field_boxes, area_ratio_threshold),
+        match_boxes_to_fields_with_loop(boxes, field_boxes, area_ratio_threshold),
+    )
+
+
+def test_ties_go_to_the_first_field_box():
+    boxes = np.array([[0, 0, 4, 2]], dtype=np.float64)
+    # both field boxes cover half of the box
+    field_boxes = np.array([[2, 0, 6, 2], [-2, 0, 2, 2]], dtype=np.float64)
+    assert match_boxes_to_fields(boxes, field_boxes, 0.4).tolist() == [0]
+    assert match_boxes_to_fields(boxes, field_boxes[::-1], 0.4).tolist() == [0]
+
+
+def test_area_ratio_threshold_is_strict():
+    boxes = np.array([[0, 0, 4, 2]], dtype=np.float64)
+    field_boxes = np.array([[2, 0, 6, 2]], dtype=np.float64)
+    assert match_boxes_to_fields(boxes, field_boxes, 0.5).tolist() == [-1]
+    assert match_boxes_to_fields(boxes, field_boxes, 0.49).tolist() == [0]
+
+
+def test_boxes_sharing_a_border_do_not_match():
+    boxes = np.array([[0, 0, 2, 2], [2, 2, 4, 4]], dtype=np.float64)
+    field_boxes = np.array([[2, 0, 4, 2]], dtype=np.float64)
+    assert match_boxes_to_fields(boxes, field_boxes, 0.0).tolist() == [-1, -1]
+
+
+def test_null_area_boxes_are_never_matched():
+    boxes = np.array([[1, 1, 1, 3], [1, 1, 3, 3]], dtype=np.float64)
+    field_boxes = np.array([[0, 0, 4, 4]], dtype=np.float64)
+    assert match_boxes_to_fields(boxes, field_boxes, 0.0).tolist() == [-1, 0]
+
+
+@pytest.mark.parametrize("box_count, field_box_count", [(0, 3), (3, 0), (0, 0)])
+def test_empty_inputs(box_count, field_box_count):
+    boxes = np.zeros((box_count, 4))
+    field_boxes = np.tile([0.0, 0.0, 1.0, 1.0], (field_box_count, 1))
+    matches = match_boxes_to_fields(boxes, field_boxes, 0.5)
+    assert matches.shape == (box_count,)
+    assert (matches == -1).all()
+
+
+def test_compute_intersection_areas():
+    boxes = np.array([[0, 0, 4, 4], [10, 10, 12, 12]], dtype=np.float64)
+    field_boxes = np.array([[2, 2, 6, 6], [0, 0, 1, 1]], dtype=np.float64)
+    np.testing.assert_array_equal(compute_intersection_areas(boxes, field_boxes), [[4, 1], [0, 0]])
@@ -0,0 +1,108 @@
+import fitz
+import numpy as np
+import pytest
+from src.util.document_loader import (DIGITAL_PAGE_MIN_WORDS_COUNT, PDF_POINTS_PER_INCH, get_pdf_page_text_layer,
+                                      load_document_text_layer, load_document_text_layers)
+
+
+def add_widget(pdf_page, field_type, field_name_str, rectangle, field_value=None):
+    widget = fitz.Widget()
+    widget.field_type = field_type
+    widget.field_name = field_name_str
+    widget.rect = fitz.Rect(*rectangle)
+    if field_value is not None:
+        widget.field_value = field_value
+    pdf_page.add_widget(widget)
+
+
+def save_pdf(pdf_document, dir_path, file_name_str="document.pdf"):
+    pdf_document_path = str(dir_path / file_name_str)
+    pdf_document.save(pdf_document_path)
+    pdf_document.close()
+    return pdf_document_path
+
+
+def test_words_are_grouped_by_line_and_scaled(tmp_path):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page(width=595, height=842)
+    pdf_page.insert_text((50, 100), "Nom de l'assuré", fontsize=12)
+    pdf_page.insert_text((50, 200), " ".join(["mot"] * DIGITAL_PAGE_MIN_WORDS_COUNT), fontsize=12)
+    text_layer = load_document_text_layer(save_pdf(pdf_document, tmp_path), image_quality_in_dpi=144)
+
+    assert text_layer.text_elements == ["Nom de l'assuré", " ".join(["mot"] * DIGITAL_PAGE_MIN_WORDS_COUNT)]
+    assert text_layer.page_size == (842 * 2, 595 * 2)
+    assert text_layer.widget_values == {}
+    (x0, y0), (x1, _), (_, y1), _ = text_layer.text_boxes[0]
+    # boîte exprimée en pixels de la page rendue à 144 dpi, soit 2 pixels par point
+    assert x0 == pytest.approx(100, abs=2) and y1 == pytest.approx(200, abs=8) and y0 < y1 and x0 < x1
+
+
+@pytest.mark.parametrize("words_count, is_digital", [
+    (DIGITAL_PAGE_MIN_WORDS_COUNT - 1, False),
+    (DIGITAL_PAGE_MIN_WORDS_COUNT, True),
+])
+def test_digital_page_words_count_threshold(tmp_path, words_count, is_digital):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page()
+    pdf_page.insert_text((50, 100), " ".join(["mot"] * words_count), fontsize=10)
+    text_layer = load_document_text_layer(save_pdf(pdf_document, tmp_path))
+    assert (text_layer is not None) == is_digital
+
+
+def test_scanned_page_and_images_are_not_read(tmp_path):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20), False)
+    pixmap.clear_with(255)
+    pdf_page.insert_image(pdf_page.rect, pixmap=pixmap)
+    pdf_document_path = save_pdf(pdf_document, tmp_path)
+    assert load_document_text_layer(pdf_document_path) is None
+    # page hors du document
+    assert load_document_text_layer(pdf_document_path, page_index=1) is None
+    # une image n'est jamais ouverte
+    assert load_document_text_layer(str(tmp_path / "document.jpg")) is None
+
+
+def test_filled_widgets_are_read_with_their_rectangle(tmp_path):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page()
+    add_widget(pdf_page, fitz.PDF_WIDGET_TYPE_TEXT, "nom", (100, 100, 300, 120), "Dupont")
+    add_widget(pdf_page, fitz.PDF_WIDGET_TYPE_TEXT, "prenom", (100, 150, 300, 170))
+    pdf_document_path = save_pdf(pdf_document, tmp_path)
+
+    # un seul champ rempli suffit à lire la page, même sans couche texte
+    text_layer = load_document_text_layer(pdf_document_path, image_quality_in_dpi=PDF_POINTS_PER_INCH)
+    assert text_layer.widget_values == {"nom": "Dupont"}
+    # le texte de l'apparence du champ n'est pas lu une seconde fois comme mot de la page
+    assert text_layer.text_elements == ["Dupont"]
+    np.testing.assert_allclose(text_layer.text_boxes, [[(100, 100), (300, 100), (300, 120), (100, 120)]])
+
+
+def test_only_checked_checkboxes_are_read(tmp_path):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page()
+    add_widget(pdf_page, fitz.PDF_WIDGET_TYPE_CHECKBOX, "case_cochee", (100, 100, 115, 115), True)
+    add_widget(pdf_page, fitz.PDF_WIDGET_TYPE_CHECKBOX, "case_non_cochee", (100, 150, 115, 165), False)
+    pdf_document_path = save_pdf(pdf_document, tmp_path)
+
+    with fitz.open(pdf_document_path) as pdf_document:
+        pdf_page = pdf_document.load_page(0)
+        on_state = {widget.field_name: widget.on_state() for widget in pdf_page.widgets()}["case_cochee"]
+        text_layer = get_pdf_page_text_layer(pdf_page)
+    assert text_layer.widget_values == {"case_cochee": str(on_state)}
+
+
+def test_text_layers_of_the_digital_pages_only(tmp_path):
+    pdf_document = fitz.open()
+    for page_text_str in ["mot " * DIGITAL_PAGE_MIN_WORDS_COUNT, "", "autre " * DIGITAL_PAGE_MIN_WORDS_COUNT]:
+        pdf_page = pdf_document.new_page()
+        pdf_page.insert_text((50, 100), page_text_str, fontsize=10)
+    pdf_document_path = save_pdf(pdf_document, tmp_path)
+
+    pages_text_layers = load_document_text_layers(pdf_document_path, image_quality_in_dpi=72,
+                                                  pages_image_quality_in_dpi={2: 144})
+    assert sorted(pages_text_layers) == [0, 2]
+    assert [pages_text_layers[page_index].image_quality_in_dpi for page_index in [0, 2]] == [72, 144]
+    assert pages_text_layers[2].get_page_content() == \
+        load_document_text_layer(pdf_document_path, image_quality_in_dpi=144, page_index=2).get_page_content()
+    assert load_document_text_layers(str(tmp_path / "document.jpg")) == {}
@@ -0,0 +1,104 @@
+import itertools
+import sys
+import types
+import numpy as np
+import pytest
+import src.util.ocr_cache as ocrCache
+from src.util.ocr_cache import OcrResultCache
+
+
+OCR_RESULTS = [
+    [[[10.5, 20.0], [110.0, 20.0], [110.0, 40.25], [10.5, 40.25]], ("Nom de l'assuré", 0.5)],
+    [[[0.0, 0.0], [5.0, 0.0], [5.0, 5.0], [0.0, 5.0]], ("12485*03", 0.875)],
+]
+
+
+class FakePaddleOCR:
+    def __init__(self, **model_arguments):
+        self.args = types.SimpleNamespace(**model_arguments)
+        self.calls_count = 0
+
+    def ocr(self, img, det=True, rec=True, cls=True):
+        self.calls_count += 1
+        return OCR_RESULTS
+
+
+@pytest.fixture
+def ocr_cache_path(tmp_path, monkeypatch):
+    ocr_cache_path_str = str(tmp_path / "cache" / "ocr_cache.sqlite")
+    monkeypatch.setenv(ocrCache.OCR_CACHE_PATH_ENVIRONMENT_VARIABLE_STR, ocr_cache_path_str)
+    monkeypatch.setitem(sys.modules, "paddleocr", types.SimpleNamespace(VERSION="2.6.1.3"))
+    return ocr_cache_path_str
+
+
+def test_results_round_trip(tmp_path):
+    ocr_cache = OcrResultCache(str(tmp_path / "ocr_cache.sqlite"))
+    ocr_cache.put("key", OCR_RESULTS)
+    # les coordonnées et les scores, stockés en float32, sont ici exactement représentables
+    assert ocr_cache.get("key") == OCR_RESULTS
+    ocr_cache.put("empty", [])
+    assert ocr_cache.get("empty") == []
+    assert ocr_cache.get("missing") is None
+    assert ocr_cache.get_statistics()["hits_count"] == 2 and ocr_cache.get_statistics()["misses_count"] == 1
+    # le cache est persistant
+    assert OcrResultCache(str(tmp_path / "ocr_cache.sqlite")).get("key") == OCR_RESULTS
+
+
+def test_least_recently_read_results_are_evicted_first(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(ocrCache.time, "time", lambda: float(next(clock)))
+    ocr_cache = OcrResultCache(str(tmp_path / "ocr_cache.sqlite"))
+    ocr_cache.put("a", OCR_RESULTS)
+    entry_size = ocr_cache.get_statistics()["size_in_bytes"]
+    ocr_cache.max_size_in_bytes = 3 * entry_size
+    ocr_cache.put("b", OCR_RESULTS)
+    ocr_cache.put("c", OCR_RESULTS)
+    assert ocr_cache.get("a") is not None
+    # le 4e résultat dépasse la taille maximale : les moins récemment lus, b puis c, sont évincés jusqu'à revenir à
+    # OCR_CACHE_EVICTION_TARGET_RATIO de la taille maximale
+    ocr_cache.put("d", OCR_RESULTS)
+    assert [ocr_cache.get(key_str) is not None for key_str in ["a", "b", "c", "d"]] == [True, False, False, True]
+    assert ocr_cache.get_statistics()["size_in_bytes"] \
+        <= ocr_cache.max_size_in_bytes * ocrCache.OCR_CACHE_EVICTION_TARGET_RATIO
+
+
+def test_paddleocr_ocr_runs_the_model_once_per_image(ocr_cache_path):
+    ocr_model = FakePaddleOCR(det_model_dir="det", rec_model_dir="rec")
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    assert ocrCache.paddleocr_ocr(ocr_model, img=image) == OCR_RESULTS
+    assert ocrCache.paddleocr_ocr(ocr_model, img=image.copy()) == OCR_RESULTS
+    assert ocr_model.calls_count == 1
+    # les appels sans reconnaissance ne passent pas par le cache
+    ocrCache.paddleocr_ocr(ocr_model, img=image, rec=False)
+    assert ocr_model.calls_count == 2
+
+
+@pytest.mark.parametrize("other_image, other_call_parameters, other_model_arguments", [
+    # autre image, mêmes octets mais autre forme
+    (np.zeros((30, 20, 3), dtype=np.uint8), {}, {}),
+    (None, {"cls": False}, {}),
+    # autres poids
+    (None, {}, {"rec_model_dir": "rec_v2"}),
+    # autre seuil de détection
+    (None, {}, {"det_db_thresh": 0.4}),
+])
+def test_cache_key_depends_on_the_image_the_parameters_and_the_model(
+    ocr_cache_path, other_image, other_call_parameters, other_model_arguments
+):
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    model_arguments = {"det_model_dir": "det", "rec_model_dir": "rec", "det_db_thresh": 0.3}
+    ocrCache.paddleocr_ocr(FakePaddleOCR(**model_arguments), img=image)
+    other_ocr_model = FakePaddleOCR(**dict(model_arguments, **other_model_arguments))
+    ocrCache.paddleocr_ocr(other_ocr_model, img=image if other_image is None else other_image,
+                           **other_call_parameters)
+    assert other_ocr_model.calls_count == 1
+
+
+def test_cache_is_disabled_by_an_empty_path(monkeypatch):
+    monkeypatch.setenv(ocrCache.OCR_CACHE_PATH_ENVIRONMENT_VARIABLE_STR, "")
+    assert ocrCache.get_ocr_cache() is None
+    ocr_model = FakePaddleOCR()
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    ocrCache.paddleocr_ocr(ocr_model, img=image)
+    ocrCache.paddleocr_ocr(ocr_model, img=image)
+    assert ocr_model.calls_count == 2
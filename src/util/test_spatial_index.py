@@ -0,0 +1,78 @@
+"""
+Equivalence of the spatial index of src.util.spatial_index with the
+all-pairs scan it prunes.
+"""
+import numpy as np
+import pytest
+
+from src.util.box_matching import match_boxes_to_fields
+from src.util.spatial_index import UniformGridIndex
+
+
+def random_boxes(rng, count, max_coordinate, max_size):
+    x0y0 = rng.integers(-5, max_coordinate, size=(count, 2))
+    sizes = rng.integers(1, max_size, size=(count, 2))
+    return np.concatenate([x0y0, x0y0 + sizes], axis=1).astype(np.float64)
+
+
+def overlapping_pairs_with_loop(query_boxes, boxes):
+    """(query box index, box index) pairs of boxes with a positive intersection area."""
+    pairs = set()
+    for query_index, (qx0, qy0, qx1, qy1) in enumerate(query_boxes):
+        for box_index, (x0, y0, x1, y1) in enumerate(boxes):
+            if min(qx1, x1) > max(qx0, x0) and min(qy1, y1) > max(qy0, y0):
+                pairs.add((query_index, box_index))
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("cell_size", [None, (1.0, 1.0), (7.0, 3.0), (100.0, 100.0)])
+def test_query_pairs_contain_every_overlapping_pair(seed, cell_size):
+    rng = np.random.default_rng(seed)
+    boxes = random_boxes(rng, 40, 50, 10)
+    query_boxes = random_boxes(rng, 150, 60, 8)
+    index = UniformGridIndex(boxes, cell_size=cell_size)
+    query_indices, box_indices = index.query_pairs(query_boxes)
+    candidate_pairs = set(zip(query_indices.tolist(), box_indices.tolist()))
+    assert len(candidate_pairs) == len(query_indices)  # no duplicate
+    assert overlapping_pairs_with_loop(query_boxes, boxes) <= candidate_pairs
+    # sorted by query box then indexed box
+    assert list(zip(query_indices.tolist(), box_indices.tolist())) == sorted(candidate_pairs)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("area_ratio_threshold", [0.0, 0.5])
+def test_indexed_matching_is_the_all_pairs_matching(seed, area_ratio_threshold):
+    rng = np.random.default_rng(seed)
+    field_boxes = random_boxes(rng, 60, 80, 15)
+    boxes = random_boxes(rng, 300, 90, 6)
+    np.testing.assert_array_equal(
+        match_boxes_to_fields(boxes, field_boxes, area_ratio_threshold,
+                              field_boxes_index=UniformGridIndex(field_boxes)),
+        match_boxes_to_fields(boxes, field_boxes, area_ratio_threshold),
+    )
+
+
+def test_boxes_on_cell_borders():
+    # cells of 10 x 10 from the origin (0, 0): the boxes below end or start exactly on cell borders
+    index = UniformGridIndex(np.array([[0, 0, 10, 10], [10, 0, 20, 10], [0, 10, 10, 20]], dtype=np.float64),
+                             cell_size=(10.0, 10.0))
+    query_indices, box_indices = index.query_pairs(np.array([[8, 2, 12, 4], [2, 9, 4, 11]], dtype=np.float64))
+    pairs = set(zip(query_indices.tolist(), box_indices.tolist()))
+    assert {(0, 0), (0, 1), (1, 0), (1, 2)} <= pairs
+
+
+def test_query_boxes_outside_of_the_grid():
+    index = UniformGridIndex(np.array([[0, 0, 10, 10]], dtype=np.float64))
+    query_indices, box_indices = index.query_pairs(np.array([[50, 50, 60, 60], [-20, -20, -15, -15]],
+                                                            dtype=np.float64))
+    assert len(query_indices) == len(box_indices) == 0
+
+
+def test_empty_index_and_empty_queries():
+    empty_index = UniformGridIndex(np.zeros((0, 4)))
+    assert [len(indices) for indices in empty_index.query_pairs(np.array([[0, 0, 1, 1]]))] == [0, 0]
+    index = UniformGridIndex(np.array([[0, 0, 1, 1]], dtype=np.float64))
+    assert [len(indices) for indices in index.query_pairs(np.zeros((0, 4)))] == [0, 0]
+    assert (match_boxes_to_fields(np.array([[0, 0, 1, 1]]), np.zeros((0, 4)), 0.5,
+                                  field_boxes_index=empty_index) == -1).all()
@@ -0,0 +1,32 @@
+import fitz
+import numpy as np
+from src.util.utils import (get_image_array_from_document, iter_strip_image_arrays_from_document,
+                            iter_strip_image_arrays_from_image)
+
+
+def test_pdf_strips_are_rendered_at_the_strip_width(tmp_path):
+    pdf_document = fitz.open()
+    pdf_page = pdf_document.new_page(width=595, height=842)
+    pdf_page.draw_rect(fitz.Rect(0, 0, 595, 84.2), color=(0, 0, 0), fill=(0, 0, 0))
+    pdf_document_path = str(tmp_path / "document.pdf")
+    pdf_document.save(pdf_document_path)
+    pdf_document.close()
+
+    header_strip_image, footer_strip_image, empty_strip_image = \
+        iter_strip_image_arrays_from_document(pdf_document_path, [(0., 0.1), (0.5, 1.), (0.3, 0.3)], 1240)
+    # bandes de 1240 pixels de large, soit une page A4 rendue à 150 dpi, à un pixel près en hauteur
+    assert header_strip_image.shape[1:] == footer_strip_image.shape[1:] == (1240, 3)
+    assert abs(header_strip_image.shape[0] - 175) <= 1 and abs(footer_strip_image.shape[0] - 877) <= 1
+    assert header_strip_image[5:-5].max() == 0 and footer_strip_image.min() == 255
+    assert empty_strip_image.shape[0] == 0
+    # mêmes bandes que celles découpées dans la page rendue en pleine résolution puis réduites
+    image_strips = list(iter_strip_image_arrays_from_image(get_image_array_from_document(pdf_document_path, 350),
+                                                           [(0., 0.1), (0.5, 1.)], 1240))
+    assert [image_strip.shape[1] for image_strip in image_strips] == [1240, 1240]
+    assert abs(image_strips[0].shape[0] - 175) <= 1 and abs(image_strips[1].shape[0] - 877) <= 1
+
+
+def test_image_strips_are_not_enlarged():
+    image = np.zeros((1000, 600, 3), dtype=np.uint8)
+    strip_image, = iter_strip_image_arrays_from_image(image, [(0.2, 0.3)], 1240)
+    assert strip_image.shape == (100, 600, 3)
@@ -1,6 +1,11 @@
 # importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
-from typing import Final, List, Tuple
-from pdf2image import convert_from_path
+from typing import Deque, Dict, Final, Iterator, List, Optional, Tuple
+# importe le module d'exécution de tâches dans un ensemble de processus
+from concurrent.futures import Future, ProcessPoolExecutor
+# importe le module des conteneurs spécialisés, dont la file à double extrémité
+from collections import deque
+# importe le module des outils d'itération
+import itertools
 # importe le module OS pour l'accès aux fonctions de gestion de fichiers et de chemins
 import os
 # importe le module des classes représentant le système de fichiers avec la sémantique appropriée pour différents
@@ -10,8 +15,14 @@ from pathlib import Path
 import fitz
 import logging
 from tqdm import tqdm
+# importe le module de traitement scientifique, dont les tableaux multi-dimensionnels
+import numpy as np
+# importe le module de traitement d'images OpenCV
+import cv2
 # importe le module de gestion des images (Python Imaging Library)
 from PIL import Image
+# importe le module de mesure des étapes du pipeline
+from . import instrumentation
 
 
 # --- Constantes ---
@@ -21,6 +32,8 @@ TEMPORARY_FILE_DIRECTORY_STR: Final[str] = "./data/tmp"
 TEMPORARY_FILE_PREFIX_STR: Final[str] = "temp"
 # liste des extensions d'image acceptées
 VALID_OUTPUT_IMAGE_EXTENSIONS: Final[List[str]] = [".jpg", ".jpeg", ".png"]
+# qualité en dpi des images des pages des PDF concaténées par pdf_to_image (celle par défaut de pdf2image)
+PDF_TO_IMAGE_QUALITY_IN_DPI: Final[int] = 200
 
 
 def ajout_retour_ligne(text, max_length, font, draw):
@@ -67,6 +80,214 @@ def get_image_from_pdf_document(input_pdf_document: fitz.Document, image_quality
     return lImage
 
 
+def get_image_array_from_pdf_document(
+    input_pdf_document: fitz.Document,
+    image_quality_in_dpi: int = 350,
+    page_index: int = 0
+) -> np.ndarray:
+    r"""Exporte la page `page_index` du document PDF `input_pdf_document` vers un tableau NumPy d'image BGR (convention
+    d'OpenCV et de PaddleOCR) avec une qualité de `image_quality_in_dpi` dpi, sans passer par un fichier.
+
+    Parameters
+    ----------
+    input_pdf_document : fitz.Document
+        le document PDF à transformer en image.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi (dot per inch) de l'image à générer à partir du fichier PDF `input_pdf_document`.
+    page_index : int, default=0
+        l'indice de la page à exporter.
+
+    Returns
+    -------
+    numpy.ndarray
+        l'image BGR de hauteur x largeur x 3 octets de la page `page_index` du document PDF `input_pdf_document`.
+    """
+    lPixelMap = input_pdf_document.load_page(page_index).get_pixmap(dpi=image_quality_in_dpi, alpha=False)
+    lRgbImage = np.frombuffer(lPixelMap.samples, dtype=np.uint8).reshape(lPixelMap.height, lPixelMap.width, lPixelMap.n)
+    return cv2.cvtColor(lRgbImage, cv2.COLOR_RGB2BGR)
+
+
+@instrumentation.instrumented("render")
+def get_image_array_from_document(input_document_path: str, image_quality_in_dpi: int = 350) -> np.ndarray:
+    r"""Charge le document (PDF ou image) appelé `input_document_path` en mémoire sous la forme d'un tableau NumPy d'image
+    BGR, directement utilisable par PaddleOCR et OpenCV, sans l'encoder dans un fichier temporaire.
+    S'il s'agit d'un document PDF de plusieurs pages, seule la première page est exportée.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document à charger, son extension peut être ".pdf" ou une extension d'image valide.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi (dot per inch) de l'image à générer à partir d'un document PDF.
+
+    Returns
+    -------
+    numpy.ndarray
+        l'image BGR de hauteur x largeur x 3 octets du document `input_document_path`.
+    """
+    # si le document est un document PDF,
+    if os.path.splitext(input_document_path)[1].lower() == ".pdf":
+        with fitz.open(input_document_path) as lPdfDocument:
+            return get_image_array_from_pdf_document(lPdfDocument, image_quality_in_dpi=image_quality_in_dpi)
+    # sinon, il s'agit d'une image dont le contenu est décodé une seule fois
+    image = cv2.imread(input_document_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Le document {input_document_path} n'a pas pu être lu en tant qu'image")
+    return image
+
+
+def iter_strip_image_arrays_from_document(
+    input_document_path: str,
+    strips: List[Tuple[float, float]],
+    image_width_in_pixels: int
+) -> Iterator[np.ndarray]:
+    r"""Génère, une à une et à la demande, les images BGR des bandes horizontales `strips` de la première page du
+    document `input_document_path`, réduites à la largeur `image_width_in_pixels`. Les bandes d'un document PDF sont
+    rendues directement à cette largeur (`get_pixmap(clip=...)`), sans rendre la page entière en pleine résolution.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document, son extension peut être ".pdf" ou une extension d'image valide.
+    strips : list of tuples of float and float
+        les bandes, en fractions (début, fin) de la hauteur de la page.
+    image_width_in_pixels : int
+        la largeur, en pixels, des images des bandes ; une image plus étroite n'est pas agrandie.
+
+    Yields
+    ------
+    numpy.ndarray
+        l'image BGR de chaque bande, dans l'ordre de `strips`, vide si la bande est vide.
+    """
+    if os.path.splitext(input_document_path)[1].lower() == ".pdf":
+        with fitz.open(input_document_path) as lPdfDocument:
+            lPage = lPdfDocument.load_page(0)
+            lPageRect = lPage.rect
+            # facteur de zoom, depuis les 72 points par pouce du PDF, donnant une bande de largeur image_width_in_pixels
+            lZoom: float = image_width_in_pixels / lPageRect.width
+            for y0_ratio, y1_ratio in strips:
+                lClipRect = fitz.Rect(lPageRect.x0, lPageRect.y0 + y0_ratio * lPageRect.height,
+                                      lPageRect.x1, lPageRect.y0 + y1_ratio * lPageRect.height)
+                if lClipRect.is_empty:
+                    yield np.zeros((0, 0, 3), dtype=np.uint8)
+                    continue
+                lPixelMap = lPage.get_pixmap(matrix=fitz.Matrix(lZoom, lZoom), clip=lClipRect, alpha=False)
+                lRgbImage = np.frombuffer(lPixelMap.samples, dtype=np.uint8).reshape(
+                    lPixelMap.height, lPixelMap.width, lPixelMap.n)
+                yield cv2.cvtColor(lRgbImage, cv2.COLOR_RGB2BGR)
+        return
+    yield from iter_strip_image_arrays_from_image(get_image_array_from_document(input_document_path), strips,
+                                                  image_width_in_pixels)
+
+
+def iter_strip_image_arrays_from_image(
+    image: np.ndarray,
+    strips: List[Tuple[float, float]],
+    image_width_in_pixels: int
+) -> Iterator[np.ndarray]:
+    r"""Génère, une à une et à la demande, les images des bandes horizontales `strips` de l'image `image`, découpées
+    puis réduites à la largeur `image_width_in_pixels` (voir `iter_strip_image_arrays_from_document`)."""
+    image_height, image_width = image.shape[:2]
+    scale: float = min(1., image_width_in_pixels / image_width)
+    for y0_ratio, y1_ratio in strips:
+        strip_image: np.ndarray = image[int(y0_ratio * image_height):int(y1_ratio * image_height)]
+        if scale < 1. and strip_image.shape[0] > 0:
+            strip_image = cv2.resize(strip_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        yield strip_image
+
+
+def get_document_page_count(input_document_path: str) -> int:
+    r"""Retourne le nombre de pages du document `input_document_path`, 1 s'il s'agit d'une image."""
+    if os.path.splitext(input_document_path)[1].lower() != ".pdf":
+        return 1
+    with fitz.open(input_document_path) as lPdfDocument:
+        return lPdfDocument.page_count
+
+
+def _get_page_image_quality_in_dpi(
+    page_index: int,
+    image_quality_in_dpi: int,
+    pages_image_quality_in_dpi: Optional[Dict[int, int]]
+) -> int:
+    if pages_image_quality_in_dpi is not None and page_index in pages_image_quality_in_dpi:
+        return pages_image_quality_in_dpi[page_index]
+    return image_quality_in_dpi
+
+
+def _render_pdf_page(input_document_path: str, page_index: int, image_quality_in_dpi: int) -> np.ndarray:
+    r"""Rend une page d'un document PDF dans un processus de l'ensemble de `iter_document_page_images`, chaque
+    processus ouvrant le document, qui ne peut être transmis d'un processus à l'autre."""
+    with fitz.open(input_document_path) as lPdfDocument:
+        return get_image_array_from_pdf_document(lPdfDocument, image_quality_in_dpi=image_quality_in_dpi,
+                                                 page_index=page_index)
+
+
+def iter_document_page_images(
+    input_document_path: str,
+    image_quality_in_dpi: int = 350,
+    pages_image_quality_in_dpi: Optional[Dict[int, int]] = None,
+    page_indices: Optional[List[int]] = None,
+    render_workers_count: int = 0
+) -> Iterator[Tuple[int, np.ndarray]]:
+    r"""Itère sur les pages du document `input_document_path` (PDF ou image) sous la forme d'images BGR, dans l'ordre
+    des pages. Les pages sont rendues à la demande, si bien qu'une seule page est en mémoire à la fois lorsque chaque
+    page est traitée avant de passer à la suivante, ou par `render_workers_count` processus en parallèle du traitement
+    des pages précédentes, au plus `render_workers_count` pages en avance sur la page courante. Une image est vue comme un document d'une seule page.
+
+    Parameters
+    ----------
+    input_document_path : str
+        le chemin du document, son extension peut être ".pdf" ou une extension d'image valide.
+    image_quality_in_dpi : int, default=350
+        la qualité en dpi des images des pages.
+    pages_image_quality_in_dpi : dict of int to int, optional, default=None
+        la qualité en dpi de certaines pages, par indice de page, remplaçant `image_quality_in_dpi`.
+    page_indices : list of int, optional, default=None
+        les indices des pages à rendre, toutes par défaut.
+    render_workers_count : int, default=0
+        le nombre de processus de rendu, 0 pour rendre chaque page dans le processus courant au moment où elle est
+        demandée.
+
+    Returns
+    -------
+    iterator of tuples of int and numpy.ndarray
+        les couples (indice de la page, image BGR de la page).
+    """
+    if os.path.splitext(input_document_path)[1].lower() != ".pdf":
+        if page_indices is None or 0 in page_indices:
+            yield 0, get_image_array_from_document(input_document_path, image_quality_in_dpi=image_quality_in_dpi)
+        return
+    if page_indices is None:
+        page_indices = list(range(get_document_page_count(input_document_path)))
+    pages_dpi: List[int] = [_get_page_image_quality_in_dpi(page_index, image_quality_in_dpi, pages_image_quality_in_dpi)
+                            for page_index in page_indices]
+    if render_workers_count > 0:
+        with ProcessPoolExecutor(max_workers=render_workers_count) as lProcessPoolExecutor:
+            # rendus soumis en avance, au plus render_workers_count pages au-delà de la page courante, afin de ne pas
+            # garder en mémoire les images de tout le document lorsque le traitement des pages est plus lent que leur
+            # rendu
+            pending_renders: Deque[Tuple[int, Future]] = deque()
+            pages_to_render: Iterator[Tuple[int, int]] = zip(page_indices, pages_dpi)
+            for page_index, page_dpi in itertools.islice(pages_to_render, render_workers_count):
+                pending_renders.append((page_index, lProcessPoolExecutor.submit(
+                    _render_pdf_page, input_document_path, page_index, page_dpi)))
+            while pending_renders:
+                page_index, page_render = pending_renders.popleft()
+                page_image = page_render.result()
+                for next_page_index, next_page_dpi in itertools.islice(pages_to_render, 1):
+                    pending_renders.append((next_page_index, lProcessPoolExecutor.submit(
+                        _render_pdf_page, input_document_path, next_page_index, next_page_dpi)))
+                yield page_index, page_image
+                del page_image
+        return
+    with fitz.open(input_document_path) as lPdfDocument:
+        for page_index, page_dpi in zip(page_indices, pages_dpi):
+            with instrumentation.measure_stage("render", page_index=page_index):
+                page_image = get_image_array_from_pdf_document(lPdfDocument, image_quality_in_dpi=page_dpi,
+                                                               page_index=page_index)
+            yield page_index, page_image
+
+
 def get_and_save_image_from_document(
     input_document_path: str,
     output_image_path: str,
@@ -123,6 +344,8 @@ def get_and_save_image_and_path_from_document(
     r"""Exporte le document (PDF ou image) appelé `input_document_path` en tant qu'image de format `output_image_format`,
     la sauvegarde dans un fichier, et retourne le contenu de l'image ainsi exportée et son chemin.
     S'il s'agit d'un document PDF de plusieurs pages, seule la première page est exportée.
+    Le fichier est écrit dans l'espace de travail de la tâche en cours (voir `workspace.scoped_workspace`), propre à
+    celle-ci, ou à défaut dans le répertoire partagé des fichiers temporaires.
 
     Parameters
     ----------
@@ -149,8 +372,13 @@ def get_and_save_image_and_path_from_document(
         output_image_extension_str = "jpg"
     input_document_with_image_extension_str: str = \
         f"{os.path.splitext(os.path.basename(input_document_path))[0]}.{output_image_extension_str}"
+    # importé ici, le module des espaces de travail important lui-même ce module
+    from . import workspace as jobWorkspace
+    current_workspace: Optional[jobWorkspace.Workspace] = jobWorkspace.get_current_workspace()
+    output_dir_path_str: str = \
+        current_workspace.dir_path_str if current_workspace is not None else TEMPORARY_FILE_DIRECTORY_STR
     # chemin de l'image en sortie
-    output_image_path_str: str = f"{TEMPORARY_FILE_DIRECTORY_STR}/{TEMPORARY_FILE_PREFIX_STR}_{input_document_with_image_extension_str}"
+    output_image_path_str: str = f"{output_dir_path_str}/{TEMPORARY_FILE_PREFIX_STR}_{input_document_with_image_extension_str}"
     logging.debug(f"Nom de l'image en sortie = {output_image_path_str}")
     # image en sortie obtenue après conversion du document en entrée en image
     output_image = get_and_save_image_from_document(
@@ -169,16 +397,33 @@ def get_concat_h(im1, im2):
     return dst
 
 
-def pdf_to_image(input_folder, output_folder):
+def concat_images_horizontally(images_sizes: List[Tuple[int, int]], images: Iterator[Image.Image]) -> Image.Image:
+    r"""Colle côte à côte les images `images`, de tailles (largeur, hauteur) `images_sizes` connues à l'avance, dans une
+    seule image de la hauteur de la première allouée une seule fois, chaque image n'étant copiée qu'une fois, au lieu
+    de recopier toute l'image en construction à chaque ajout comme le fait `get_concat_h`."""
+    dst = Image.new('RGB', (sum(width for width, _ in images_sizes), images_sizes[0][1]))
+    x_offset = 0
+    for image in images:
+        dst.paste(image, (x_offset, 0))
+        x_offset += image.width
+    return dst
+
+
+def pdf_to_image(input_folder, output_folder, image_quality_in_dpi: int = PDF_TO_IMAGE_QUALITY_IN_DPI):
     os.makedirs(output_folder, exist_ok=True)
     for filename in tqdm(os.listdir(input_folder)):
         if filename.lower().endswith(".pdf"):
             # print(f"Processing {filename}")
             pdf_path = os.path.join(input_folder, filename)
-            images = convert_from_path(pdf_path)
-            image = images[0]
-            for next_image in images[1:]:
-                image = get_concat_h(image, next_image)
+            with fitz.open(pdf_path) as lPdfDocument:
+                # tailles des images des pages, calculées sans les rendre comme le fait get_pixmap
+                lZoom: float = image_quality_in_dpi / 72
+                pages_sizes = [((lPage.rect * fitz.Matrix(lZoom, lZoom)).irect.width,
+                                (lPage.rect * fitz.Matrix(lZoom, lZoom)).irect.height) for lPage in lPdfDocument]
+            # les pages sont rendues une à une et collées dès leur rendu
+            pages_images = (Image.fromarray(cv2.cvtColor(page_image, cv2.COLOR_BGR2RGB))
+                            for _, page_image in iter_document_page_images(pdf_path, image_quality_in_dpi))
+            image = concat_images_horizontally(pages_sizes, pages_images)
             output_filename = f"{filename[:-4]}.jpg"
             output_path = os.path.join(output_folder, output_filename)
             image.save(output_path)
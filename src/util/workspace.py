@@ -0,0 +1,77 @@
+# importe des classes du module permettant la compatibilité avec les conseils sur le typage (type hints)
+from typing import Final, Iterator, Optional
+import contextlib
+import contextvars
+import logging
+# importe le module OS pour l'accès aux fonctions de gestion de fichiers et de chemins
+import os
+import shutil
+# importe le module de génération de fichiers et de répertoires temporaires
+import tempfile
+# importe le module de constantes et fonctions utiles
+from .utils import TEMPORARY_FILE_DIRECTORY_STR
+
+
+# --- Constantes ---
+# variable d'environnement indiquant le répertoire où créer les espaces de travail, par exemple un tmpfs tel que /dev/shm
+WORKSPACES_ROOT_DIR_PATH_ENVIRONMENT_VARIABLE_STR: Final[str] = "FORMIABLE_WORKSPACES_ROOT_DIR_PATH"
+
+
+class Workspace:
+    r"""Espace de travail d'une tâche : un répertoire propre à la tâche, où les étapes du pipeline écrivent leurs
+    fichiers intermédiaires sous des noms fixes sans risquer d'écraser ceux d'une autre tâche exécutée en parallèle, dans
+    un autre fil d'exécution ou un autre processus."""
+
+    def __init__(self, dir_path_str: str):
+        self.dir_path_str = dir_path_str
+
+    def get_path(self, file_name_str: str) -> str:
+        r"""Retourne le chemin du fichier `file_name_str` dans l'espace de travail."""
+        return os.path.join(self.dir_path_str, file_name_str)
+
+
+# espace de travail de la tâche en cours dans le contexte courant
+_current_workspace: contextvars.ContextVar = contextvars.ContextVar("current_workspace", default=None)
+
+
+def get_workspaces_root_dir_path() -> str:
+    r"""Retourne le répertoire où sont créés les espaces de travail : celui indiqué par la variable d'environnement
+    FORMIABLE_WORKSPACES_ROOT_DIR_PATH, ou le répertoire des fichiers temporaires par défaut."""
+    return os.environ.get(WORKSPACES_ROOT_DIR_PATH_ENVIRONMENT_VARIABLE_STR) or TEMPORARY_FILE_DIRECTORY_STR
+
+
+@contextlib.contextmanager
+def scoped_workspace(prefix_str: str = "job_", root_dir_path_str: Optional[str] = None) -> Iterator[Workspace]:
+    r"""Crée l'espace de travail d'une tâche, dont le répertoire porte un nom unique, en fait l'espace de travail courant
+    le temps du bloc (voir `get_current_workspace`), puis le supprime avec tout son contenu à la sortie du bloc, que la
+    tâche ait réussi ou échoué. L'espace de travail courant n'est pas transmis aux fils d'exécution lancés dans le bloc,
+    auxquels il faut passer l'espace de travail.
+
+    Parameters
+    ----------
+    prefix_str : str, default="job_"
+        le préfixe du nom du répertoire de l'espace de travail.
+    root_dir_path_str : str, optional
+        le répertoire où créer l'espace de travail, `get_workspaces_root_dir_path()` par défaut.
+
+    Yields
+    ------
+    Workspace
+        l'espace de travail de la tâche.
+    """
+    root_dir_path_str = root_dir_path_str or get_workspaces_root_dir_path()
+    os.makedirs(root_dir_path_str, exist_ok=True)
+    workspace = Workspace(tempfile.mkdtemp(prefix=prefix_str, dir=root_dir_path_str))
+    context_token = _current_workspace.set(workspace)
+    try:
+        yield workspace
+    finally:
+        _current_workspace.reset(context_token)
+        shutil.rmtree(workspace.dir_path_str, ignore_errors=True)
+        logging.debug(f"Espace de travail {workspace.dir_path_str} supprimé")
+
+
+def get_current_workspace() -> Optional[Workspace]:
+    r"""Retourne l'espace de travail de la tâche en cours dans le contexte courant, ou None hors d'un bloc
+    `scoped_workspace`."""
+    return _current_workspace.get()